@@ -0,0 +1,184 @@
+"""Synthetic alinino.az pages and datasets for offline benchmarks
+
+Product and collection pages are rendered from rows of alinino_books.csv
+using the same markup the parsers look for, so the scraper can run end to
+end against the stub server without touching the live site.
+"""
+import argparse
+import csv
+import html
+import json
+import os
+import random
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_CSV = os.path.join(REPO_DIR, 'alinino_books.csv')
+
+PER_PAGE = 40
+
+# Property labels as shown on the product page, mapped to record fields
+PROPERTIES = [
+    ('ISBN', 'isbn'),
+    ('Nəşriyyat', 'publisher'),
+    ('Müəllif', 'author'),
+    ('Səhifə sayı', 'pages'),
+    ('Dil', 'language'),
+    ('Cild', 'cover_type'),
+]
+
+
+def load_rows(path=SOURCE_CSV):
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+
+def make_products(count, rows=None):
+    """`count` products with unique slugs and ids, cycling through the recorded rows"""
+    rows = rows or load_rows()
+    products = []
+    for i in range(count):
+        row = dict(rows[i % len(rows)])
+        slug = row['url'].rstrip('/').rsplit('/', 1)[-1]
+        row['slug'] = slug if i < len(rows) else f"{slug}-{i // len(rows)}"
+        row['product_id'] = str(100000 + i)
+        products.append(row)
+    return products
+
+
+def _e(value):
+    return html.escape(value or '')
+
+
+def render_product(row):
+    """A product page with the markup extract_fields reads"""
+    props = ''.join(
+        f'<div class="properties__item"><div class="properties__item-name">{name}:</div>'
+        f'<div class="properties__item-value">{_e(row[key])}</div></div>'
+        for name, key in PROPERTIES if row.get(key)
+    )
+    labels = ''.join(
+        f'<span class="labels__item" data-label-title="{_e(label.strip())}">{_e(label.strip())}</span>'
+        for label in row['labels'].split(',') if label.strip()
+    )
+    sale = f'<span class="labels__item labels__item_type_sale">{_e(row["discount_percent"])}</span>' \
+        if row['discount_percent'] else ''
+    tags = ''.join(
+        f'<a class="product-tags__item" href="/collection/tag">{_e(tag.strip())}</a>'
+        for tag in row['categories'].split(',') if tag.strip()
+    )
+    paragraphs = ''.join(f'<p>{_e(p)}</p>' for p in row['description'].split('\n') if p.strip())
+    return f'''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{_e(row['title'])} | Alinino</title></head>
+<body>
+<header><nav><a href="/">Alinino</a><a href="/collection/bestsellery">Bestsellerlər</a></nav></header>
+<div class="product">
+<div class="product-gallery__main"><img src="{_e(row['image_url'])}" alt=""></div>
+<form data-main-form data-product-id="{row['product_id']}">
+<h1 class="product__title">{_e(row['title'])}</h1>
+<div class="product__price">{_e(row['current_price'])}</div>
+<div class="product__old-price">{_e(row['old_price'])}</div>
+<div class="labels">{sale}{labels}</div>
+<span data-product-card-available="true">{_e(row['availability'])}</span>
+<span class="rating__stars" data-rating="{_e(row['rating'])}"></span>
+<span class="rating__count">({_e(row['reviews_count'])} rəy)</span>
+</form>
+<div class="properties">{props}</div>
+<div class="text">{paragraphs}</div>
+<div class="product__tags">{tags}</div>
+</div>
+<footer><p>© Alinino</p></footer>
+</body></html>'''
+
+
+def product_json(row):
+    """A product as the platform's storefront JSON has it, with the values render_product shows"""
+    def price(key):
+        return float(row[f'{key}_numeric']) if row[f'{key}_numeric'] else None
+
+    paragraphs = ''.join(f'<p>{_e(p)}</p>' for p in row['description'].split('\n') if p.strip())
+    available = row['availability'] == 'Mövcuddur'
+    return {
+        'id': int(row['product_id']),
+        'title': row['title'],
+        'permalink': row['slug'],
+        'url': f"/product/{row['slug']}",
+        'description': paragraphs,
+        'available': available,
+        'images': [{'original_url': row['image_url']}] if row['image_url'] else [],
+        'variants': [{'id': int(row['product_id']) * 10, 'sku': row['isbn'] or None, 'available': available,
+                      'price': price('current_price'), 'old_price': price('old_price')}],
+        'properties': [{'id': i, 'title': name} for i, (name, _) in enumerate(PROPERTIES, 1)],
+        'characteristics': [
+            {'id': int(row['product_id']) * 10 + i, 'property_id': i, 'title': row[key]}
+            for i, (_, key) in enumerate(PROPERTIES, 1) if row.get(key)
+        ],
+    }
+
+
+def render_products_json(rows):
+    """A bulk products-by-id response"""
+    return json.dumps({'status': 'ok', 'products': [product_json(row) for row in rows]}, ensure_ascii=False)
+
+
+def render_listing(products, page, collection='bestsellery', pagination=True):
+    """One page of a collection listing, with product cards and a pagination widget"""
+    chunk = products[(page - 1) * PER_PAGE:page * PER_PAGE]
+    cards = ''.join(
+        f'<form data-product-id="{row["product_id"]}" class="product-card">'
+        f'<a class="product-card__title" href="/collection/{collection}/product/{row["slug"]}">{_e(row["title"])}</a>'
+        f'<span class="product-card__price">{_e(row["current_price"])}</span>'
+        f'<span class="product-card__availability">{_e(row["availability"])}</span></form>'
+        for row in chunk
+    )
+    last_page = (len(products) + PER_PAGE - 1) // PER_PAGE
+    links = ''.join(
+        f'<a class="pagination__item" href="/collection/{collection}?page={n}">{n}</a>'
+        for n in range(1, last_page + 1)
+    ) if pagination else ''
+    return f'''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{collection}</title></head>
+<body><div class="collection">{cards}</div><div class="pagination">{links}</div></body></html>'''
+
+
+def render_home(collections):
+    links = ''.join(f'<a href="/collection/{name}">{name}</a>' for name in collections)
+    return f'<!DOCTYPE html><html><body><nav class="menu">{links}</nav></body></html>'
+
+
+def write_synthetic_csv(path, count, seed=0):
+    """A dataset of `count` rows resampled from the recorded one, with jittered prices and pages"""
+    rng = random.Random(seed)
+    rows = load_rows()
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        for i in range(count):
+            row = dict(rng.choice(rows))
+            row['url'] = f"{row['url']}-{i}"
+            if row['current_price_numeric']:
+                price = round(float(row['current_price_numeric']) * rng.uniform(0.8, 1.2), 2)
+                row['current_price_numeric'] = f"{price:.2f}"
+                row['current_price'] = f"{price:.2f} AZN"
+            if row['pages_numeric']:
+                row['pages_numeric'] = str(max(1, int(int(row['pages_numeric']) * rng.uniform(0.9, 1.1))))
+            writer.writerow(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write benchmark fixture pages to disk')
+    parser.add_argument('--out', default='bench_fixtures', help='Output directory')
+    parser.add_argument('--products', type=int, default=20, help='Number of product pages')
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    products = make_products(args.products)
+    for row in products:
+        with open(os.path.join(args.out, f"{row['slug']}.html"), 'w', encoding='utf-8') as f:
+            f.write(render_product(row))
+    with open(os.path.join(args.out, 'collection.html'), 'w', encoding='utf-8') as f:
+        f.write(render_listing(products, 1))
+    print(f"Wrote {len(products)} product pages and a collection page to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,475 @@
+"""Offline benchmark scenarios for the scraper and the analysis
+
+Scenarios:
+  crawl    end-to-end scrape_collection against the stub server: pages/sec, books/sec, MB served, peak RSS
+  parse    per-page parse time of product pages for each parser backend
+  analyze  analyze.py runtime and peak RSS on synthetic datasets of several sizes
+  images   images.py against the stub CDN: MB/sec, peak RSS, content dedup, and a re-run that skips everything
+  records  memory held per parsed book as a BookRecord, against the same values in a dict of fresh strings
+  distributed  workqueue.py run with several worker processes: books/sec, and that each book is merged once
+  facets   facets.py on a synthetic dataset: index build and load time, and a top-categories query against
+           the same answer from string splitting in pandas
+  connections  several collections crawled one call after another from a compressing stub, with the shared
+           session against a session per call, no keep-alive, no compression and the httpx backend:
+           connections opened, bytes and client CPU per page
+
+Each run appends one JSON line per scenario to bench/results.jsonl together with
+the commit it ran on, so `--compare` can show the change against the last
+result of the same scenario and parameters from another commit.
+"""
+import argparse
+import contextlib
+import csv
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from bench import fixtures
+
+RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results.jsonl')
+SCENARIOS = ['crawl', 'parse', 'analyze', 'images', 'records', 'distributed', 'facets', 'connections']
+
+
+def _git(*args):
+    try:
+        return subprocess.run(['git', *args], cwd=fixtures.REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _run_measured(cmd, cwd):
+    """Run a command to completion; returns (stdout, wall seconds, peak RSS in MB)"""
+    start = time.perf_counter()
+    with tempfile.TemporaryFile(mode='w+') as out:
+        proc = subprocess.Popen(cmd, cwd=cwd, stdout=out, stderr=subprocess.STDOUT, text=True)
+        # wait4 gives the resource usage of exactly this child
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        elapsed = time.perf_counter() - start
+        out.seek(0)
+        output = out.read()
+    if proc.returncode != 0:
+        raise RuntimeError(f"{' '.join(cmd)} failed with exit code {proc.returncode}:\n{output[-2000:]}")
+    return output, elapsed, usage.ru_maxrss / 1024
+
+
+@contextlib.contextmanager
+def _stub_server(*options):
+    """Run bench.stub_server in a child process; yields its base URL"""
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen([sys.executable, '-m', 'bench.stub_server', '--port', str(port), *options],
+                              cwd=fixtures.REPO_DIR, stdout=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            try:
+                urllib.request.urlopen(f"{base_url}/_stats", timeout=1).read()
+                break
+            except OSError:
+                time.sleep(0.1)
+        else:
+            raise RuntimeError('stub server did not start')
+        yield base_url
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def _served(base_url):
+    return json.loads(urllib.request.urlopen(f"{base_url}/_stats").read())
+
+
+def bench_crawl(args):
+    with _stub_server('--products', str(args.products), '--latency', str(args.latency),
+                      '--jitter', str(args.jitter), '--error-rate', str(args.error_rate)) as base_url:
+        with tempfile.TemporaryDirectory() as tmp:
+            output, elapsed, rss = _run_measured(
+                [sys.executable, '-m', 'bench.crawl', '--base-url', base_url, '--output', os.path.join(tmp, 'out.csv'),
+                 '--concurrency', str(args.concurrency), '--parse-workers', str(args.parse_workers),
+                 '--discover', args.discover, '--extract', args.extract]
+                + (['--parser', args.parser] if args.parser else []),
+                fixtures.REPO_DIR
+            )
+        crawl = json.loads(output.strip().splitlines()[-1])
+        served = _served(base_url)
+
+    return {
+        'books': crawl['books'],
+        'requests': served['requests'],
+        'crawl_seconds': round(crawl['elapsed'], 3),
+        'pages_per_sec': round(served['requests'] / crawl['elapsed'], 1),
+        'served_mb': round(served['bytes'] / 1024 / 1024, 2),
+        'books_per_sec': round(crawl['books'] / crawl['elapsed'], 1),
+        'final_concurrency': crawl['final_concurrency'],
+        'process_seconds': round(elapsed, 3),
+        'peak_rss_mb': round(rss, 1),
+    }
+
+
+def bench_parse(args):
+    from parsers import PARSERS
+
+    pages = [fixtures.render_product(row) for row in fixtures.make_products(args.parse_pages)]
+    metrics = {}
+    for name, cls in PARSERS.items():
+        try:
+            parser = cls()
+        except ImportError:
+            continue
+        timings = []
+        for i, page in enumerate(pages):
+            start = time.perf_counter()
+            parser.parse_book(page, f"https://alinino.az/product/{i}")
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        metrics[name] = {
+            'mean_ms': round(statistics.fmean(timings), 3),
+            'p50_ms': round(timings[len(timings) // 2], 3),
+            'p95_ms': round(timings[int(len(timings) * 0.95)], 3),
+            'pages_per_sec': round(1000 / statistics.fmean(timings), 1),
+        }
+    return metrics
+
+
+def bench_records(args):
+    import gc
+    import tracemalloc
+
+    from parsers import get_parser
+
+    parser = get_parser(args.parser)
+    pages = [fixtures.render_product(row) for row in fixtures.make_products(1389)]
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    records = [parser.parse_book(pages[i % len(pages)], f"https://alinino.az/product/book-{i}")
+               for i in range(args.records)]
+    compact = tracemalloc.get_traced_memory()[0] - baseline
+    # What the crawl held before BookRecord: a dict per book with a string object per value
+    dicts = [{key: value.encode().decode() for key, value in record.items()} for record in records]
+    del records
+    gc.collect()
+    plain = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    del dicts
+    return {
+        'records': args.records,
+        'record_bytes': round(compact / args.records),
+        'dict_bytes': round(plain / args.records),
+        'saved_percent': round((1 - compact / plain) * 100, 1),
+    }
+
+
+def bench_analyze(args):
+    metrics = {}
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            fixtures.write_synthetic_csv(os.path.join(tmp, 'alinino_books.csv'), size)
+            os.makedirs(os.path.join(tmp, 'charts'))
+            # analyze.py reads and writes relative to the working directory
+            _, elapsed, rss = _run_measured([sys.executable, os.path.join(fixtures.REPO_DIR, 'analyze.py')], tmp)
+        metrics[str(size)] = {'seconds': round(elapsed, 3), 'peak_rss_mb': round(rss, 1)}
+    return metrics
+
+
+def bench_images(args):
+    # Products past the number of recorded rows reuse a row's cover under their own URL
+    products = fixtures.make_products(args.products)
+    with _stub_server('--products', str(args.products), '--latency', str(args.latency),
+                      '--jitter', str(args.jitter), '--error-rate', str(args.error_rate),
+                      '--image-kb', str(args.image_kb)) as base_url:
+        with tempfile.TemporaryDirectory() as tmp:
+            export = os.path.join(tmp, 'books.csv')
+            with open(export, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(['url', 'image_url'])
+                for row in products:
+                    slug = row['slug']
+                    writer.writerow([f"{base_url}/product/{slug}", f"{base_url}/images/products/{slug}.jpg"])
+
+            store = os.path.join(tmp, 'images')
+            cmd = [sys.executable, os.path.join(fixtures.REPO_DIR, 'images.py'), export, '--dir', store,
+                   '--workers', str(args.concurrency), '--rate-limit', '0']
+            if args.image_bandwidth:
+                cmd += ['--bandwidth', args.image_bandwidth]
+            _, elapsed, rss = _run_measured(cmd, tmp)
+            served = _served(base_url)
+            _, rerun, _ = _run_measured(cmd, tmp)
+            rerun_requests = _served(base_url)['requests'] - served['requests']
+
+            files = [os.path.join(root, name) for root, _, names in os.walk(store)
+                     for name in names if name.endswith('.jpg')]
+            stored = sum(os.path.getsize(path) for path in files)
+
+    return {
+        'images': len(products),
+        'files': len(files),
+        'stored_mb': round(stored / 1024 / 1024, 2),
+        'downloaded_mb': round(served['bytes'] / 1024 / 1024, 2),
+        'seconds': round(elapsed, 3),
+        'mb_per_sec': round(served['bytes'] / 1024 / 1024 / elapsed, 2),
+        'images_per_sec': round(len(products) / elapsed, 1),
+        'peak_rss_mb': round(rss, 1),
+        'rerun_seconds': round(rerun, 3),
+        'rerun_requests': rerun_requests,
+    }
+
+
+def bench_distributed(args):
+    with _stub_server('--products', str(args.products), '--latency', str(args.latency),
+                      '--jitter', str(args.jitter), '--error-rate', str(args.error_rate)) as base_url:
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'out.csv')
+            _, elapsed, rss = _run_measured(
+                [sys.executable, os.path.join(fixtures.REPO_DIR, 'workqueue.py'), 'run', os.path.join(tmp, 'queue'),
+                 '--workers', str(args.queue_workers), '--base-url', base_url, '--rate-limit', '0',
+                 '--concurrency', str(args.concurrency), '--discover', args.discover,
+                 '--shards', os.path.join(tmp, 'shards'), '--output', output],
+                tmp
+            )
+            with open(output, newline='', encoding='utf-8') as f:
+                urls = [row['url'] for row in csv.DictReader(f)]
+        served = _served(base_url)
+
+    return {
+        'books': len(urls),
+        'unique_books': len(set(urls)),
+        'requests': served['requests'],
+        'seconds': round(elapsed, 3),
+        'books_per_sec': round(len(urls) / elapsed, 1),
+        'peak_rss_mb': round(rss, 1),
+    }
+
+
+def bench_facets(args):
+    import numpy as np
+    import pandas as pd
+
+    from facets import FacetIndex
+
+    language = 'İngilis dili'
+    with tempfile.TemporaryDirectory() as tmp:
+        data = os.path.join(tmp, 'books.csv')
+        fixtures.write_synthetic_csv(data, args.facet_rows)
+        start = time.perf_counter()
+        FacetIndex.from_file(data).save(os.path.join(tmp, 'facets.npz'))
+        build = time.perf_counter() - start
+        index_mb = os.path.getsize(os.path.join(tmp, 'facets.npz')) / 1024 / 1024
+
+        start = time.perf_counter()
+        index = FacetIndex.load(os.path.join(tmp, 'facets.npz'))
+        load = time.perf_counter() - start
+        start = time.perf_counter()
+        top = index.top('categories', 10, by='discount', mask=index.where(language=language), min_books=5)
+        query = time.perf_counter() - start
+        start = time.perf_counter()
+        index.cooccurrence('labels', 'categories', n=10)
+        cooccurrence = time.perf_counter() - start
+
+        # The same question answered from the data by splitting the categories of every row
+        df = pd.read_csv(data, usecols=['language', 'categories', 'discount_numeric'])
+        start = time.perf_counter()
+        rows = df[df['language'] == language]
+        exploded = rows.assign(category=rows['categories'].str.split(',')).explode('category')
+        exploded['category'] = exploded['category'].str.strip()
+        exploded = exploded[exploded['category'] != ''].reset_index().drop_duplicates(['index', 'category'])
+        grouped = exploded.groupby('category').agg(books=('index', 'size'), discount=('discount_numeric', 'mean'))
+        expected = grouped[grouped['books'] >= 5].sort_values('discount', ascending=False, kind='stable').head(10)
+        split = time.perf_counter() - start
+
+    if not np.allclose(top['discount_mean'].to_numpy(), expected['discount'].to_numpy()):
+        raise RuntimeError('facet index and string splitting disagree on the top categories')
+    return {
+        'rows': args.facet_rows,
+        'build_seconds': round(build, 3),
+        'index_mb': round(index_mb, 1),
+        'load_ms': round(load * 1000, 1),
+        'query_ms': round(query * 1000, 1),
+        'cooccurrence_ms': round(cooccurrence * 1000, 1),
+        'string_split_ms': round(split * 1000, 1),
+    }
+
+
+# Crawl options of each connections variant; 'shared' is the scraper's default connection layer
+CONNECTION_VARIANTS = {
+    'shared': [],
+    'session_per_call': ['--session-per-call'],
+    'no_keepalive': ['--keepalive', '0'],
+    'uncompressed': ['--no-compression'],
+    'httpx': ['--http-backend', 'httpx'],
+}
+
+
+def bench_connections(args):
+    import importlib.util
+
+    variants = dict(CONNECTION_VARIANTS)
+    if not (importlib.util.find_spec('httpx') and importlib.util.find_spec('h2')):
+        del variants['httpx']
+    collections = [f"collection-{i}" for i in range(1, args.collection_count + 1)]
+    metrics = {}
+    for variant, options in variants.items():
+        # A fresh stub per variant, so its connection and byte counts are this crawl's alone
+        with _stub_server('--products', str(args.products), '--latency', str(args.latency),
+                          '--jitter', str(args.jitter), '--compress',
+                          *[option for name in collections for option in ('--collection', name)]) as base_url:
+            with tempfile.TemporaryDirectory() as tmp:
+                output, _, _ = _run_measured(
+                    [sys.executable, '-m', 'bench.crawl', '--base-url', base_url,
+                     '--output', os.path.join(tmp, 'out.csv'), '--concurrency', str(args.concurrency),
+                     *[option for name in collections for option in ('--collection', name)], *options],
+                    fixtures.REPO_DIR
+                )
+            crawl = json.loads(output.strip().splitlines()[-1])
+            served = _served(base_url)
+        pages = served['requests']
+        metrics[variant] = {
+            'books': crawl['books'],
+            'pages': pages,
+            'connections': served['connections'],
+            'wire_mb': round(served['bytes'] / 1024 / 1024, 2),
+            'kb_per_page': round(served['bytes'] / 1024 / pages, 2),
+            'cpu_ms_per_page': round(crawl['cpu'] * 1000 / pages, 3),
+            'pages_per_sec': round(pages / crawl['elapsed'], 1),
+        }
+    return metrics
+
+
+def scenario_params(name, args):
+    """The parameters that make results of a scenario comparable"""
+    if name == 'crawl':
+        params = {'products': args.products, 'latency': args.latency, 'jitter': args.jitter,
+                  'error_rate': args.error_rate, 'concurrency': args.concurrency,
+                  'parser': args.parser or 'lxml', 'parse_workers': args.parse_workers}
+        if args.discover != 'listing':
+            params['discover'] = args.discover  # Listing results predate the option
+        if args.extract != 'html':
+            params['extract'] = args.extract
+        return params
+    if name == 'parse':
+        return {'pages': args.parse_pages}
+    if name == 'images':
+        return {'products': args.products, 'latency': args.latency, 'jitter': args.jitter,
+                'error_rate': args.error_rate, 'concurrency': args.concurrency, 'image_kb': args.image_kb,
+                'bandwidth': args.image_bandwidth}
+    if name == 'records':
+        return {'records': args.records, 'parser': args.parser or 'lxml'}
+    if name == 'distributed':
+        return {'products': args.products, 'latency': args.latency, 'jitter': args.jitter,
+                'error_rate': args.error_rate, 'concurrency': args.concurrency, 'workers': args.queue_workers,
+                'discover': args.discover}
+    if name == 'facets':
+        return {'rows': args.facet_rows}
+    if name == 'connections':
+        return {'products': args.products, 'latency': args.latency, 'jitter': args.jitter,
+                'concurrency': args.concurrency, 'collections': args.collection_count}
+    return {'sizes': args.sizes}
+
+
+def load_results(path=RESULTS_FILE):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _flatten(metrics, prefix=''):
+    for key, value in metrics.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}.")
+        else:
+            yield f"{prefix}{key}", value
+
+
+def compare(result, history):
+    """Print each metric next to the last result of the same scenario from another commit"""
+    previous = [
+        r for r in history
+        if r['scenario'] == result['scenario'] and r['params'] == result['params'] and r['commit'] != result['commit']
+    ]
+    if not previous:
+        print(f"  (no earlier result for {result['scenario']} to compare with)")
+        return
+    before = dict(_flatten(previous[-1]['metrics']))
+    print(f"  compared with {previous[-1]['commit'][:10]}:")
+    for key, value in _flatten(result['metrics']):
+        old = before.get(key)
+        if isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+            print(f"    {key:<32} {old:>12} -> {value:<12} ({(value - old) / old * 100:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run offline benchmarks and record the results')
+    parser.add_argument('scenarios', nargs='*', help=f"Scenarios to run: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument('--products', type=int, default=400, help='Products served by the stub for crawl')
+    parser.add_argument('--latency', type=float, default=0.005, help='Stub response latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.002, help='Stub latency jitter in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of stub responses failing with 503')
+    parser.add_argument('--concurrency', type=int, default=5, help='Initial crawl concurrency')
+    parser.add_argument('--parser', choices=['lxml', 'soup'], help='Parser backend for crawl')
+    parser.add_argument('--parse-workers', type=int, default=0, help='Parse pool size for crawl')
+    parser.add_argument('--discover', choices=['listing', 'sitemap'], default='listing',
+                        help='How crawl finds products: listing pages or the sitemap')
+    parser.add_argument('--extract', choices=['html', 'structured'], default='html',
+                        help='How crawl reads books: product pages or the bulk product JSON')
+    parser.add_argument('--parse-pages', type=int, default=200, help='Product pages timed by parse')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000],
+                        help='Dataset sizes for analyze (e.g. add 1000000)')
+    parser.add_argument('--image-kb', type=int, default=256, help='Average stub image size in KB for images')
+    parser.add_argument('--image-bandwidth', help='Bandwidth cap for images, e.g. 4M (default: none)')
+    parser.add_argument('--records', type=int, default=20000, help='Books held in memory by records')
+    parser.add_argument('--queue-workers', type=int, default=4, help='Worker processes for distributed')
+    parser.add_argument('--facet-rows', type=int, default=200000, help='Books in the synthetic dataset for facets')
+    parser.add_argument('--collection-count', type=int, default=3,
+                        help='Collections crawled one after another by connections')
+    parser.add_argument('--results', default=RESULTS_FILE, help='Results file (JSON lines)')
+    parser.add_argument('--no-save', action='store_true', help='Do not record the results')
+    parser.add_argument('--compare', action='store_true', help='Compare with the previous commit\'s results')
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(sorted(unknown))}")
+
+    history = load_results(args.results)
+    commit = _git('rev-parse', 'HEAD')
+    dirty = bool(_git('status', '--porcelain', '--untracked-files=no'))
+    runners = {'crawl': bench_crawl, 'parse': bench_parse, 'analyze': bench_analyze, 'images': bench_images,
+               'records': bench_records, 'distributed': bench_distributed, 'facets': bench_facets,
+               'connections': bench_connections}
+
+    for name in args.scenarios or SCENARIOS:
+        print(f"Running {name}...")
+        result = {
+            'scenario': name,
+            'commit': commit,
+            'dirty': dirty,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'params': scenario_params(name, args),
+            'metrics': runners[name](args),
+        }
+        for key, value in _flatten(result['metrics']):
+            print(f"  {key:<32} {value}")
+        if args.compare:
+            compare(result, history)
+        if not args.no_save:
+            with open(args.results, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(result) + '\n')
+
+
+if __name__ == "__main__":
+    main()
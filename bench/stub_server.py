@@ -0,0 +1,230 @@
+"""Local stand-in for alinino.az serving fixture pages
+
+Serves the home page, paginated collections and product pages rendered by
+bench.fixtures, with configurable latency, jitter and error injection:
+a share of requests fail with 503, and requests beyond a concurrency limit
+are throttled with 429 + Retry-After. Conditional requests get 304.
+
+/sitemap.xml is a sitemap index of /sitemaps/products-<n>.xml files listing
+every product with a <lastmod>, plus the collection pages.
+
+/products_by_id/<id>,<id>,....json serves the same products as the
+platform's bulk storefront JSON, for the structured extraction mode.
+
+With compress=True, pages, JSON and sitemaps are sent gzip- or
+brotli-encoded to clients that accept it. The stats count the bytes as sent
+and the distinct client connections seen.
+
+Product images are served from /images/products/<slug>.jpg as a stand-in
+CDN. Their bytes derive from the recorded image URL, so products cycled from
+the same recorded row share a cover under different URLs, like editions do.
+"""
+import argparse
+import asyncio
+import gzip
+import hashlib
+import random
+
+from aiohttp import web
+
+from bench import fixtures
+
+
+class StubShop:
+    def __init__(self, products=1389, collections=('bestsellery',), latency=0.0, jitter=0.0,
+                 error_rate=0.0, throttle_limit=None, retry_after=1, pagination=True, image_size=64 * 1024,
+                 sitemap_size=500, compress=False, seed=0):
+        self.products = fixtures.make_products(products)
+        self.by_slug = {row['slug']: row for row in self.products}
+        self.by_id = {row['product_id']: row for row in self.products}
+        self.collections = list(collections)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_limit = throttle_limit
+        self.retry_after = retry_after
+        self.pagination = pagination
+        self.image_size = image_size  # Average bytes per image
+        self.sitemap_size = sitemap_size  # Products per sitemap file
+        self.compress = compress  # Encode text responses for clients that accept gzip or br
+        self.random = random.Random(seed)
+        self.in_flight = 0
+        self.stats = {'requests': 0, 'not_modified': 0, 'errors': 0, 'throttled': 0, 'bytes': 0, 'connections': 0}
+        self._pages = {}
+        self._peers = set()  # Client (host, port) of every connection seen
+
+    def app(self):
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_get('/', self.home)
+        app.router.add_get('/collection/{name}', self.collection)
+        app.router.add_get('/collection/{name}/product/{slug}', self.product)
+        app.router.add_get('/product/{slug}', self.product)
+        app.router.add_get(r'/products_by_id/{ids:[\d,]+}.json', self.products_json)
+        app.router.add_get('/images/products/{slug}.jpg', self.image)
+        app.router.add_get('/sitemap.xml', self.sitemap_index)
+        app.router.add_get('/sitemaps/products-{number}.xml', self.sitemap)
+        app.router.add_get('/_stats', self.report)
+        return app
+
+    @web.middleware
+    async def _middleware(self, request, handler):
+        if request.path == '/_stats':
+            return await handler(request)
+
+        self.stats['requests'] += 1
+        peer = request.transport.get_extra_info('peername') if request.transport else None
+        if peer not in self._peers:
+            self._peers.add(peer)
+            self.stats['connections'] = len(self._peers)
+        if self.throttle_limit is not None and self.in_flight >= self.throttle_limit:
+            self.stats['throttled'] += 1
+            return web.Response(status=429, headers={'Retry-After': str(self.retry_after)})
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.stats['errors'] += 1
+            return web.Response(status=503)
+
+        self.in_flight += 1
+        try:
+            delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            return await handler(request)
+        finally:
+            self.in_flight -= 1
+
+    def _text(self, request, data, content_type, headers=None):
+        """A text response, compressed when enabled and the client accepts it"""
+        headers = dict(headers or {})
+        accepted = request.headers.get('Accept-Encoding', '') if self.compress else ''
+        if 'br' in accepted and _brotli():
+            data = _brotli().compress(data, quality=5)
+            headers.update({'Content-Encoding': 'br', 'Vary': 'Accept-Encoding'})
+        elif 'gzip' in accepted:
+            data = gzip.compress(data, compresslevel=6)
+            headers.update({'Content-Encoding': 'gzip', 'Vary': 'Accept-Encoding'})
+        self.stats['bytes'] += len(data)
+        return web.Response(body=data, content_type=content_type, charset='utf-8', headers=headers)
+
+    def _respond(self, request, body):
+        """HTML response with an ETag, or 304 when the client already has this version"""
+        data = body.encode('utf-8')
+        etag = '"%s"' % hashlib.md5(data).hexdigest()
+        if request.headers.get('If-None-Match') == etag:
+            self.stats['not_modified'] += 1
+            return web.Response(status=304, headers={'ETag': etag})
+        return self._text(request, data, 'text/html', {'ETag': etag})
+
+    def _collection_products(self, name):
+        # The first collection lists everything; others list every other product, so they overlap
+        if name == self.collections[0]:
+            return self.products
+        offset = self.collections.index(name) % 2 if name in self.collections else 0
+        return self.products[offset::2]
+
+    async def home(self, request):
+        return self._respond(request, fixtures.render_home(self.collections))
+
+    async def collection(self, request):
+        name = request.match_info['name']
+        page = int(request.query.get('page', 1))
+        key = (name, page)
+        if key not in self._pages:
+            self._pages[key] = fixtures.render_listing(self._collection_products(name), page, name, self.pagination)
+        return self._respond(request, self._pages[key])
+
+    async def product(self, request):
+        row = self.by_slug.get(request.match_info['slug'])
+        if row is None:
+            raise web.HTTPNotFound()
+        image_url = f"http://{request.host}/images/products/{row['slug']}.jpg"
+        return self._respond(request, fixtures.render_product({**row, 'image_url': image_url}))
+
+    async def products_json(self, request):
+        # Unknown ids are left out of the response, as the platform does
+        rows = [self.by_id[i] for i in request.match_info['ids'].split(',') if i in self.by_id]
+        image_base = f"http://{request.host}/images/products"
+        rows = [{**row, 'image_url': f"{image_base}/{row['slug']}.jpg"} for row in rows]
+        return self._text(request, fixtures.render_products_json(rows).encode('utf-8'), 'application/json')
+
+    async def image(self, request):
+        row = self.by_slug.get(request.match_info['slug'])
+        if row is None:
+            raise web.HTTPNotFound()
+        seed = hashlib.sha256(row['image_url'].encode('utf-8')).digest()
+        size = self.image_size // 2 + seed[0] * self.image_size // 256
+        body = b'\xff\xd8\xff\xe0' + (seed * (size // len(seed) + 1))[:size]
+        self.stats['bytes'] += len(body)
+        return web.Response(body=body, content_type='image/jpeg')
+
+    def _xml(self, request, body):
+        return self._text(request, body.encode('utf-8'), 'application/xml')
+
+    async def sitemap_index(self, request):
+        base = f"http://{request.host}"
+        files = range(1, (len(self.products) - 1) // self.sitemap_size + 2)
+        entries = ''.join(f'<sitemap><loc>{base}/sitemaps/products-{n}.xml</loc></sitemap>' for n in files)
+        return self._xml(request, '<?xml version="1.0" encoding="UTF-8"?>'
+                         f'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{entries}</sitemapindex>')
+
+    async def sitemap(self, request):
+        base = f"http://{request.host}"
+        start = (int(request.match_info['number']) - 1) * self.sitemap_size
+        rows = self.products[start:start + self.sitemap_size]
+        if start < 0 or not rows:
+            raise web.HTTPNotFound()
+        entries = [f'<url><loc>{base}/collection/{name}</loc></url>' for name in self.collections] if not start else []
+        for row in rows:
+            # A stable lastmod per product, so a sitemap-driven delta crawl sees nothing changed on a rerun
+            day = int(row['product_id']) % 28 + 1
+            entries.append(f'<url><loc>{base}/product/{row["slug"]}</loc>'
+                           f'<lastmod>2024-03-{day:02d}T12:00:00+04:00</lastmod></url>')
+        return self._xml(request, '<?xml version="1.0" encoding="UTF-8"?>'
+                         '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">' + ''.join(entries) + '</urlset>')
+
+    async def report(self, request):
+        return web.json_response(self.stats)
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+async def start_stub_server(port=0, **options):
+    """Start a stub shop on localhost; returns (runner, base_url, shop)"""
+    shop = StubShop(**options)
+    runner = web.AppRunner(shop.app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', port)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}", shop
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve fixture pages as a local alinino.az stub')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--products', type=int, default=1389)
+    parser.add_argument('--collection', action='append', dest='collections', help='Collection names')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random +/- seconds around --latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests failing with 503')
+    parser.add_argument('--throttle-limit', type=int, help='Concurrent requests above which to answer 429')
+    parser.add_argument('--no-pagination', action='store_true', help='Omit the pagination widget')
+    parser.add_argument('--image-kb', type=int, default=64, help='Average size of served images in KB')
+    parser.add_argument('--compress', action='store_true', help='Send text responses gzip/br-encoded when accepted')
+    args = parser.parse_args()
+
+    shop = StubShop(products=args.products, collections=args.collections or ['bestsellery'],
+                    latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                    throttle_limit=args.throttle_limit, pagination=not args.no_pagination,
+                    image_size=args.image_kb * 1024, compress=args.compress)
+    print(f"Stub shop with {args.products} products on http://127.0.0.1:{args.port}")
+    web.run_app(shop.app(), host='127.0.0.1', port=args.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
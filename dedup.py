@@ -0,0 +1,304 @@
+"""Group editions of the same work (translations, reprints, jubilee editions) under a work_id
+
+Every book gets two MinHash signatures: one over character shingles of its
+title, one over word shingles of its description. Titles and authors are
+loosely transliterated first (Əli -> ali, Qurban -> kurban, Курбан ->
+kurban) and edition notes in brackets are dropped, so "Əli və Nino
+(yubiley buraxılışı)" by Qurban Səid lines up with "Ali and Nino" by
+Kurban Said.
+
+LSH banding puts books with similar signatures in the same bucket, and
+only books sharing a bucket are compared. A pair is joined (with
+union-find) when its estimated similarity is high, the authors match and
+the titles carry the same numbers, so volumes of a series stay apart. A
+book is compared with at most MAX_BUCKET others per band, so the work
+grows linearly with the number of books, not with the number of pairs.
+
+    python dedup.py alinino_books.csv --in-place      # adds a work_id column to the file itself
+    python dedup.py alinino_books.csv --output works.csv --show 10
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import zlib
+
+import numpy as np
+
+from history import product_key
+from search_index import normalize
+from storage import read_records
+
+NUM_PERM = 128
+BANDS = 32  # 32 bands of 4 rows: pairs above ~0.42 similarity usually share a bucket
+TITLE_THRESHOLD = 0.5
+DESCRIPTION_THRESHOLD = 0.7
+AUTHOR_CONTAINMENT = 0.6  # Share of the shorter author name's shingles found in the other
+# Books of one series often share a blurb, so a description match also needs one title to
+# (nearly) contain the other, as with a subtitle added in a later edition
+TITLE_CONTAINMENT = 0.8
+MIN_DESCRIPTION_SHINGLES = 8
+# A book is compared with at most this many others per band; larger buckets (a common title
+# such as "Roman", or empty descriptions padded to the same shingles) are compared by neighbourhood
+MAX_BUCKET = 200
+
+# Spellings that differ between Azerbaijani and English transliterations of the same name,
+# and a plain transliteration of Cyrillic so Russian editions meet the Latin ones
+_CYRILLIC = dict(zip('абвгдеёжзийклмнопрстуфхцчшщъыьэюя', [
+    'a', 'b', 'v', 'g', 'd', 'e', 'e', 'zh', 'z', 'i', 'i', 'k', 'l', 'm', 'n', 'o', 'p', 'r', 's', 't',
+    'u', 'f', 'kh', 'ts', 'ch', 'sh', 'shch', '', 'y', '', 'e', 'yu', 'ya',
+]))
+_LOOSE = str.maketrans({'ə': 'a', 'Ə': 'a', 'q': 'k', 'Q': 'k', **_CYRILLIC,
+                        **{k.upper(): v for k, v in _CYRILLIC.items()}})
+_EDITION_NOTE = re.compile(r'\([^)]*\)|\[[^\]]*\]')
+_STOPWORDS = {'and', 'the', 'of', 'a', 'va', 've', 'ile', 'i'}
+_WORD = re.compile(r'\w+')
+_NUMBER = re.compile(r'\d+')
+
+
+def title_words(text):
+    text = _EDITION_NOTE.sub(' ', text or '')
+    return [w for w in _WORD.findall(normalize(text.translate(_LOOSE))) if w not in _STOPWORDS]
+
+
+def char_shingles(text, k=3):
+    """Character k-grams of the words of a title or author name"""
+    shingles = set()
+    for word in title_words(text):
+        padded = f' {word} '
+        shingles.update(padded[i:i + k] for i in range(max(1, len(padded) - k + 1)))
+    return shingles
+
+
+def description_shingles(record, k=3):
+    """Word k-grams of the description"""
+    words = _WORD.findall(normalize(record.get('description') or ''))
+    return set(map(' '.join, zip(*(words[i:] for i in range(k)))))
+
+
+def _volume(record):
+    """Numbers in the title, notes included ("Book 14"); editions of one work have the same ones"""
+    return frozenset(_NUMBER.findall(record.get('title') or ''))
+
+
+def _containment(a, b):
+    """Share of the smaller shingle set found in the other; 1 if either is empty (nothing to contradict)"""
+    if not a or not b:
+        return 1.0
+    return len(a & b) / min(len(a), len(b))
+
+
+class MinHasher:
+    """MinHash signatures for many shingle sets at once, with numpy
+
+    Shingles are hashed to 32 bits with CRC32; each of the num_perm hash
+    functions is multiply-add-shift, the top 32 bits of (a * x + b) mod 2**64
+    with a random odd a. That is a universal family like (a * x + b) mod p,
+    but uint64 arithmetic wraps around by itself, so there is no division.
+    """
+
+    def __init__(self, num_perm=NUM_PERM, seed=1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.a = (rng.integers(0, 2 ** 64, num_perm, dtype=np.uint64) | np.uint64(1))[:, None]
+        self.b = rng.integers(0, 2 ** 64, num_perm, dtype=np.uint64)[:, None]
+
+    def signatures(self, shingle_sets, chunk=65536):
+        """(len(shingle_sets), num_perm) uint32 signatures; rows of empty sets are all 0xFFFFFFFF"""
+        result = np.full((len(shingle_sets), self.num_perm), 0xFFFFFFFF, dtype=np.uint32)
+        hashes = []
+        owners = []
+        size = 0
+        for i, shingles in enumerate(shingle_sets):
+            if shingles:
+                hashes.extend(zlib.crc32(s.encode('utf-8')) for s in shingles)
+                owners.append((i, len(shingles)))
+                size += len(shingles)
+            if size >= chunk or (i == len(shingle_sets) - 1 and owners):
+                self._fill(result, hashes, owners)
+                hashes, owners, size = [], [], 0
+        return result
+
+    def _fill(self, result, hashes, owners):
+        x = np.asarray(hashes, dtype=np.uint64)[None, :]
+        values = self.a * x
+        values += self.b
+        values >>= np.uint64(32)
+        values = values.astype(np.uint32)
+        starts = np.cumsum([0] + [n for _, n in owners[:-1]])
+        result[[i for i, _ in owners]] = np.minimum.reduceat(values, starts, axis=1).T
+
+
+class UnionFind:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, i):
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, i, j):
+        i, j = self.find(i), self.find(j)
+        if i != j:
+            self.parent[max(i, j)] = min(i, j)
+
+
+def _candidate_groups(signatures, usable, bands):
+    """Per band, the groups of usable rows whose band of the signature hashes to the same key
+
+    The rows of a band are folded into one uint64 key; the rare unrelated
+    rows that collide are weeded out by the similarity check afterwards.
+    """
+    rows = signatures.shape[1] // bands
+    index = np.flatnonzero(usable)
+    for band in range(bands):
+        block = signatures[index, band * rows:(band + 1) * rows].astype(np.uint64)
+        keys = np.zeros(len(index), dtype=np.uint64)
+        for column in block.T:
+            keys = (keys ^ column) * np.uint64(0x9E3779B97F4A7C15)
+        _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        shared = counts[inverse] > 1
+        if not shared.any():
+            continue
+        members = index[shared]
+        groups = inverse[shared]
+        order = np.argsort(groups, kind='stable')
+        members, groups = members[order], groups[order]
+        boundaries = np.flatnonzero(np.diff(groups)) + 1
+        yield from np.split(members, boundaries)
+
+
+def _link(signatures, usable, threshold, compatible, union_find, bands=BANDS, max_bucket=MAX_BUCKET):
+    """Union the pairs of bucket members that are similar enough and compatible
+
+    A bucket may hold editions that only match each other and not its first
+    member, so each member is compared with the ones after it: all of them
+    in a bucket of up to max_bucket books, otherwise the next max_bucket - 1
+    in signature order, where near-identical signatures sit side by side.
+    Pairs already joined through other members are not checked again.
+    """
+    find = union_find.find
+    for group in _candidate_groups(signatures, usable, bands):
+        if len(group) > max_bucket:
+            group = group[np.lexsort(signatures[group].T[::-1])]
+        for k, first in enumerate(group[:-1].tolist()):
+            others = group[k + 1:k + max_bucket]
+            similarity = (signatures[others] == signatures[first]).mean(axis=1)
+            root = find(first)
+            for other, value in zip(others.tolist(), similarity.tolist()):
+                if value >= threshold and find(other) != root and compatible(first, other):
+                    union_find.union(first, other)
+                    root = find(first)
+
+
+def assign_works(records, num_perm=NUM_PERM, bands=BANDS, seed=1):
+    """work_id for every record, in order
+
+    A work_id is a short hash of the smallest product key in its group, so
+    it stays the same across runs as long as that edition is in the data.
+    """
+    records = list(records)
+    hasher = MinHasher(num_perm, seed)
+    titles = [char_shingles(record.get('title')) for record in records]
+    descriptions = [description_shingles(record) for record in records]
+    authors = [char_shingles(record.get('author')) for record in records]
+    volumes = [_volume(record) for record in records]
+
+    def compatible(i, j):
+        return volumes[i] == volumes[j] and _containment(authors[i], authors[j]) >= AUTHOR_CONTAINMENT
+
+    def same_description(i, j):
+        return compatible(i, j) and _containment(titles[i], titles[j]) >= TITLE_CONTAINMENT
+
+    union_find = UnionFind(len(records))
+    _link(hasher.signatures(titles), np.array([bool(s) for s in titles]), TITLE_THRESHOLD,
+          compatible, union_find, bands)
+    _link(hasher.signatures(descriptions), np.array([len(s) >= MIN_DESCRIPTION_SHINGLES for s in descriptions]),
+          DESCRIPTION_THRESHOLD, same_description, union_find, bands)
+
+    keys = [product_key(record) for record in records]
+    smallest = {}
+    for i, key in enumerate(keys):
+        root = union_find.find(i)
+        if root not in smallest or key < smallest[root]:
+            smallest[root] = key
+    return ['w' + hashlib.sha1(smallest[union_find.find(i)].encode('utf-8')).hexdigest()[:12]
+            for i in range(len(records))]
+
+
+def write_work_ids(path, output, work_ids):
+    """Copy path to output with a work_id column (replaced if it exists), streaming row by row"""
+    tmp = f"{output}.tmp"
+    ids = iter(work_ids)
+    if path.endswith('.parquet'):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        source = pq.ParquetFile(path)
+        schema = source.schema_arrow
+        if 'work_id' in schema.names:
+            schema = schema.remove(schema.get_field_index('work_id'))
+        schema = schema.append(pa.field('work_id', pa.string()))
+        with pq.ParquetWriter(tmp, schema, compression='zstd') as writer:
+            for i in range(source.num_row_groups):
+                table = source.read_row_group(i)
+                if 'work_id' in table.column_names:
+                    table = table.drop(['work_id'])
+                column = pa.array([next(ids) for _ in range(table.num_rows)], pa.string())
+                writer.write_table(table.append_column('work_id', column).cast(schema))
+        source.close()
+    else:
+        with open(path, newline='', encoding='utf-8') as src, open(tmp, 'w', newline='', encoding='utf-8') as dst:
+            if path.endswith('.jsonl'):
+                for line in src:
+                    if line.strip():
+                        record = json.loads(line)
+                        record['work_id'] = next(ids)
+                        dst.write(json.dumps(record, ensure_ascii=False) + '\n')
+            else:
+                reader = csv.DictReader(src)
+                fieldnames = list(reader.fieldnames)
+                if 'work_id' not in fieldnames:
+                    fieldnames.append('work_id')
+                writer = csv.DictWriter(dst, fieldnames=fieldnames)
+                writer.writeheader()
+                for row in reader:
+                    row['work_id'] = next(ids)
+                    writer.writerow(row)
+    os.replace(tmp, output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Add a work_id column grouping editions of the same work')
+    parser.add_argument('data_file', help='CSV, JSONL or Parquet file')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--output', help='Where to write the data with work_id')
+    target.add_argument('--in-place', action='store_true', help='Rewrite data_file itself with a work_id column')
+    parser.add_argument('--show', type=int, default=0, help='Print the N largest groups of editions')
+    args = parser.parse_args()
+
+    columns = ['url', 'product_id', 'title', 'author', 'description']
+    records = list(read_records(args.data_file, columns))
+    work_ids = assign_works(records)
+    write_work_ids(args.data_file, args.data_file if args.in_place else args.output, work_ids)
+
+    groups = {}
+    for record, work_id in zip(records, work_ids):
+        groups.setdefault(work_id, []).append(record)
+    print(f"{len(records)} books, {len(groups)} works "
+          f"({len(records) - len(groups)} books are further editions of another one)")
+    largest = sorted(groups.items(), key=lambda item: len(item[1]), reverse=True)[:args.show]
+    for work_id, members in largest:
+        if len(members) > 1:
+            print(f"\n{work_id} ({len(members)} editions)")
+            for record in members:
+                print(f"  {record['title']} — {record['author'] or '?'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,406 @@
+"""Price and discount history of every product across crawls, in SQLite
+
+Each crawl is a snapshot, but a product only gets a new row when its price,
+discount, availability, rating or labels changed since its last row, so
+hourly crawls of a mostly stable catalogue stay small. A record built
+without its product page has no rating, reviews or labels; those keep
+their last recorded values instead of counting as a change. Product details
+(title, ISBN, publisher, ...) live in their own table and are rewritten only
+when they change.
+
+Products are keyed by their product id, or by URL in exports that have no
+ids. A record is matched to a product already in the store by id, then by
+URL, then by ISBN (when only one product has it), so importing an old export
+and then crawling with ids continues the same histories; a product first
+recorded by URL takes its id as key once a crawl supplies it.
+
+    python history.py history.sqlite import alinino_books.csv   # or .jsonl / .parquet
+    python history.py history.sqlite price 9786059824530
+    python history.py history.sqlite discount-changes
+    python history.py history.sqlite publisher-index "Qanun Nəşriyyatı"
+"""
+import argparse
+import hashlib
+import sqlite3
+import time
+
+from records import as_text
+from storage import read_records
+
+# Fields whose changes make a new snapshot row: column -> record field
+SNAPSHOT_FIELDS = {
+    'current_price': 'current_price_numeric',
+    'old_price': 'old_price_numeric',
+    'discount': 'discount_numeric',
+    'availability': 'availability',
+    'rating': 'rating_numeric',
+    'reviews_count': 'reviews_count',
+    'labels': 'labels',
+}
+# Only on the product page: records read from the product JSON (scraper.py --extract structured) leave
+# them empty, and an empty reviews_count, which the page parser always fills, marks such a record
+PAGE_ONLY_COLUMNS = ('rating', 'reviews_count', 'labels')
+_PAGE_ONLY_POSITIONS = [list(SNAPSHOT_FIELDS).index(column) for column in PAGE_ONLY_COLUMNS]
+PRODUCT_FIELDS = ['url', 'title', 'isbn', 'publisher', 'author', 'language', 'cover_type']
+NUMERIC_COLUMNS = {'current_price', 'old_price', 'discount', 'rating', 'reviews_count'}
+
+
+def product_key(record):
+    """Product id when the record has one, else its URL (older exports have no ids)"""
+    return record.get('product_id') or record['url']
+
+
+def _number(value):
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _digest(values):
+    return hashlib.sha1('\x1f'.join('' if v is None else str(v) for v in values).encode('utf-8')).hexdigest()
+
+
+class PriceHistory:
+    """Snapshot store for crawls, usable as a record writer next to the CSV/JSONL output
+
+    begin_crawl() opens a snapshot; write() buffers records and inserts the
+    changed ones with executemany every batch_size records; close() (or
+    end_crawl()) finishes the snapshot.
+    """
+
+    def __init__(self, filename, batch_size=500):
+        self.filename = filename
+        self.batch_size = batch_size
+        self.crawl_id = None
+        self.crawl_time = None
+        self.count = 0  # Records seen in the current crawl
+        self.changed = 0  # Snapshot rows written in the current crawl
+        self._pending = []
+        self._snapshot_hashes = None
+        self._page_values = None  # Product key -> its last recorded PAGE_ONLY_COLUMNS
+        self._product_hashes = None
+        self._urls = None  # url -> product key
+        self._isbns = None  # isbn -> product key, None when several products share it
+
+        self._db = sqlite3.connect(filename)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS crawls (
+                id INTEGER PRIMARY KEY,
+                started_at REAL NOT NULL,
+                finished_at REAL,
+                books INTEGER NOT NULL DEFAULT 0,
+                changed INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS products (
+                product_id TEXT PRIMARY KEY,
+                url TEXT, title TEXT, isbn TEXT, publisher TEXT, author TEXT, language TEXT, cover_type TEXT,
+                details_hash TEXT NOT NULL,
+                first_seen INTEGER NOT NULL,
+                last_seen INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS snapshots (
+                product_id TEXT NOT NULL,
+                crawl_id INTEGER NOT NULL,
+                crawl_time REAL NOT NULL,
+                current_price REAL, old_price REAL, discount REAL, availability TEXT,
+                rating REAL, reviews_count REAL, labels TEXT,
+                hash TEXT NOT NULL,
+                PRIMARY KEY (product_id, crawl_id)
+            );
+            CREATE INDEX IF NOT EXISTS snapshots_product_time ON snapshots (product_id, crawl_time);
+            CREATE INDEX IF NOT EXISTS snapshots_crawl ON snapshots (crawl_id);
+            CREATE INDEX IF NOT EXISTS products_isbn ON products (isbn);
+            CREATE INDEX IF NOT EXISTS products_publisher ON products (publisher);
+        ''')
+        self._db.commit()
+
+    # Recording
+
+    def begin_crawl(self, crawl_time=None):
+        """Start a new snapshot; returns its crawl id"""
+        self.crawl_time = crawl_time or time.time()
+        self.crawl_id = self._db.execute('INSERT INTO crawls (started_at) VALUES (?)', (self.crawl_time,)).lastrowid
+        self._db.commit()
+        self.count = 0
+        self.changed = 0
+
+        # The latest state of every product, to compare incoming records against
+        self._snapshot_hashes = {}
+        self._page_values = {}
+        for key, digest, *page_values in self._db.execute(f'''
+            SELECT product_id, hash, {', '.join(PAGE_ONLY_COLUMNS)} FROM snapshots AS s
+            WHERE crawl_id = (SELECT MAX(crawl_id) FROM snapshots WHERE product_id = s.product_id)
+        '''):
+            self._snapshot_hashes[key] = digest
+            self._page_values[key] = page_values
+        self._product_hashes = dict(self._db.execute('SELECT product_id, details_hash FROM products'))
+        self._urls = {}
+        self._isbns = {}
+        for key, url, isbn in self._db.execute('SELECT product_id, url, isbn FROM products ORDER BY first_seen'):
+            self._remember(key, url, isbn)
+        return self.crawl_id
+
+    def _remember(self, key, url, isbn):
+        if url:
+            self._urls.setdefault(url, key)
+        if isbn:
+            self._isbns[isbn] = key if self._isbns.get(isbn, key) == key else None
+
+    def _match(self, record):
+        """The key of the stored product a record belongs to, or None for a new product"""
+        url, isbn = record.get('url'), record.get('isbn')
+        return self._urls.get(url) or (self._isbns.get(isbn) if isbn else None)
+
+    def _key(self, record, renames):
+        """Product key of a record, adopting the URL-keyed product of an older export when the record has an id"""
+        product_id = record.get('product_id')
+        if product_id and product_id in self._product_hashes:
+            return product_id
+        known = self._match(record)
+        if not product_id:
+            key = known or record['url']
+        elif known is not None and self._urls.get(known) == known:
+            # Keyed by its URL so far: from now on by the id
+            key = product_id
+            renames.append((key, known))
+            for table in (self._snapshot_hashes, self._page_values, self._product_hashes):
+                if known in table:
+                    table[key] = table.pop(known)
+            self._urls[known] = key
+            row = self._db.execute('SELECT isbn FROM products WHERE product_id = ?', (known,)).fetchone()
+            if row and row[0] and self._isbns.get(row[0]) == known:
+                self._isbns[row[0]] = key
+        else:
+            key = product_id
+        self._remember(key, record.get('url'), record.get('isbn'))
+        return key
+
+    def write(self, record):
+        if self.crawl_id is None:
+            self.begin_crawl()
+        self._pending.append(record)
+        self.count += 1
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        snapshots = []
+        details = []
+        seen = []
+        renames = []
+        for record in self._pending:
+            key = self._key(record, renames)
+            values = [
+                _number(record.get(field)) if column in NUMERIC_COLUMNS else (as_text(record.get(field)) or None)
+                for column, field in SNAPSHOT_FIELDS.items()
+            ]
+            if record.get('reviews_count') in (None, '') and key in self._page_values:
+                # Not read from the page: what the page showed last time still holds
+                for position, previous in zip(_PAGE_ONLY_POSITIONS, self._page_values[key]):
+                    if values[position] is None:
+                        values[position] = previous
+            self._page_values[key] = [values[position] for position in _PAGE_ONLY_POSITIONS]
+            digest = _digest(values)
+            if self._snapshot_hashes.get(key) != digest:
+                self._snapshot_hashes[key] = digest
+                snapshots.append((key, self.crawl_id, self.crawl_time, *values, digest))
+
+            product = [record.get(field) or None for field in PRODUCT_FIELDS]
+            details_hash = _digest(product)
+            if self._product_hashes.get(key) != details_hash:
+                self._product_hashes[key] = details_hash
+                details.append((key, *product, details_hash, self.crawl_id, self.crawl_id))
+            else:
+                seen.append((self.crawl_id, key))
+        self._pending = []
+
+        with self._db:
+            self._db.executemany('UPDATE products SET product_id = ? WHERE product_id = ?', renames)
+            self._db.executemany('UPDATE snapshots SET product_id = ? WHERE product_id = ?', renames)
+            self._db.executemany(
+                'INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', snapshots
+            )
+            self._db.executemany(f'''
+                INSERT INTO products VALUES ({', '.join('?' * (len(PRODUCT_FIELDS) + 4))})
+                ON CONFLICT (product_id) DO UPDATE SET
+                    {', '.join(f'{field} = excluded.{field}' for field in PRODUCT_FIELDS)},
+                    details_hash = excluded.details_hash, last_seen = excluded.last_seen
+            ''', details)
+            self._db.executemany('UPDATE products SET last_seen = ? WHERE product_id = ?', seen)
+        self.changed += len(snapshots)
+
+    def sync(self):
+        if self._pending:
+            self._flush()
+
+    def rewrite_column(self, key, column, values):
+        """Collection membership is not part of the history"""
+
+    def end_crawl(self):
+        """Write out buffered records and close the snapshot"""
+        if self.crawl_id is None:
+            return
+        self.sync()
+        with self._db:
+            self._db.execute('UPDATE crawls SET finished_at = ?, books = ?, changed = ? WHERE id = ?',
+                             (time.time(), self.count, self.changed, self.crawl_id))
+        self.crawl_id = None
+
+    def add_snapshot(self, records, crawl_time=None):
+        """Record a whole crawl at once, e.g. an exported CSV; returns (crawl id, rows written)"""
+        crawl_id = self.begin_crawl(crawl_time)
+        for record in records:
+            self.write(record)
+        self.end_crawl()
+        return crawl_id, self.changed
+
+    def close(self):
+        self.end_crawl()
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # Queries
+
+    def _resolve(self, product):
+        """Product key for a product id, URL or ISBN"""
+        row = self._db.execute(
+            'SELECT product_id FROM products WHERE product_id = ? OR url = ? OR isbn = ? LIMIT 1',
+            (product, product, product)
+        ).fetchone()
+        return row[0] if row else product
+
+    def crawls(self):
+        """(id, started_at, finished_at, books, changed) of every crawl"""
+        return self._db.execute('SELECT id, started_at, finished_at, books, changed FROM crawls ORDER BY id').fetchall()
+
+    def price_history(self, product):
+        """Every recorded change of a product (by id, URL or ISBN), oldest first
+
+        Each row is a dict with crawl_id, crawl_time and the snapshot fields;
+        the values hold until the next row.
+        """
+        cursor = self._db.execute(f'''
+            SELECT crawl_id, crawl_time, {', '.join(SNAPSHOT_FIELDS)} FROM snapshots
+            WHERE product_id = ? ORDER BY crawl_time
+        ''', (self._resolve(product),))
+        columns = [c[0] for c in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+    def discount_changes(self, crawl_id=None):
+        """Products whose discount changed in a crawl (default: the latest) compared with their previous row"""
+        if crawl_id is None:
+            crawl_id = self._db.execute('SELECT MAX(crawl_id) FROM snapshots').fetchone()[0]
+        cursor = self._db.execute('''
+            SELECT s.product_id, p.title, p.publisher, prev.discount, s.discount, prev.current_price, s.current_price
+            FROM snapshots AS s
+            JOIN snapshots AS prev ON prev.product_id = s.product_id AND prev.crawl_id = (
+                SELECT MAX(crawl_id) FROM snapshots WHERE product_id = s.product_id AND crawl_id < s.crawl_id
+            )
+            LEFT JOIN products AS p ON p.product_id = s.product_id
+            WHERE s.crawl_id = ? AND s.discount IS NOT prev.discount
+            ORDER BY s.product_id
+        ''', (crawl_id,))
+        columns = ['product_id', 'title', 'publisher', 'old_discount', 'new_discount', 'old_price', 'new_price']
+        return [dict(zip(columns, row)) for row in cursor]
+
+    def publisher_price_index(self, publisher=None):
+        """Price index per publisher and crawl: mean of price / first recorded price, times 100
+
+        Walks the snapshots once in crawl order, carrying every product's last
+        known price forward, so unchanged products (which have no row) still
+        count in every crawl until they were last seen.
+        Returns {publisher: [(crawl_id, crawl_time, index, products)]}.
+        """
+        products = {}
+        query = 'SELECT product_id, publisher, last_seen FROM products'
+        params = ()
+        if publisher is not None:
+            query += ' WHERE publisher = ?'
+            params = (publisher,)
+        for key, pub, last_seen in self._db.execute(query, params):
+            products[key] = (pub, last_seen)
+
+        base = {}
+        current = {}
+        series = {}
+        rows = self._db.execute('''
+            SELECT c.id, c.started_at, s.product_id, s.current_price
+            FROM crawls AS c LEFT JOIN snapshots AS s ON s.crawl_id = c.id
+            ORDER BY c.id
+        ''')
+
+        def emit(crawl_id, crawl_time):
+            ratios = {}
+            for key, price in current.items():
+                pub, last_seen = products[key]
+                if last_seen >= crawl_id and base.get(key):
+                    ratios.setdefault(pub, []).append(price / base[key])
+            for pub, values in ratios.items():
+                series.setdefault(pub, []).append((crawl_id, crawl_time, 100 * sum(values) / len(values), len(values)))
+
+        previous = None
+        for crawl_id, crawl_time, key, price in rows:
+            if previous is not None and crawl_id != previous[0]:
+                emit(*previous)
+            previous = (crawl_id, crawl_time)
+            if key in products and price is not None:
+                base.setdefault(key, price)
+                current[key] = price
+        if previous is not None:
+            emit(*previous)
+        return series
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query or fill the price history store')
+    parser.add_argument('database', help='History SQLite file')
+    commands = parser.add_subparsers(dest='command', required=True)
+    load = commands.add_parser('import', help='Record a CSV, JSONL or Parquet export as one crawl')
+    load.add_argument('data_file')
+    load.add_argument('--time', type=float, help='Crawl time as a Unix timestamp (default: now)')
+    price = commands.add_parser('price', help='Price history of a product (id, URL or ISBN)')
+    price.add_argument('product')
+    changes = commands.add_parser('discount-changes', help='Products whose discount changed in a crawl')
+    changes.add_argument('--crawl', type=int, help='Crawl id (default: latest)')
+    index = commands.add_parser('publisher-index', help='Price index by publisher over time')
+    index.add_argument('publisher', nargs='?')
+    commands.add_parser('crawls', help='List recorded crawls')
+    args = parser.parse_args()
+
+    with PriceHistory(args.database) as history:
+        if args.command == 'import':
+            crawl_id, changed = history.add_snapshot(read_records(args.data_file), args.time)
+            print(f"Crawl {crawl_id}: {changed} changed products recorded")
+        elif args.command == 'price':
+            for row in history.price_history(args.product):
+                when = time.strftime('%Y-%m-%d %H:%M', time.localtime(row['crawl_time']))
+                print(f"{when}  {row['current_price']} AZN (was {row['old_price']}, -{row['discount']}%)  "
+                      f"{row['availability'] or ''}")
+        elif args.command == 'discount-changes':
+            for row in history.discount_changes(args.crawl):
+                print(f"{row['product_id']}  {row['title']}: {row['old_discount']}% -> {row['new_discount']}% "
+                      f"({row['old_price']} -> {row['new_price']} AZN)")
+        elif args.command == 'publisher-index':
+            for publisher, points in history.publisher_price_index(args.publisher).items():
+                print(publisher)
+                for crawl_id, crawl_time, value, count in points:
+                    when = time.strftime('%Y-%m-%d %H:%M', time.localtime(crawl_time))
+                    print(f"  {when}  {value:7.2f}  ({count} products)")
+        else:
+            for crawl_id, started, finished, books, changed in history.crawls():
+                when = time.strftime('%Y-%m-%d %H:%M', time.localtime(started))
+                print(f"{crawl_id}  {when}  {books} books, {changed} changed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import json
+import sqlite3
+import time
+
+
+class CacheEntry:
+    """A cached response: body, validators and the parse result derived from it"""
+
+    __slots__ = ('url', 'body', 'encoding', 'etag', 'last_modified', 'parsed', 'stored_at')
+
+    def __init__(self, url, body, encoding, etag, last_modified, parsed, stored_at):
+        self.url = url
+        self.body = body
+        self.encoding = encoding
+        self.etag = etag
+        self.last_modified = last_modified
+        self.parsed = parsed
+        self.stored_at = stored_at
+
+    def conditional_headers(self):
+        """Validators to send so an unchanged page comes back as 304 Not Modified"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """Persistent HTTP response cache in SQLite, bounded by size with LRU eviction
+
+    Entries are revalidated with conditional requests; with a ttl, entries
+    younger than ttl seconds are used without any request at all. In offline
+    mode only cached responses are served, which allows replaying a crawl.
+    """
+
+    def __init__(self, filename, max_bytes=512 * 1024 * 1024, ttl=None, offline=False):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.offline = offline
+        self.hits = 0  # Served without downloading the body (fresh or 304)
+        self.misses = 0
+
+        self._db = sqlite3.connect(filename)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                encoding TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                parsed TEXT,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        ''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+        self._db.commit()
+        self.total_bytes = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def get(self, url):
+        """Return the cached entry for url, marking it recently used"""
+        row = self._db.execute(
+            'SELECT body, encoding, etag, last_modified, parsed, stored_at FROM responses WHERE url = ?', (url,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        self._db.execute('UPDATE responses SET accessed_at = ? WHERE url = ?', (time.time(), url))
+        body, encoding, etag, last_modified, parsed, stored_at = row
+        return CacheEntry(url, body, encoding, etag, last_modified,
+                          json.loads(parsed) if parsed is not None else None, stored_at)
+
+    def is_fresh(self, entry):
+        """Whether an entry is young enough to use without revalidating"""
+        return self.ttl is not None and time.time() - entry.stored_at < self.ttl
+
+    def put(self, url, body, encoding, etag=None, last_modified=None):
+        """Store a freshly downloaded response, evicting least recently used entries over the cap"""
+        now = time.time()
+        old = self._db.execute('SELECT size FROM responses WHERE url = ?', (url,)).fetchone()
+        self._db.execute(
+            'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, NULL, ?, ?, ?)',
+            (url, body, encoding, etag, last_modified, len(body), now, now)
+        )
+        self.total_bytes += len(body) - (old[0] if old else 0)
+        self._evict()
+        self._db.commit()
+
+    def revalidated(self, url):
+        """Record that the server confirmed the cached entry is still current (304)"""
+        self._db.execute('UPDATE responses SET stored_at = ? WHERE url = ?', (time.time(), url))
+        self._db.commit()
+
+    def set_parsed(self, url, parsed):
+        """Attach the parse result of the cached body so a 304 can skip parsing too"""
+        self._db.execute('UPDATE responses SET parsed = ? WHERE url = ?',
+                         (json.dumps(parsed, ensure_ascii=False, default=dict), url))
+        self._db.commit()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes:
+            rows = self._db.execute(
+                'SELECT url, size FROM responses ORDER BY accessed_at LIMIT 64'
+            ).fetchall()
+            if not rows:
+                break
+            for url, size in rows:
+                if self.total_bytes <= self.max_bytes:
+                    break
+                self._db.execute('DELETE FROM responses WHERE url = ?', (url,))
+                self.total_bytes -= size
+
+    def close(self):
+        self._db.commit()
+        self._db.close()
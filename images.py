@@ -0,0 +1,290 @@
+"""Download product images into a content-addressed store
+
+Images are streamed to disk chunk by chunk while being hashed, then filed
+under their SHA-256 (images/ab/ab12...e9.jpg), so a cover shared by several
+editions is stored once. An index maps every image URL to its file, and URLs
+already in the index are skipped on the next run.
+
+Downloads go through the scraper's session, per-host rate limiter and retry
+policy, optionally under a bandwidth cap. They take slots of their own
+concurrency limiter, not the scraper's: a download holds its slot while the
+body streams in, bandwidth waits included, and would starve page fetches of
+theirs. During a crawl (scraper.py --images DIR) each record's image is
+queued as soon as the record is written, the crawl waiting while the bounded
+queue is full; on its own this module fetches the images of an export:
+
+    python images.py alinino_books.csv --dir images --bandwidth 2M
+"""
+import argparse
+import asyncio
+import hashlib
+import mimetypes
+import os
+import sqlite3
+import tempfile
+import time
+
+import aiohttp
+
+from storage import read_records
+from throttle import RETRY_STATUSES, AdaptiveLimiter, ByteRateLimiter, parse_retry_after
+
+CHUNK_SIZE = 64 * 1024
+_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+class ImageFetchError(Exception):
+    """An image could not be downloaded (error status, or retries exhausted)"""
+
+
+def parse_size(text):
+    """Bytes from '500000', '512K', '2M' or '1.5G'"""
+    text = text.strip().upper().removesuffix('B')
+    unit = text[-1:] if text[-1:] in _UNITS else ''
+    return int(float(text[:len(text) - len(unit)]) * _UNITS[unit])
+
+
+class ImageStore:
+    """Image files named by the SHA-256 of their content, with a url -> file index in SQLite"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, 'index.sqlite'))
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS images (
+                url TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                content_type TEXT,
+                fetched_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS images_sha256 ON images (sha256);
+        ''')
+        self._db.commit()
+
+    def lookup(self, url):
+        """Path (relative to the store) of an already downloaded image, or None"""
+        row = self._db.execute('SELECT path FROM images WHERE url = ?', (url,)).fetchone()
+        if row and os.path.exists(os.path.join(self.directory, row[0])):
+            return row[0]
+        return None
+
+    def temp_file(self):
+        """A file to stream a download into, on the same filesystem as the store"""
+        fd, path = tempfile.mkstemp(suffix='.part', dir=self.directory)
+        return os.fdopen(fd, 'wb'), path
+
+    def add(self, url, tmp_path, digest, size, content_type):
+        """File a finished download under its hash; returns (path, whether the content was new)"""
+        extension = mimetypes.guess_extension((content_type or '').split(';')[0].strip()) or ''
+        path = os.path.join(digest[:2], digest + extension)
+        full_path = os.path.join(self.directory, path)
+        new = not os.path.exists(full_path)
+        if new:
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            os.replace(tmp_path, full_path)
+        else:
+            os.remove(tmp_path)
+        with self._db:
+            self._db.execute('INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?)',
+                             (url, digest, path, size, content_type, time.time()))
+        return path, new
+
+    def close(self):
+        self._db.close()
+
+
+class ImageFetcher:
+    """Concurrent image downloads into an ImageStore, sharing a scraper's rate limiter and retry policy
+
+    start() spawns the download workers on a session, submit() queues an
+    image URL, waiting while queue_size of them are already queued, and
+    join() waits for the queue to drain. A URL already queued or downloading
+    is not queued again; one downloaded before is skipped through the store.
+    Downloads take no page slot, so a scraper crawling pages alongside
+    should be built with image_workers=workers: its sessions then keep a
+    connection per worker, and downloads never wait on page fetches.
+    """
+
+    def __init__(self, scraper, store, bandwidth=None, workers=8, chunk_size=CHUNK_SIZE, queue_size=None):
+        self.scraper = scraper
+        self.store = store
+        self.bandwidth = ByteRateLimiter(bandwidth) if bandwidth else None  # Bytes per second, all downloads
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.queue_size = queue_size or workers * 4  # Bound on image URLs waiting for a worker
+        # AIMD up to one download per worker, backing off on throttling and errors
+        self.limiter = AdaptiveLimiter(initial=workers, max_limit=workers)
+        self.downloaded = 0  # Images downloaded whose content was new
+        self.duplicates = 0  # Images downloaded whose content was already stored under another URL
+        self.skipped = 0  # Images already in the index
+        self.failed = 0
+        self.bytes = 0
+        self._queue = None
+        self._tasks = []
+        self._pending = set()  # URLs queued or downloading
+
+    def start(self, session):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker(session)) for _ in range(self.workers)]
+
+    async def submit(self, url):
+        if url and url not in self._pending:
+            self._pending.add(url)
+            await self._queue.put(url)
+
+    async def join(self):
+        for _ in self._tasks:
+            await self._queue.put(None)
+        await asyncio.gather(*self._tasks)
+        self._tasks = []
+
+    async def cancel(self):
+        """Stop the download workers, abandoning queued images (the crawl itself failed)"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self, session):
+        while True:
+            url = await self._queue.get()
+            if url is None:
+                return
+            try:
+                await self.fetch(session, url)
+            except (ImageFetchError, OSError) as e:
+                self.failed += 1
+                self.scraper.metrics.inc('images_total', result='failed')
+                self.scraper.log.warning('image_failed', f"Error downloading image {url}: {e}", url=url, error=str(e))
+            finally:
+                self._pending.discard(url)
+
+    async def fetch(self, session, url):
+        """Download one image unless it is already stored; returns its path in the store"""
+        metrics = self.scraper.metrics
+        path = self.store.lookup(url)
+        if path:
+            self.skipped += 1
+            metrics.inc('images_total', result='skipped')
+            return path
+
+        retry = self.scraper.retry
+        for attempt in range(retry.max_retries + 1):
+            retry_after = None
+            try:
+                status, result = await self._download(session, url)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                reason = str(e) or type(e).__name__
+            else:
+                if status == 200:
+                    path, new = self.store.add(url, *result)
+                    if new:
+                        self.downloaded += 1
+                    else:
+                        self.duplicates += 1
+                    metrics.inc('images_total', result='downloaded' if new else 'duplicate')
+                    return path
+                if status not in RETRY_STATUSES:
+                    raise ImageFetchError(f"HTTP {status}")
+                reason = f"HTTP {status}"
+                retry_after = parse_retry_after(result)
+                if retry_after:
+                    self.scraper.rate_limiter.pause(url, retry_after)
+            if attempt == retry.max_retries:
+                raise ImageFetchError(f"{reason}, giving up after {attempt + 1} attempts")
+            await asyncio.sleep(retry.delay(attempt, retry_after))
+
+    async def _download(self, session, url):
+        """One rate-limited GET streamed to a temporary file
+
+        Returns (200, (tmp_path, sha256, size, content_type)) or, for any
+        other status, (status, Retry-After header).
+        """
+        scraper = self.scraper
+        metrics = scraper.metrics
+        await scraper.rate_limiter.acquire(url)
+        async with self.limiter:
+            started = time.perf_counter()
+            # No total timeout: a large image under a bandwidth cap may legitimately take a while
+            timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=30)
+            try:
+                async with session.get(url, headers=scraper.headers, timeout=timeout) as response:
+                    # Time to the response headers: the body's duration depends on its size and the bandwidth cap
+                    latency = time.perf_counter() - started
+                    if response.status != 200:
+                        self.limiter.on_response(response.status, latency)
+                        return response.status, response.headers.get('Retry-After')
+                    digest = hashlib.sha256()
+                    size = 0
+                    f, tmp_path = self.store.temp_file()
+                    try:
+                        with f:
+                            async for chunk in response.content.iter_chunked(self.chunk_size):
+                                digest.update(chunk)
+                                f.write(chunk)
+                                size += len(chunk)
+                                if self.bandwidth:
+                                    await self.bandwidth.consume(len(chunk))
+                    except BaseException:
+                        os.remove(tmp_path)
+                        raise
+                    content_type = response.headers.get('Content-Type')
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.limiter.on_error()
+                metrics.inc('request_errors_total', error=type(e).__name__)
+                raise
+            elapsed = time.perf_counter() - started
+            self.limiter.on_response(200, latency)
+            metrics.observe('image_seconds', elapsed)
+            metrics.inc('image_bytes_total', size)
+            self.bytes += size
+        return 200, (tmp_path, digest.hexdigest(), size, content_type)
+
+    def summary(self):
+        return (f"Images: {self.downloaded} downloaded, {self.duplicates} duplicates of stored images, "
+                f"{self.skipped} already present, {self.failed} failed ({self.bytes / 1024 / 1024:.1f} MB)")
+
+
+async def fetch_images(scraper, store, urls, bandwidth=None, workers=8):
+    """Download every image URL into the store through the scraper's limiters; returns the fetcher"""
+    fetcher = ImageFetcher(scraper, store, bandwidth=bandwidth, workers=workers)
+    async with scraper.session() as session:
+        fetcher.start(session)
+        for url in urls:
+            await fetcher.submit(url)
+        await fetcher.join()
+    return fetcher
+
+
+def main():
+    from scraper import AlininoScraper
+
+    parser = argparse.ArgumentParser(description='Download the product images of an export')
+    parser.add_argument('data_file', help='CSV, JSONL or Parquet file with an image_url column')
+    parser.add_argument('--dir', default='images', help='Image store directory')
+    parser.add_argument('--bandwidth', type=parse_size, help='Download cap in bytes per second (e.g. 512K, 2M)')
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent downloads')
+    parser.add_argument('--rate-limit', type=float, default=10.0,
+                        help='Max requests per second per host (0 for no cap)')
+    args = parser.parse_args()
+
+    scraper = AlininoScraper(max_concurrent=args.workers, max_concurrent_limit=args.workers,
+                             rate_limit=args.rate_limit, image_workers=args.workers)
+    urls = [record['image_url'] for record in read_records(args.data_file, ['image_url']) if record['image_url']]
+    store = ImageStore(args.dir)
+    try:
+        started = time.perf_counter()
+        fetcher = asyncio.run(fetch_images(scraper, store, urls, bandwidth=args.bandwidth, workers=args.workers))
+    finally:
+        store.close()
+    print(fetcher.summary())
+    print(f"Done in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+import asyncio
+import bisect
+import json
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+# Upper bounds in seconds; network phases and parsing live on very different scales
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+PARSE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+PREFIX = 'alinino_'
+
+
+class Histogram:
+    """Fixed-bucket histogram, cumulative on export as Prometheus expects"""
+
+    __slots__ = ('bounds', 'counts', 'count', 'sum')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # The last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Estimate a quantile by linear interpolation inside its bucket"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                low = self.bounds[i - 1] if i else 0.0
+                high = self.bounds[i] if i < len(self.bounds) else self.bounds[-1]
+                return low + (high - low) * (rank - seen) / n
+            seen += n
+        return self.bounds[-1]
+
+
+class Metrics:
+    """Counters, gauges and histograms of one crawl, keyed by name and labels
+
+    Recording is a dict lookup and an increment, cheap enough for the hot
+    path. Export with prometheus_text() or snapshot().
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.started = time.time()
+
+    @staticmethod
+    def _key(name, labels):
+        return (name, tuple(sorted(labels.items()))) if labels else (name, ())
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = self._key(name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    def trace_config(self):
+        """aiohttp tracing that splits every request into DNS, connect, TTFB and body phases
+
+        Pass a dict as trace_request_ctx to session.get(); the phase timestamps
+        are left in it so the caller can time the body read itself.
+        """
+        def timing(ctx):
+            return ctx.trace_request_ctx if ctx.trace_request_ctx is not None else {}
+
+        async def on_request_start(session, ctx, params):
+            timing(ctx)['start'] = time.perf_counter()
+
+        async def on_dns_start(session, ctx, params):
+            timing(ctx)['dns'] = time.perf_counter()
+
+        async def on_dns_end(session, ctx, params):
+            t = timing(ctx)
+            if 'dns' in t:
+                self.observe('request_phase_seconds', time.perf_counter() - t['dns'], phase='dns')
+
+        async def on_dns_cache_hit(session, ctx, params):
+            self.inc('dns_cache_hits_total')
+
+        async def on_connection_start(session, ctx, params):
+            timing(ctx)['connect'] = time.perf_counter()
+
+        async def on_connection_end(session, ctx, params):
+            t = timing(ctx)
+            if 'connect' in t:
+                self.observe('request_phase_seconds', time.perf_counter() - t['connect'], phase='connect')
+            self.inc('connections_opened_total')
+
+        async def on_connection_reuse(session, ctx, params):
+            self.inc('connections_reused_total')
+
+        async def on_request_end(session, ctx, params):
+            t = timing(ctx)
+            t['headers'] = time.perf_counter()
+            if 'start' in t:
+                self.observe('request_phase_seconds', t['headers'] - t['start'], phase='ttfb')
+
+        config = aiohttp.TraceConfig()
+        config.on_request_start.append(on_request_start)
+        config.on_dns_resolvehost_start.append(on_dns_start)
+        config.on_dns_resolvehost_end.append(on_dns_end)
+        config.on_dns_cache_hit.append(on_dns_cache_hit)
+        config.on_connection_create_start.append(on_connection_start)
+        config.on_connection_create_end.append(on_connection_end)
+        config.on_connection_reuseconn.append(on_connection_reuse)
+        config.on_request_end.append(on_request_end)
+        return config
+
+    def prometheus_text(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        typed = set()
+
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+        def fmt(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ''
+            return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+        for (name, labels), value in sorted(self.counters.items()):
+            declare(name, 'counter')
+            lines.append(f"{PREFIX}{name}{fmt(labels)} {value}")
+        for (name, labels), value in sorted(self.gauges.items()):
+            declare(name, 'gauge')
+            lines.append(f"{PREFIX}{name}{fmt(labels)} {value}")
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            declare(name, 'histogram')
+            cumulative = 0
+            for bound, n in zip(list(histogram.bounds) + ['+Inf'], histogram.counts):
+                cumulative += n
+                lines.append(f"{PREFIX}{name}_bucket{fmt(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{fmt(labels)} {histogram.sum}")
+            lines.append(f"{PREFIX}{name}_count{fmt(labels)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """A JSON-serializable summary: counters, gauges and histogram count/sum/p50/p95/p99"""
+        def name_of(name, labels):
+            return name + ''.join(f"[{k}={v}]" for k, v in labels)
+
+        histograms = {}
+        for (name, labels), h in sorted(self.histograms.items()):
+            histograms[name_of(name, labels)] = {
+                'count': h.count, 'sum': round(h.sum, 6),
+                'p50': h.quantile(0.5), 'p95': h.quantile(0.95), 'p99': h.quantile(0.99),
+            }
+        return {
+            'timestamp': time.time(),
+            'uptime': round(time.time() - self.started, 3),
+            'counters': {name_of(n, l): v for (n, l), v in sorted(self.counters.items())},
+            'gauges': {name_of(n, l): v for (n, l), v in sorted(self.gauges.items())},
+            'histograms': histograms,
+        }
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsExporter:
+    """Serve metrics at /metrics for Prometheus and/or append JSON snapshots to a file periodically"""
+
+    def __init__(self, metrics, port=None, json_path=None, interval=10.0, host='127.0.0.1'):
+        self.metrics = metrics
+        self.port = port
+        self.json_path = json_path
+        self.interval = interval
+        self.host = host
+        self._runner = None
+        self._task = None
+
+    async def start(self):
+        if self.port is not None:
+            app = web.Application()
+            app.router.add_get('/metrics', self._serve)
+            self._runner = web.AppRunner(app, access_log=None)
+            await self._runner.setup()
+            await web.TCPSite(self._runner, self.host, self.port).start()
+        if self.json_path:
+            self._task = asyncio.create_task(self._snapshot_loop())
+
+    async def _serve(self, request):
+        return web.Response(text=self.metrics.prometheus_text(), content_type='text/plain', charset='utf-8')
+
+    def write_snapshot(self):
+        with open(self.json_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(self.metrics.snapshot()) + '\n')
+
+    async def _snapshot_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.write_snapshot()
+
+    async def stop(self):
+        """Stop exporting; a final snapshot records the finished crawl"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            self.write_snapshot()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+class CrawlLog:
+    """Crawl progress messages, as plain text lines or as one JSON object per line
+
+    Every message has an event name and optional fields; text mode prints
+    just the message, json mode prints event, level, message and fields so
+    logs can be filtered and aggregated.
+    """
+
+    def __init__(self, fmt='text', stream=None):
+        self.format = fmt
+        self.stream = stream
+
+    def _emit(self, level, event, message, fields):
+        stream = self.stream or sys.stdout
+        if self.format == 'json':
+            record = {'ts': round(time.time(), 3), 'level': level, 'event': event, 'msg': message.strip()}
+            record.update(fields)
+            stream.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+        else:
+            stream.write(message + '\n')
+
+    def info(self, event, message, **fields):
+        self._emit('info', event, message, fields)
+
+    def warning(self, event, message, **fields):
+        self._emit('warning', event, message, fields)
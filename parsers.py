@@ -0,0 +1,509 @@
+import hashlib
+import re
+import sys
+import threading
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+from records import FIELD_TYPES, FIELDNAMES, BookRecord
+
+PRICE_RE = re.compile(r'([\d.,]+)')
+NUMBER_RE = re.compile(r'(\d+)')
+PAGE_PARAM_RE = re.compile(r'[?&]page=(\d+)')
+IMAGE_URL_RE = re.compile(r'(https://[^\s]+)')
+
+
+def canonical_url(url):
+    """Normalize a shop URL so the same page always gets the same key
+
+    Lowercases scheme and host, drops query, fragment and trailing slash, and
+    maps collection-scoped product links (/collection/x/product/y) to /product/y.
+    """
+    parts = urlsplit(url)
+    path = parts.path.rstrip('/') or '/'
+    if '/product/' in path:
+        path = path[path.index('/product/'):]
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, '', ''))
+
+
+def collection_name(url):
+    """The collection slug of a collection URL, e.g. 'bestsellery'"""
+    return urlsplit(url).path.rstrip('/').rsplit('/', 1)[-1]
+
+
+def set_property(data, name, value):
+    """Store a product property (ISBN, Publisher, Author, etc.) in the record field its name maps to"""
+    name_text = name.strip().replace(':', '').lower()
+    # Line breaks as an HTML parser reads them from a page, whatever the source (the product JSON keeps \r\n)
+    value_text = value.replace('\r\n', '\n').replace('\r', '\n').strip()
+
+    if 'isbn' in name_text or 'artikul' in name_text:
+        data['isbn'] = value_text
+    elif 'nəşriyyat' in name_text or 'publisher' in name_text:
+        data['publisher'] = value_text
+    elif 'müəllif' in name_text or 'author' in name_text:
+        data['author'] = value_text
+    elif 'səhifə' in name_text or 'pages' in name_text:
+        data['pages'] = value_text
+        # Extract numeric value
+        pages_num = NUMBER_RE.search(value_text)
+        if pages_num:
+            data['pages_numeric'] = pages_num.group(1)
+    elif 'dil' in name_text or 'language' in name_text:
+        data['language'] = value_text
+    elif 'cild' in name_text or 'cover' in name_text:
+        data['cover_type'] = value_text
+
+
+class BookParser:
+    """Turns product and collection pages into records
+
+    Backends only locate raw values in the document (see extract_fields);
+    cleaning them into the output schema is shared, so every backend
+    produces identical records for the same page.
+    """
+
+    name = None
+
+    def load(self, content, encoding='utf-8'):
+        """Raw page bytes in the form the extract methods take: decoded text, by default"""
+        return content.decode(encoding, errors='replace')
+
+    def extract_fields(self, content):
+        """Return the raw values found on a product page
+
+        Keys: product_id, title, current_price, old_price, discount, properties
+        (list of (name, value) pairs), description, rating, reviews,
+        availability, labels (candidate label titles, sale badge excluded),
+        categories, gallery_image and picture_srcsets. Missing values are None.
+        """
+        raise NotImplementedError
+
+    def extract_links(self, content):
+        """Return every link href on a page"""
+        raise NotImplementedError
+
+    def parse_collection_links(self, content, base_url):
+        """Extract the distinct collection URLs linked from a page, e.g. the site navigation"""
+        collections = []
+        for href in self.extract_links(content):
+            url = canonical_url(urljoin(base_url, href))
+            if '/collection/' in url and '/product/' not in url and url not in collections:
+                collections.append(url)
+        return collections
+
+    def extract_listing(self, content):
+        """Return the raw product cards and pagination links of a collection page
+
+        Cards are (product id, href, card text) tuples; pagination links are
+        the hrefs found inside the pagination widget.
+        """
+        raise NotImplementedError
+
+    def parse_listing(self, content, base_url):
+        """Extract the product cards and the last page number from a collection page
+
+        Each card is a dict with the absolute product url, the product id and a
+        fingerprint of what the card shows (link, title, price, availability,
+        labels), which changes whenever the listing shows a change to the product.
+        last_page is the highest page linked from the pagination widget, or None
+        when the page has no pagination links.
+        """
+        raw_cards, pagination_links = self.extract_listing(content)
+
+        pages = [int(m.group(1)) for m in map(PAGE_PARAM_RE.search, pagination_links) if m]
+        last_page = max(pages) if pages else None
+
+        cards = []
+        for product_id, href, text in raw_cards:
+            if not href:
+                continue
+            url = urljoin(base_url, href)
+            shown = ' '.join([product_id, url] + text.split())
+            cards.append({
+                'url': url,
+                'product_id': product_id,
+                'fingerprint': hashlib.sha1(shown.encode('utf-8')).hexdigest(),
+            })
+        return {'cards': cards, 'last_page': last_page}
+
+    def parse_book(self, content, url):
+        """Extract detailed data from a book page as a BookRecord"""
+        fields = self.extract_fields(content)
+        data = BookRecord()
+        data['url'] = url
+        data['product_id'] = fields['product_id'] or ''
+
+        # Title
+        if fields['title'] is not None:
+            data['title'] = fields['title'].strip()
+
+        # Prices
+        for key in ('current_price', 'old_price'):
+            if fields[key] is not None:
+                price_text = fields[key].strip()
+                data[key] = price_text
+                # Extract numeric value
+                price_num = PRICE_RE.search(price_text.replace(' ', ''))
+                if price_num:
+                    data[f'{key}_numeric'] = price_num.group(1).replace(',', '.')
+
+        # Discount
+        if fields['discount'] is not None:
+            discount_text = fields['discount'].strip()
+            data['discount_percent'] = discount_text
+            # Extract numeric value
+            discount_num = NUMBER_RE.search(discount_text)
+            if discount_num:
+                data['discount_numeric'] = discount_num.group(1)
+
+        # Properties (ISBN, Publisher, Author, etc.)
+        for name, value in fields['properties']:
+            set_property(data, name, value)
+
+        # Description
+        if fields['description'] is not None:
+            data['description'] = ' '.join(p.strip() for p in fields['description'])
+
+        # Rating
+        if fields['rating']:
+            data['rating'] = fields['rating']
+            data['rating_numeric'] = fields['rating']  # Already numeric
+
+        # Reviews count - just the number, 0 when missing
+        number = NUMBER_RE.search(fields['reviews'].strip()) if fields['reviews'] is not None else None
+        data['reviews_count'] = number.group() if number else '0'
+
+        # Availability
+        if fields['availability'] is not None:
+            data['availability'] = fields['availability'].strip()
+
+        # Labels (Bestseller, Express, etc.) without duplicates
+        label_texts = []
+        seen_labels = set()
+        for label_title in fields['labels']:
+            if label_title and label_title.strip() and label_title not in seen_labels:
+                label_texts.append(label_title.strip())
+                seen_labels.add(label_title)
+        data['labels'] = label_texts
+
+        # Categories/Tags without duplicates (the page lists some tags more than once)
+        if fields['categories'] is not None:
+            data['categories'] = list(dict.fromkeys(tag.strip() for tag in fields['categories']))
+
+        # Main image - the gallery image unless it is a placeholder
+        img_url = fields['gallery_image']
+        if img_url and 'products' in img_url:
+            data['image_url'] = img_url
+
+        # Otherwise the first picture element with a product image
+        if not data['image_url']:
+            for srcset in fields['picture_srcsets']:
+                if 'products' in srcset:
+                    # Extract first URL from srcset
+                    url_match = IMAGE_URL_RE.search(srcset)
+                    if url_match:
+                        data['image_url'] = url_match.group(1).split()[0]
+                        break
+
+        return data
+
+
+class SoupBookParser(BookParser):
+    """BeautifulSoup backend, kept as the reference implementation and fallback"""
+
+    name = 'soup'
+
+    def __init__(self, features='html.parser'):
+        from bs4 import BeautifulSoup
+        self._soup = BeautifulSoup
+        self.features = features
+
+    def extract_listing(self, content):
+        soup = self._soup(content, self.features)
+        cards = []
+        # Find all product cards and the link to each product page
+        for card in soup.find_all('form', {'data-product-id': True}):
+            link = card.find('a', class_='product-card__title')
+            if link:
+                cards.append((card['data-product-id'], link.get('href'), card.get_text(' ')))
+
+        pagination_links = [a['href'] for a in soup.select('[class*="pagination"] a[href]')]
+        return cards, pagination_links
+
+    def extract_links(self, content):
+        return [a['href'] for a in self._soup(content, self.features).find_all('a', href=True)]
+
+    def extract_fields(self, content):
+        soup = self._soup(content, self.features)
+
+        def text(tag):
+            return tag.text if tag else None
+
+        properties = []
+        for prop in soup.find_all('div', class_='properties__item'):
+            name = prop.find('div', class_='properties__item-name')
+            value = prop.find('div', class_='properties__item-value')
+            if name and value:
+                properties.append((name.text, value.text))
+
+        description = None
+        description_div = soup.find('div', class_='text')
+        if description_div:
+            description = [p.text for p in description_div.find_all('p')]
+
+        rating_span = soup.find('span', class_='rating__stars')
+
+        # Labels only from the product form, skipping the discount badge
+        labels = []
+        product_form = soup.find('form', {'data-main-form': True}) or soup.find('div', class_='product__form')
+        labels_div = product_form.find('div', class_='labels') if product_form else None
+        if labels_div:
+            for label in labels_div.find_all('span', class_='labels__item'):
+                if 'labels__item_type_sale' not in label.get('class', []):
+                    labels.append(label.get('data-label-title') or label.text.strip())
+
+        categories = None
+        tags = soup.find('div', class_='product__tags')
+        if tags:
+            categories = [tag.text for tag in tags.find_all('a', class_='product-tags__item')]
+
+        gallery_image = None
+        product_gallery = soup.find('div', class_='product-gallery__main')
+        img = product_gallery.find('img') if product_gallery else None
+        if img:
+            gallery_image = img.get('src') or img.get('data-src')
+
+        picture_srcsets = []
+        for picture in soup.find_all('picture'):
+            source = picture.find('source')
+            if source:
+                picture_srcsets.append(source.get('srcset') or source.get('data-srcset', ''))
+
+        return {
+            'product_id': product_form.get('data-product-id') if product_form else None,
+            'title': text(soup.find('h1', class_='product__title')),
+            'current_price': text(soup.find('div', class_='product__price')),
+            'old_price': text(soup.find('div', class_='product__old-price')),
+            'discount': text(soup.find('span', class_='labels__item_type_sale')),
+            'properties': properties,
+            'description': description,
+            'rating': rating_span.get('data-rating') if rating_span else None,
+            'reviews': text(soup.find('span', class_='rating__count')),
+            'availability': text(soup.find('span', {'data-product-card-available': True})),
+            'labels': labels,
+            'categories': categories,
+            'gallery_image': gallery_image,
+            'picture_srcsets': picture_srcsets,
+        }
+
+
+def _cls(name):
+    """XPath predicate matching one token of the class attribute, like BeautifulSoup's class_"""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+class LxmlBookParser(BookParser):
+    """lxml backend: one C-level parse and a fixed set of precompiled XPath lookups"""
+
+    name = 'lxml'
+
+    def __init__(self):
+        import lxml.html
+        from lxml.etree import XPath
+
+        self._html = lxml.html
+        self._document_fromstring = lxml.html.document_fromstring
+        self._html_parsers = {}  # Encoding -> lxml HTMLParser
+        self._xpath = {
+            'cards': XPath('//form[@data-product-id]'),
+            'card_link': XPath(f"(.//a[{_cls('product-card__title')}])[1]/@href", smart_strings=False),
+            'card_text': XPath('.//text()', smart_strings=False),
+            'pagination_links': XPath("//*[contains(@class, 'pagination')]//a/@href", smart_strings=False),
+            'links': XPath('//a/@href', smart_strings=False),
+            'title': XPath(f"(//h1[{_cls('product__title')}])[1]"),
+            'current_price': XPath(f"(//div[{_cls('product__price')}])[1]"),
+            'old_price': XPath(f"(//div[{_cls('product__old-price')}])[1]"),
+            'discount': XPath(f"(//span[{_cls('labels__item_type_sale')}])[1]"),
+            'properties': XPath(f"//div[{_cls('properties__item')}]"),
+            'property_name': XPath(f"(.//div[{_cls('properties__item-name')}])[1]"),
+            'property_value': XPath(f"(.//div[{_cls('properties__item-value')}])[1]"),
+            'description': XPath(f"(//div[{_cls('text')}])[1]"),
+            'paragraphs': XPath('.//p'),
+            'rating': XPath(f"(//span[{_cls('rating__stars')}])[1]"),
+            'reviews': XPath(f"(//span[{_cls('rating__count')}])[1]"),
+            'availability': XPath('(//span[@data-product-card-available])[1]'),
+            'product_form': XPath(f"(//form[@data-main-form])[1] | (//div[{_cls('product__form')}])[1]"),
+            'labels': XPath(f"(.//div[{_cls('labels')}])[1]//span[{_cls('labels__item')}]"),
+            'categories': XPath(f"(//div[{_cls('product__tags')}])[1]"),
+            'tags': XPath(f".//a[{_cls('product-tags__item')}]"),
+            'gallery_image': XPath(f"((//div[{_cls('product-gallery__main')}])[1]//img)[1]"),
+            'picture_sources': XPath('//picture'),
+            'first_source': XPath('(.//source)[1]'),
+        }
+
+    def load(self, content, encoding='utf-8'):
+        """The parsed document of a raw page: libxml2 decodes the bytes itself, with no Python str in between"""
+        parser = self._html_parsers.get(encoding)
+        if parser is None:
+            parser = self._html_parsers[encoding] = self._html.HTMLParser(encoding=encoding)
+        return self._document_fromstring(content, parser=parser)
+
+    def _document(self, content):
+        # Text, bytes, or a document already parsed by load()
+        return content if isinstance(content, self._html.HtmlElement) else self._document_fromstring(content)
+
+    def _first(self, key, node):
+        found = self._xpath[key](node)
+        return found[0] if found else None
+
+    def _text(self, key, node):
+        element = self._first(key, node)
+        return element.text_content() if element is not None else None
+
+    def extract_listing(self, content):
+        doc = self._document(content)
+        cards = []
+        for card in self._xpath['cards'](doc):
+            href = self._xpath['card_link'](card)
+            if href:
+                cards.append((card.get('data-product-id'), href[0], ' '.join(self._xpath['card_text'](card))))
+        return cards, self._xpath['pagination_links'](doc)
+
+    def extract_links(self, content):
+        return self._xpath['links'](self._document(content))
+
+    def extract_fields(self, content):
+        doc = self._document(content)
+
+        properties = []
+        for prop in self._xpath['properties'](doc):
+            name = self._first('property_name', prop)
+            value = self._first('property_value', prop)
+            if name is not None and value is not None:
+                properties.append((name.text_content(), value.text_content()))
+
+        description = None
+        description_div = self._first('description', doc)
+        if description_div is not None:
+            description = [p.text_content() for p in self._xpath['paragraphs'](description_div)]
+
+        rating_span = self._first('rating', doc)
+
+        # Labels only from the product form (the data-main-form one wins), skipping the discount badge
+        labels = []
+        forms = self._xpath['product_form'](doc)
+        product_form = next((f for f in forms if f.tag == 'form'), forms[0] if forms else None)
+        if product_form is not None:
+            for label in self._xpath['labels'](product_form):
+                if 'labels__item_type_sale' not in label.get('class', '').split():
+                    labels.append(label.get('data-label-title') or label.text_content().strip())
+
+        categories = None
+        tags = self._first('categories', doc)
+        if tags is not None:
+            categories = [tag.text_content() for tag in self._xpath['tags'](tags)]
+
+        gallery_image = None
+        img = self._first('gallery_image', doc)
+        if img is not None:
+            gallery_image = img.get('src') or img.get('data-src')
+
+        picture_srcsets = []
+        for picture in self._xpath['picture_sources'](doc):
+            source = self._first('first_source', picture)
+            if source is not None:
+                picture_srcsets.append(source.get('srcset') or source.get('data-srcset', ''))
+
+        return {
+            'product_id': product_form.get('data-product-id') if product_form is not None else None,
+            'title': self._text('title', doc),
+            'current_price': self._text('current_price', doc),
+            'old_price': self._text('old_price', doc),
+            'discount': self._text('discount', doc),
+            'properties': properties,
+            'description': description,
+            'rating': rating_span.get('data-rating') if rating_span is not None else None,
+            'reviews': self._text('reviews', doc),
+            'availability': self._text('availability', doc),
+            'labels': labels,
+            'categories': categories,
+            'gallery_image': gallery_image,
+            'picture_srcsets': picture_srcsets,
+        }
+
+
+PARSERS = {
+    'lxml': LxmlBookParser,
+    'soup': SoupBookParser,
+}
+
+
+def get_parser(name=None):
+    """Return a parser backend by name; by default lxml, falling back to BeautifulSoup"""
+    if name:
+        if name not in PARSERS:
+            raise ValueError(f"Unknown parser backend: {name} (choose from {', '.join(PARSERS)})")
+        return PARSERS[name]()
+
+    try:
+        return LxmlBookParser()
+    except ImportError:
+        return SoupBookParser()
+
+
+# Parser used by executor workers; one per thread, since compiled XPath objects are not thread-safe
+_worker = threading.local()
+
+
+def init_parse_worker(name=None):
+    """Executor initializer: build this worker's parser once instead of per page"""
+    _worker.parser = get_parser(name)
+
+
+def _worker_parser():
+    if not hasattr(_worker, 'parser'):
+        init_parse_worker()
+    return _worker.parser
+
+
+def parse_book_bytes(content, url, encoding='utf-8', parser=None):
+    """Parse a raw product page; runs inside a process or thread pool"""
+    parser = parser or _worker_parser()
+    return parser.parse_book(parser.load(content, encoding), url)
+
+
+def parse_listing_bytes(content, base_url, encoding='utf-8', parser=None):
+    """Parse a raw collection page; runs inside a process or thread pool"""
+    parser = parser or _worker_parser()
+    return parser.parse_listing(parser.load(content, encoding), base_url)
+
+
+def compare_backends(paths, encoding='utf-8'):
+    """Parse saved product pages with every backend and report fields that differ
+
+    Pages go through each backend's load() like fetched ones, so the
+    comparison covers decoding as well as extraction.
+    """
+    parsers = [cls() for cls in PARSERS.values()]
+    mismatches = 0
+
+    for path in paths:
+        with open(path, 'rb') as f:
+            content = f.read()
+
+        records = [parse_book_bytes(content, path, encoding, parser) for parser in parsers]
+        for field in FIELDNAMES:
+            values = [record[field] for record in records]
+            if any(value != values[0] for value in values[1:]):
+                mismatches += 1
+                print(f"{path}: {field} differs")
+                for parser, value in zip(parsers, values):
+                    print(f"  {parser.name}: {value!r}")
+
+    print(f"Compared {len(paths)} pages, {mismatches} mismatched fields")
+    return mismatches
+
+
+if __name__ == "__main__":
+    # Usage: python parsers.py saved_page.html [...]
+    sys.exit(1 if compare_backends(sys.argv[1:]) else 0)
@@ -0,0 +1,217 @@
+"""Charts for analyze.py
+
+Every chart is drawn by a function from plain inputs (lists and numbers), so
+charts can be rendered in worker processes and skipped when their inputs
+are unchanged since the last run. matplotlib and seaborn are only imported
+once a chart is actually drawn.
+"""
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Bump when the drawing code changes, so cached charts are redrawn
+CHART_VERSION = 1
+CACHE_FILE = '.chart_cache.json'
+
+
+def _pyplot():
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    # Set style
+    sns.set_style("whitegrid")
+    plt.rcParams['figure.figsize'] = (12, 8)
+    return plt
+
+
+def _barh(plt, data, color, ylabel, title, fontsize=None):
+    plt.figure(figsize=(12, 6))
+    plt.barh(range(len(data)), [count for _, count in data], color=color)
+    plt.yticks(range(len(data)), [name for name, _ in data], fontsize=fontsize)
+    plt.xlabel('Number of Books', fontsize=12)
+    plt.ylabel(ylabel, fontsize=12)
+    plt.title(title, fontsize=14, fontweight='bold')
+
+
+def price_distribution(plt, prices, counts, mean, median):
+    plt.figure(figsize=(12, 6))
+    plt.hist(prices, bins=50, weights=counts, color='skyblue', edgecolor='black')
+    plt.xlabel('Price (AZN)', fontsize=12)
+    plt.ylabel('Number of Books', fontsize=12)
+    plt.title('Price Distribution of Books', fontsize=14, fontweight='bold')
+    plt.axvline(mean, color='red', linestyle='--', label=f'Mean: {mean:.2f} AZN')
+    plt.axvline(median, color='green', linestyle='--', label=f'Median: {median:.2f} AZN')
+    plt.legend()
+
+
+def discount_analysis(plt, with_discount, without_discount, discounts, counts):
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 6))
+
+    # Pie chart
+    ax1.pie([with_discount, without_discount], labels=['With Discount', 'No Discount'], autopct='%1.1f%%',
+            colors=['#ff9999', '#66b3ff'])
+    ax1.set_title('Books with Discounts', fontsize=14, fontweight='bold')
+
+    # Histogram of discount percentages
+    ax2.hist(discounts, bins=20, weights=counts, color='coral', edgecolor='black')
+    ax2.set_xlabel('Discount Percentage', fontsize=12)
+    ax2.set_ylabel('Number of Books', fontsize=12)
+    ax2.set_title('Distribution of Discount Percentages', fontsize=14, fontweight='bold')
+
+
+def language_distribution(plt, data):
+    _barh(plt, data, 'lightgreen', 'Language', 'Top 10 Languages')
+
+
+def top_publishers(plt, data):
+    _barh(plt, data, 'plum', 'Publisher', 'Top 10 Publishers', fontsize=10)
+
+
+def top_authors(plt, data):
+    _barh(plt, data, 'lightsalmon', 'Author', 'Top 10 Authors', fontsize=10)
+
+
+def pages_distribution(plt, pages, counts, mean, median):
+    plt.figure(figsize=(12, 6))
+    plt.hist(pages, bins=50, weights=counts, color='lightcoral', edgecolor='black')
+    plt.xlabel('Number of Pages', fontsize=12)
+    plt.ylabel('Number of Books', fontsize=12)
+    plt.title('Distribution of Book Pages', fontsize=14, fontweight='bold')
+    plt.axvline(mean, color='red', linestyle='--', label=f'Mean: {mean:.0f} pages')
+    plt.axvline(median, color='green', linestyle='--', label=f'Median: {median:.0f} pages')
+    plt.legend()
+
+
+def labels_distribution(plt, data):
+    _barh(plt, data, 'gold', 'Label', 'Top 10 Book Labels')
+
+
+def price_vs_pages(plt, pages, prices):
+    plt.figure(figsize=(12, 6))
+    plt.scatter(pages, prices, alpha=0.5, color='steelblue')
+    plt.xlabel('Number of Pages', fontsize=12)
+    plt.ylabel('Price (AZN)', fontsize=12)
+    plt.title('Price vs Number of Pages', fontsize=14, fontweight='bold')
+
+
+def cover_type_distribution(plt, data):
+    _barh(plt, data, 'teal', 'Cover Type', 'Cover Type Distribution')
+
+
+def rating_distribution(plt, ratings, counts, mean):
+    plt.figure(figsize=(12, 6))
+    plt.hist(ratings, bins=20, weights=counts, color='mediumpurple', edgecolor='black')
+    plt.xlabel('Rating (out of 5)', fontsize=12)
+    plt.ylabel('Number of Books', fontsize=12)
+    plt.title('Rating Distribution', fontsize=14, fontweight='bold')
+    plt.axvline(mean, color='red', linestyle='--', label=f'Mean: {mean:.2f}')
+    plt.legend()
+
+
+def chart_specs(aggregate, stats):
+    """(filename, description, chart function name, inputs) for every chart the data allows"""
+    prices, price_counts = aggregate.price.sketch.distribution()
+    discounts, discount_counts = aggregate.discount.sketch.distribution()
+    pages, pages_counts = aggregate.pages.sketch.distribution()
+    sample = aggregate.price_vs_pages.rows  # A uniform sample of (pages, price) pairs
+    positive = discounts > 0
+
+    specs = [
+        ('01_price_distribution.png', 'Price Distribution Histogram', 'price_distribution', {
+            'prices': prices.tolist(), 'counts': price_counts.tolist(),
+            'mean': stats['price_statistics']['average'], 'median': stats['price_statistics']['median'],
+        }),
+        ('02_discount_analysis.png', 'Discount Analysis', 'discount_analysis', {
+            'with_discount': aggregate.books_with_discount,
+            'without_discount': aggregate.total_books - aggregate.books_with_discount,
+            'discounts': discounts[positive].tolist(), 'counts': discount_counts[positive].tolist(),
+        }),
+        ('03_language_distribution.png', 'Language Distribution', 'language_distribution',
+         {'data': list(stats['language_distribution'].items())}),
+        ('04_top_publishers.png', 'Top Publishers', 'top_publishers',
+         {'data': list(stats['publisher_top_10'].items())}),
+        ('05_top_authors.png', 'Top Authors', 'top_authors',
+         {'data': list(stats['author_top_10'].items())}),
+        ('06_pages_distribution.png', 'Pages Distribution', 'pages_distribution', {
+            'pages': pages.tolist(), 'counts': pages_counts.tolist(),
+            'mean': stats['pages_statistics']['average'], 'median': stats['pages_statistics']['median'],
+        }),
+        ('07_labels_distribution.png', 'Labels Distribution', 'labels_distribution',
+         {'data': list(stats['labels_distribution'].items())}),
+        ('08_price_vs_pages.png', 'Price vs Pages Correlation', 'price_vs_pages',
+         {'pages': sample[:, 0].tolist(), 'prices': sample[:, 1].tolist()}),
+    ]
+    if stats['cover_type_distribution']:
+        specs.append(('09_cover_type_distribution.png', 'Cover Type Distribution', 'cover_type_distribution',
+                      {'data': list(stats['cover_type_distribution'].items())}))
+    if aggregate.rating.count > 0:
+        ratings, rating_counts = aggregate.rating.sketch.distribution()
+        specs.append(('10_rating_distribution.png', 'Rating Distribution', 'rating_distribution', {
+            'ratings': ratings.tolist(), 'counts': rating_counts.tolist(),
+            'mean': stats['rating_statistics']['average_rating'],
+        }))
+    return specs
+
+
+def input_hash(chart, inputs):
+    """Content hash of everything a chart is drawn from"""
+    payload = json.dumps({'chart': chart, 'version': CHART_VERSION, 'inputs': inputs},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def render(chart, path, inputs):
+    """Draw one chart to path (runs in a worker process when rendering in parallel)"""
+    plt = _pyplot()
+    globals()[chart](plt, **inputs)
+    plt.tight_layout()
+    plt.savefig(path, dpi=300)
+    plt.close('all')
+    return path
+
+
+def render_charts(specs, out_dir='charts', jobs=None, use_cache=True):
+    """Render the charts whose inputs changed since the last run, across a process pool
+
+    Returns (rendered, skipped) lists of file names.
+    """
+    cache_path = os.path.join(out_dir, CACHE_FILE)
+    cache = {}
+    if use_cache and os.path.exists(cache_path):
+        with open(cache_path, encoding='utf-8') as f:
+            cache = json.load(f)
+
+    todo = []
+    skipped = []
+    hashes = {}
+    for filename, description, chart, inputs in specs:
+        path = os.path.join(out_dir, filename)
+        hashes[filename] = input_hash(chart, inputs)
+        if use_cache and cache.get(filename) == hashes[filename] and os.path.exists(path):
+            print(f"{description}: unchanged, skipped")
+            skipped.append(filename)
+        else:
+            todo.append((filename, description, chart, inputs))
+
+    jobs = min(jobs or os.cpu_count() or 1, len(todo))
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [(description, pool.submit(render, chart, os.path.join(out_dir, filename), inputs))
+                       for filename, description, chart, inputs in todo]
+            for description, future in futures:
+                future.result()
+                print(f"{description}: rendered")
+    else:
+        for filename, description, chart, inputs in todo:
+            render(chart, os.path.join(out_dir, filename), inputs)
+            print(f"{description}: rendered")
+
+    # Only charts that exist on disk are remembered
+    cache = {filename: hashes[filename] for filename in hashes
+             if os.path.exists(os.path.join(out_dir, filename))}
+    with open(cache_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, indent=2)
+    return [spec[0] for spec in todo], skipped
@@ -0,0 +1,148 @@
+"""The book record: one scraped product, in a compact slotted form
+
+A crawl used to carry every book as a dict of 25 separate strings. A
+BookRecord keeps the same fields in __slots__ (no per-record dict), interns
+the values that repeat across the catalog (publishers, languages, prices,
+availability, ...) so all records share one string object per distinct
+value, and holds labels and categories as tuples of interned strings.
+
+It reads like the old dict: record['labels'], record.get('author'), keys(),
+items() and dict(record) give the flat string form that the cache and CSV
+expect, with labels and categories joined by ', '. The attributes give the
+compact form (record.labels is a tuple), and json_record() the form written
+to JSONL, where labels and categories are lists (as they are in Parquet).
+"""
+import sys
+from collections.abc import Mapping
+
+# Columns of a scraped book record, in output order
+FIELDNAMES = [
+    'url', 'title', 'current_price', 'current_price_numeric', 'old_price', 'old_price_numeric',
+    'discount_percent', 'discount_numeric', 'isbn', 'publisher', 'author', 'pages', 'pages_numeric',
+    'language', 'cover_type', 'description', 'rating', 'rating_numeric', 'reviews_count',
+    'availability', 'labels', 'categories', 'image_url', 'product_id', 'collections'
+]
+
+# Typed output schema for columnar sinks; every other column is a string. Categories are
+# low-cardinality columns worth dictionary-encoding.
+FIELD_TYPES = {
+    'current_price_numeric': 'float',
+    'old_price_numeric': 'float',
+    'discount_numeric': 'float',
+    'pages_numeric': 'int',
+    'rating_numeric': 'float',
+    'reviews_count': 'int',
+    'language': 'category',
+    'cover_type': 'category',
+    'availability': 'category',
+    'labels': 'list',
+    'categories': 'list',
+}
+
+# Stored as tuples of interned strings, read and written as ', '-joined strings
+LIST_FIELDS = frozenset(['labels', 'categories'])
+# Unique per book, so interning would only cost a lookup
+UNIQUE_FIELDS = frozenset(['url', 'title', 'isbn', 'description', 'image_url', 'product_id'])
+_FIELDS = frozenset(FIELDNAMES)
+
+
+def as_list(value):
+    """A labels or categories value as a list, whether stored as a list or as ', '-joined text (CSV)"""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [item for item in value.split(', ') if item]
+    return list(value)
+
+
+def as_text(value):
+    """A labels or categories value as ', '-joined text, whether stored as text or as a list (JSONL, Parquet)"""
+    if value is None or isinstance(value, str):
+        return value
+    return ', '.join(value)
+
+
+def json_record(record):
+    """A record (BookRecord or dict) as a dict for JSON output, with labels and categories as lists"""
+    if isinstance(record, BookRecord):
+        return {name: list(getattr(record, name)) if name in LIST_FIELDS else getattr(record, name)
+                for name in FIELDNAMES}
+    return {name: as_list(value) if name in LIST_FIELDS else value for name, value in record.items()}
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+def _split(value):
+    if isinstance(value, str):
+        value = value.split(', ')
+    return tuple(sys.intern(item) for item in value or () if item)
+
+
+class BookRecord(Mapping):
+    """One book with the FIELDNAMES fields; a read/write mapping of field name to string"""
+
+    __slots__ = tuple(FIELDNAMES)
+
+    def __init__(self, **fields):
+        for name in FIELDNAMES:
+            setattr(self, name, () if name in LIST_FIELDS else '')
+        for name, value in fields.items():
+            self[name] = value
+
+    @classmethod
+    def from_mapping(cls, mapping):
+        """A record from a dict (or record) with some or all of the fields; other keys are dropped"""
+        if isinstance(mapping, cls):
+            return mapping
+        return cls(**{name: mapping[name] for name in FIELDNAMES if mapping.get(name) is not None})
+
+    def __getitem__(self, name):
+        if name not in _FIELDS:
+            raise KeyError(name)
+        value = getattr(self, name)
+        return ', '.join(value) if name in LIST_FIELDS else value
+
+    def __setitem__(self, name, value):
+        if name not in _FIELDS:
+            raise KeyError(name)
+        if name in LIST_FIELDS:
+            value = _split(value)
+        elif name not in UNIQUE_FIELDS:
+            value = _intern(value)
+        setattr(self, name, value)
+
+    def __iter__(self):
+        return iter(FIELDNAMES)
+
+    def __len__(self):
+        return len(FIELDNAMES)
+
+    def __contains__(self, name):
+        return name in _FIELDS
+
+    def __eq__(self, other):
+        if isinstance(other, Mapping):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"BookRecord(url={self.url!r}, title={self.title!r})"
+
+    def __reduce__(self):
+        # Sent back from parse workers as a flat tuple, much cheaper to pickle than the slot state
+        return _restore, (tuple(getattr(self, name) for name in FIELDNAMES),)
+
+
+def _restore(values):
+    record = BookRecord.__new__(BookRecord)
+    for name, value in zip(FIELDNAMES, values):
+        if name in LIST_FIELDS:
+            value = tuple(map(sys.intern, value))
+        elif name not in UNIQUE_FIELDS:
+            value = _intern(value)
+        setattr(record, name, value)
+    return record
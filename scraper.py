@@ -1,280 +1,685 @@
 import aiohttp
+import argparse
 import asyncio
-from bs4 import BeautifulSoup
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import csv
-from urllib.parse import urljoin
-import re
+import importlib.util
+import time
+
+from http_cache import ResponseCache
+from metrics import PARSE_BUCKETS, CrawlLog, Metrics, MetricsExporter
+from records import BookRecord
+from parsers import FIELD_TYPES, FIELDNAMES, canonical_url, collection_name, get_parser, init_parse_worker, parse_book_bytes, parse_listing_bytes
+from history import PriceHistory
+from images import ImageFetcher, ImageStore, parse_size
+from sitemap import SitemapDiscovery
+from structured import BATCH_SIZE, HTML_ONLY_FIELDS, bulk_url, merge_html, needs_html, parse_products, record_from_product
+from storage import CrawlCheckpoint, DeltaState, ParquetRecordWriter, RecordWriter, TeeWriter, record_format
+from throttle import RETRY_STATUSES, AdaptiveLimiter, HostRateLimiter, RetryPolicy, parse_retry_after
+from transport import BACKENDS, DNS_TTL, KEEPALIVE, HttpxSession, accept_encoding, tcp_connector
+
+
+DEFAULT_COLLECTION = "https://alinino.az/collection/bestsellery"
+
+
+class FetchError(Exception):
+    """A page could not be downloaded (error status, or retries exhausted)"""
+
+
+async def run_until_failure(tasks):
+    """Wait for every task; the first to fail cancels the others and its exception is raised
+
+    Workers and the discovery that feeds them wait on each other through a
+    bounded queue, so when one side dies the other must not be left waiting
+    on it forever.
+    """
+    pending = set(tasks)
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            if not task.cancelled() and task.exception() is not None:
+                for other in pending:
+                    other.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                raise task.exception()
+
+
+class _Crawl:
+    """State shared by the listing walkers and the detail workers of one crawl
+
+    Holds the deduplicated frontier: every product is keyed by its product id
+    and canonical URL, queued once no matter how many collections list it, and
+    remembers every collection it was found in.
+    """
+
+    def __init__(self, queue_size, progress_every, writer=None, checkpoint=None, delta=None, metrics=None,
+                 log=None, images=None):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.progress_every = progress_every
+        self.metrics = metrics or Metrics()
+        self.log = log or CrawlLog()
+        self.writer = writer
+        self.checkpoint = checkpoint
+        self.delta = delta
+        self.images = images
+        self.keys = {}  # 'id:<product id>' or 'url:<canonical url>' -> canonical url
+        self.collections = {}  # canonical url -> collections the product was found in
+        self.emitted = {}  # canonical url -> number of collections known when its record was written
+        self.books = []
+        self.scraped = 0
+
+        # Books finished by a previous run are already in the output
+        for link in (checkpoint.done if checkpoint else ()):
+            self.keys[f'url:{link}'] = link
+            self.collections[link] = []
+            self.emitted[link] = 0
+
+    def _known(self, url, product_id):
+        if product_id and f'id:{product_id}' in self.keys:
+            return self.keys[f'id:{product_id}']
+        return self.keys.get(f'url:{url}')
+
+    async def enqueue(self, card, collection=None):
+        """Queue a product card once per crawl, recording the collection it was found in
+
+        Products finished by a previous run are skipped, and in delta mode
+        unchanged products are emitted straight from the previous run's record.
+        """
+        link = canonical_url(card['url'])
+        product_id = card.get('product_id')
+        known = self._known(link, product_id)
+        if known is not None:
+            if collection and collection not in self.collections[known]:
+                self.collections[known].append(collection)
+            if product_id:
+                self.keys.setdefault(f'id:{product_id}', known)
+            return False
+
+        self.keys[f'url:{link}'] = link
+        if product_id:
+            self.keys[f'id:{product_id}'] = link
+        self.collections[link] = [collection] if collection else []
+        card = {**card, 'url': link}
+
+        if self.delta and card.get('fingerprint'):
+            record = self.delta.carried_record(card)
+            if record is not None:
+                await self.emit(card, record)
+                return False
+
+        if self.checkpoint:
+            self.checkpoint.mark_discovered(link)
+        await self.queue.put(card)
+        self.metrics.set('queue_depth', self.queue.qsize())
+        return True
+
+    async def emit(self, card, result):
+        """Hand a finished record to the writer (or collect it) and update the crawl state"""
+        link = card['url']
+        if result is None:
+            if self.checkpoint:
+                self.checkpoint.mark_failed(link)
+            if self.delta and card.get('fingerprint'):
+                self.delta.keep_previous(card)
+            self.metrics.inc('books_total', result='failed')
+            return
+
+        result['product_id'] = card.get('product_id') or result.get('product_id', '')
+        found_in = self.collections.get(link, [])
+        result['collections'] = ', '.join(found_in)
+        self.emitted[link] = len(found_in)
+
+        if self.delta and card.get('fingerprint'):
+            self.delta.update(card, result)
+        # Marked before writing, so the writer's next sync persists both together
+        if self.checkpoint:
+            self.checkpoint.mark_done(link)
+        if self.writer:
+            self.writer.write(result)
+        else:
+            self.books.append(result)
+        if self.images:
+            await self.images.submit(result.get('image_url'))  # Waits while the image queue is full
+
+        self.scraped += 1
+        self.metrics.inc('books_total', result='scraped')
+        if self.scraped % self.progress_every == 0:
+            self.log.info('progress', f"Total scraped: {self.scraped}", scraped=self.scraped)
+
+    def late_collections(self):
+        """Collections lists of written records that grew after the record was written"""
+        return {
+            link: ', '.join(self.collections[link])
+            for link, count in self.emitted.items()
+            if len(self.collections[link]) != count
+        }
+
 
 class AlininoScraper:
-    def __init__(self, max_concurrent=5, batch_size=50):
-        self.base_url = "https://alinino.az"
+    def __init__(self, max_concurrent=5, num_workers=None, queue_size=100, progress_every=50, parser=None,
+                 parse_workers=0, parse_executor='process', cache=None, max_concurrent_limit=32,
+                 rate_limit=10.0, max_retries=4, base_url="https://alinino.az", metrics=None, log=None,
+                 extract='html', html_fields=(), batch_size=BATCH_SIZE, http_backend='aiohttp',
+                 keepalive=KEEPALIVE, dns_ttl=DNS_TTL, compress=True, image_workers=0):
+        self.base_url = base_url
         self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+            'Accept-Encoding': accept_encoding(compress),
         }
-        self.semaphore = asyncio.Semaphore(max_concurrent)  # Limit concurrent requests
-        self.batch_size = batch_size
+        # Concurrency starts at max_concurrent and adapts (AIMD) up to max_concurrent_limit
+        self.limiter = AdaptiveLimiter(initial=max_concurrent, max_limit=max_concurrent_limit)
+        self.rate_limiter = HostRateLimiter(rate=rate_limit or None)  # Requests per second per host
+        self.retry = RetryPolicy(max_retries=max_retries)
+        self.num_workers = num_workers or max_concurrent_limit  # Detail workers draining the link queue
+        self.queue_size = queue_size  # Bound on links discovered but not yet scraped
+        self.progress_every = progress_every
         self.timeout = aiohttp.ClientTimeout(total=30)  # 30 second timeout
+        self.parser = get_parser(parser)  # lxml when available, BeautifulSoup otherwise
+        self.parse_workers = parse_workers  # 0 parses on the event loop, N hands pages to a pool
+        self.parse_executor = parse_executor  # 'process', or 'thread' for parsers that release the GIL
+        self._executor = None
+        self.cache = cache  # Optional ResponseCache for conditional requests
+        self.metrics = metrics or Metrics()  # Latency, parse time, throttling and status counters
+        self.log = log or CrawlLog()  # Text or JSON lines
+        self.extract = extract  # 'html' parses every product page, 'structured' reads the bulk product JSON
+        self.html_fields = tuple(html_fields)  # Fields still taken from the product page in structured mode
+        self.batch_size = batch_size  # Products per bulk JSON request
+        if http_backend not in BACKENDS:
+            raise ValueError(f"Unknown HTTP backend: {http_backend} (choose from {', '.join(BACKENDS)})")
+        self.http_backend = http_backend  # 'aiohttp', or 'httpx' for HTTP/2 (see transport.py)
+        self.keepalive = keepalive  # Seconds idle connections are kept; 0 closes each after its response
+        self.dns_ttl = dns_ttl  # Seconds resolved addresses are cached
+        # Per host beyond the limiter's: one for the sitemap stream and one per ImageFetcher worker
+        self.spare_connections = 1 + image_workers
+        self._session = None  # Shared session while the scraper is open
+
+    def _new_session(self):
+        # Spare connections for the sitemap stream and image downloads, which take no limiter slot
+        limit_per_host = self.limiter.max_limit + self.spare_connections
+        if self.http_backend == 'httpx':
+            return HttpxSession(self.timeout, limit_per_host, keepalive=self.keepalive, metrics=self.metrics)
+        return aiohttp.ClientSession(connector=tcp_connector(limit_per_host, self.dns_ttl, self.keepalive),
+                                     timeout=self.timeout, trace_configs=[self.metrics.trace_config()])
+
+    @contextlib.asynccontextmanager
+    async def session(self):
+        """The client session for a crawl: the shared one while the scraper is open, else a new one for the call
+
+        `async with scraper:` keeps one session, and with it the connection
+        pool and DNS cache, across every crawl, discovery and image download
+        made until it exits.
+        """
+        if self._session is not None:
+            yield self._session
+            return
+        async with self._new_session() as session:
+            yield session
+
+    async def open(self):
+        if self._session is None:
+            self._session = self._new_session()
+        return self
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _start_parse_pool(self):
+        """Create the parse pool for a crawl, if one is configured"""
+        if self.parse_workers and self._executor is None:
+            pool = ProcessPoolExecutor if self.parse_executor == 'process' else ThreadPoolExecutor
+            self._executor = pool(max_workers=self.parse_workers, initializer=init_parse_worker,
+                                  initargs=(self.parser.name,))
+
+    def _stop_parse_pool(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    async def _parse(self, func, content, *args):
+        """Run a parse function inline, or in the parse pool so the event loop only does I/O"""
+        kind = 'book' if func is parse_book_bytes else 'listing'
+        started = time.perf_counter()
+        if self._executor is None:
+            result = func(content, *args, parser=self.parser)
+        else:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._executor, func, content, *args)
+        self.metrics.observe('parse_seconds', time.perf_counter() - started, PARSE_BUCKETS, kind=kind)
+        return result
+
+    async def _fetch(self, session, url):
+        """Download a page as raw bytes plus its charset, going through the response cache if any
+
+        Returns (content, encoding, parsed), where parsed is the cached parse
+        result when the page has not changed since it was last parsed.
+        """
+        entry = self.cache.get(url) if self.cache else None
+        if entry and (self.cache.offline or self.cache.is_fresh(entry)):
+            self.cache.hits += 1
+            self.metrics.inc('cache_total', result='fresh')
+            return entry.body, entry.encoding, entry.parsed
+        if self.cache and self.cache.offline:
+            raise LookupError(f"Not cached, cannot fetch in offline mode: {url}")
+
+        headers = {**self.headers, **entry.conditional_headers()} if entry else self.headers
+        status, content, encoding, response_headers = await self._get(session, url, headers)
+
+        if entry and status == 304:
+            self.cache.revalidated(url)
+            self.cache.hits += 1
+            self.metrics.inc('cache_total', result='not_modified')
+            return entry.body, entry.encoding, entry.parsed
+        if status >= 400:
+            raise FetchError(f"HTTP {status}")
+
+        if self.cache and status == 200:
+            self.cache.misses += 1
+            self.metrics.inc('cache_total', result='miss')
+            self.cache.put(url, content, encoding,
+                           response_headers.get('ETag'), response_headers.get('Last-Modified'))
+        return content, encoding, None
+
+    async def _get(self, session, url, headers):
+        """GET with jittered exponential backoff on throttling, server errors and timeouts"""
+        for attempt in range(self.retry.max_retries + 1):
+            retry_after = None
+            try:
+                status, content, encoding, response_headers = await self._request(session, url, headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                reason = str(e) or type(e).__name__
+                kind = type(e).__name__
+            else:
+                if status not in RETRY_STATUSES:
+                    return status, content, encoding, response_headers
+                reason = kind = f"HTTP {status}"
+                # Retry-After holds back every request to the host, not just this one
+                retry_after = parse_retry_after(response_headers.get('Retry-After'))
+                if retry_after:
+                    self.rate_limiter.pause(url, retry_after)
+
+            if attempt == self.retry.max_retries:
+                self.metrics.inc('gave_up_total', reason=kind)
+                raise FetchError(f"{reason}, giving up after {attempt + 1} attempts")
+            delay = self.retry.delay(attempt, retry_after)
+            self.metrics.inc('retries_total', reason=kind)
+            self.log.warning('retry', f"Retrying {url} in {delay:.1f}s ({reason})",
+                             url=url, delay=round(delay, 3), reason=reason, attempt=attempt + 1)
+            await asyncio.sleep(delay)
+
+    async def _request(self, session, url, headers):
+        """A single rate-limited GET, feeding its outcome back to the concurrency limiter"""
+        metrics = self.metrics
+        waited = time.perf_counter()
+        await self.rate_limiter.acquire(url)
+        acquired = time.perf_counter()
+        metrics.observe('rate_limit_wait_seconds', acquired - waited)
+        async with self.limiter:
+            started = time.perf_counter()
+            metrics.observe('limiter_wait_seconds', started - acquired)
+            metrics.set('concurrency_limit', self.limiter.limit)
+            metrics.set('in_flight', self.limiter.in_flight)
+            timing = {}  # Phase timestamps filled in by the session's trace config
+            try:
+                async with session.get(url, headers=headers, trace_request_ctx=timing) as response:
+                    content = await response.read()
+                    status = response.status
+                    encoding = response.charset or 'utf-8'
+                    response_headers = response.headers
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.limiter.on_error()
+                metrics.inc('request_errors_total', error=type(e).__name__)
+                raise
+            finished = time.perf_counter()
+            if 'headers' in timing:
+                metrics.observe('request_phase_seconds', finished - timing['headers'], phase='body')
+            metrics.observe('request_seconds', finished - started)
+            metrics.inc('responses_total', status=status)
+            metrics.inc('response_bytes_total', len(content))
+            self.limiter.on_response(status, finished - started)
+        return status, content, encoding, response_headers
+
+    async def _fetch_and_parse(self, session, url, func, arg):
+        """Fetch a page and parse it, reusing the cached parse result for unchanged pages"""
+        content, encoding, parsed = await self._fetch(session, url)
+        if parsed is None:
+            parsed = await self._parse(func, content, arg, encoding)
+            if self.cache:
+                self.cache.set_parsed(url, parsed)
+        return parsed
+
+    async def get_listing_page(self, session, url):
+        """Extract the product cards (url, product id, fingerprint) and last page number from a collection page"""
+        self.log.info('listing_fetch', f"Fetching book links from: {url}", url=url)
+        listing = await self._fetch_and_parse(session, url, parse_listing_bytes, self.base_url)
+        self.log.info('listing_parsed', f"Found {len(listing['cards'])} books on this page",
+                      url=url, cards=len(listing['cards']))
+        return listing
+
+    async def get_book_cards_from_page(self, session, url):
+        """Extract all product cards from a collection page"""
+        return (await self.get_listing_page(session, url))['cards']
 
     async def get_book_links_from_page(self, session, url):
         """Extract all book links from a collection page"""
-        print(f"Fetching book links from: {url}")
-        async with self.semaphore:
-            async with session.get(url, headers=self.headers) as response:
-                content = await response.text()
-                soup = BeautifulSoup(content, 'html.parser')
-
-                book_links = []
-                # Find all product cards
-                product_cards = soup.find_all('form', {'data-product-id': True})
-
-                for card in product_cards:
-                    # Find the link to the product page
-                    link = card.find('a', class_='product-card__title')
-                    if link and link.get('href'):
-                        full_url = urljoin(self.base_url, link['href'])
-                        book_links.append(full_url)
-
-                print(f"Found {len(book_links)} books on this page")
-                return book_links
+        return [card['url'] for card in await self.get_book_cards_from_page(session, url)]
 
     async def extract_book_data(self, session, url):
-        """Extract detailed data from a book page"""
+        """Extract detailed data from a book page as a BookRecord"""
         try:
-            async with self.semaphore:
-                async with session.get(url, headers=self.headers) as response:
-                    content = await response.text()
-
-            soup = BeautifulSoup(content, 'html.parser')
-            data = {
-                'url': url,
-                'title': '',
-                'current_price': '',
-                'current_price_numeric': '',
-                'old_price': '',
-                'old_price_numeric': '',
-                'discount_percent': '',
-                'discount_numeric': '',
-                'isbn': '',
-                'publisher': '',
-                'author': '',
-                'pages': '',
-                'pages_numeric': '',
-                'language': '',
-                'cover_type': '',
-                'description': '',
-                'rating': '',
-                'rating_numeric': '',
-                'reviews_count': '',
-                'availability': '',
-                'labels': '',
-                'categories': '',
-                'image_url': ''
-            }
-
-            # Title
-            title = soup.find('h1', class_='product__title')
-            if title:
-                data['title'] = title.text.strip()
-
-            # Prices
-            current_price = soup.find('div', class_='product__price')
-            if current_price:
-                price_text = current_price.text.strip()
-                data['current_price'] = price_text
-                # Extract numeric value
-                price_num = re.search(r'([\d.,]+)', price_text.replace(' ', ''))
-                if price_num:
-                    data['current_price_numeric'] = price_num.group(1).replace(',', '.')
-
-            old_price = soup.find('div', class_='product__old-price')
-            if old_price:
-                price_text = old_price.text.strip()
-                data['old_price'] = price_text
-                # Extract numeric value
-                price_num = re.search(r'([\d.,]+)', price_text.replace(' ', ''))
-                if price_num:
-                    data['old_price_numeric'] = price_num.group(1).replace(',', '.')
-
-            # Discount
-            discount = soup.find('span', class_='labels__item_type_sale')
-            if discount:
-                discount_text = discount.text.strip()
-                data['discount_percent'] = discount_text
-                # Extract numeric value
-                discount_num = re.search(r'(\d+)', discount_text)
-                if discount_num:
-                    data['discount_numeric'] = discount_num.group(1)
-
-            # Properties (ISBN, Publisher, Author, etc.)
-            properties = soup.find_all('div', class_='properties__item')
-            for prop in properties:
-                name = prop.find('div', class_='properties__item-name')
-                value = prop.find('div', class_='properties__item-value')
-
-                if name and value:
-                    name_text = name.text.strip().replace(':', '').lower()
-                    value_text = value.text.strip()
-
-                    if 'isbn' in name_text or 'artikul' in name_text:
-                        data['isbn'] = value_text
-                    elif 'nəşriyyat' in name_text or 'publisher' in name_text:
-                        data['publisher'] = value_text
-                    elif 'müəllif' in name_text or 'author' in name_text:
-                        data['author'] = value_text
-                    elif 'səhifə' in name_text or 'pages' in name_text:
-                        data['pages'] = value_text
-                        # Extract numeric value
-                        pages_num = re.search(r'(\d+)', value_text)
-                        if pages_num:
-                            data['pages_numeric'] = pages_num.group(1)
-                    elif 'dil' in name_text or 'language' in name_text:
-                        data['language'] = value_text
-                    elif 'cild' in name_text or 'cover' in name_text:
-                        data['cover_type'] = value_text
-
-            # Description
-            description_div = soup.find('div', class_='text')
-            if description_div:
-                # Get text from all paragraphs
-                paragraphs = description_div.find_all('p')
-                description_text = ' '.join([p.text.strip() for p in paragraphs])
-                data['description'] = description_text
-
-            # Rating
-            rating_span = soup.find('span', class_='rating__stars')
-            if rating_span and rating_span.get('data-rating'):
-                rating_value = rating_span['data-rating']
-                data['rating'] = rating_value
-                data['rating_numeric'] = rating_value  # Already numeric
-
-            # Reviews count
-            reviews_count = soup.find('span', class_='rating__count')
-            if reviews_count:
-                count_text = reviews_count.text.strip()
-                # Extract just the number
-                number = re.search(r'\d+', count_text)
-                if number:
-                    data['reviews_count'] = number.group()
-                else:
-                    data['reviews_count'] = '0'
-            else:
-                data['reviews_count'] = '0'
-
-            # Availability
-            availability = soup.find('span', {'data-product-card-available': True})
-            if availability:
-                data['availability'] = availability.text.strip()
-
-            # Labels (Bestseller, Express, etc.) - only from product form
-            product_form = soup.find('form', {'data-main-form': True}) or soup.find('div', class_='product__form')
-            label_texts = []
-            if product_form:
-                labels_div = product_form.find('div', class_='labels')
-                if labels_div:
-                    labels = labels_div.find_all('span', class_='labels__item')
-                    seen_labels = set()  # Avoid duplicates
-                    for label in labels:
-                        # Skip discount labels and get data-label-title or text
-                        if 'labels__item_type_sale' not in label.get('class', []):
-                            label_title = label.get('data-label-title') or label.text.strip()
-                            if label_title and label_title.strip() and label_title not in seen_labels:
-                                label_texts.append(label_title.strip())
-                                seen_labels.add(label_title)
-            data['labels'] = ', '.join(label_texts) if label_texts else ''
-
-            # Categories/Tags
-            tags = soup.find('div', class_='product__tags')
-            if tags:
-                tag_links = tags.find_all('a', class_='product-tags__item')
-                data['categories'] = ', '.join([tag.text.strip() for tag in tag_links])
-
-            # Main image - try multiple sources
-            # First try the main product gallery
-            product_gallery = soup.find('div', class_='product-gallery__main')
-            if product_gallery:
-                img = product_gallery.find('img')
-                if img:
-                    # Try src, then data-src
-                    img_url = img.get('src') or img.get('data-src')
-                    if img_url and 'products' in img_url:  # Make sure it's a product image, not a placeholder
-                        data['image_url'] = img_url
-
-            # If no valid image found, try the first picture element with product image
-            if not data['image_url']:
-                pictures = soup.find_all('picture')
-                for picture in pictures:
-                    source = picture.find('source')
-                    if source:
-                        srcset = source.get('srcset') or source.get('data-srcset', '')
-                        if 'products' in srcset:
-                            # Extract first URL from srcset
-                            url_match = re.search(r'(https://[^\s]+)', srcset)
-                            if url_match:
-                                data['image_url'] = url_match.group(1).split()[0]
-                                break
-
-            return data
+            # A parse result replayed from the cache comes back as a plain dict
+            return BookRecord.from_mapping(await self._fetch_and_parse(session, url, parse_book_bytes, url))
 
         except Exception as e:
-            print(f"Error scraping {url}: {str(e)}")
+            self.metrics.inc('scrape_errors_total', error=type(e).__name__)
+            self.log.warning('scrape_error', f"Error scraping {url}: {str(e)}", url=url, error=str(e))
             return None
 
-    async def scrape_collection(self, collection_url, max_pages=None):
-        """Scrape all books from a collection"""
-        async with aiohttp.ClientSession(timeout=self.timeout) as session:
-            # First, collect all book links from all pages
-            all_book_links = []
-            page = 1
-
+    async def get_products_json(self, session, product_ids):
+        """Fetch the platform's JSON for several products in one request, by product id"""
+        url = bulk_url(self.base_url, product_ids)
+        # Not cached: a batch's id list is different on every crawl
+        status, content, _, _ = await self._get(session, url, {**self.headers, 'Accept': 'application/json'})
+        if status >= 400:
+            raise FetchError(f"HTTP {status}")
+        started = time.perf_counter()
+        products = parse_products(content)
+        self.metrics.observe('parse_seconds', time.perf_counter() - started, PARSE_BUCKETS, kind='json')
+        return products
+
+    async def extract_books_data(self, session, cards):
+        """Extract the books of several listing cards from the bulk product JSON, as BookRecords (or None)
+
+        Cards without a product id, products the JSON lacks or has without a
+        title or price, and every product when html_fields are asked for, are
+        completed from their product page.
+        """
+        ids = [card['product_id'] for card in cards if card.get('product_id')]
+        products = {}
+        if ids:
+            try:
+                products = await self.get_products_json(session, ids)
+            except (FetchError, ValueError) as e:
+                self.metrics.inc('scrape_errors_total', error=type(e).__name__)
+                self.log.warning('structured_error', f"Error fetching product JSON for {len(ids)} books: {e}",
+                                 products=len(ids), error=str(e))
+
+        async def extract(card):
+            product = products.get(card.get('product_id'))
+            record = record_from_product(product, card['url']) if product else None
+            if needs_html(record, self.html_fields):
+                self.metrics.inc('structured_fallback_total', reason='fields' if record else 'missing')
+                record = merge_html(record, await self.extract_book_data(session, card['url']), self.html_fields)
+            return record
+
+        return await asyncio.gather(*[extract(card) for card in cards])
+
+    @staticmethod
+    def _page_url(collection_url, page):
+        return collection_url if page == 1 else f"{collection_url}?page={page}"
+
+    async def _walk_listing_pages(self, session, collection_url, crawl, max_pages=None):
+        """Discover all collection pages and push product cards into the queue as they are found
+
+        The last page number comes from the pagination widget on page 1 (or any
+        later page that links further); all remaining pages are then fetched
+        concurrently under the shared limiter. Without a widget the last page is
+        found by exponential probing followed by a binary search.
+        """
+        fetched = {}  # page -> number of cards on it
+        total_links = 0
+        collection = collection_name(collection_url)
+
+        async def fetch_page(page):
+            nonlocal total_links
+            try:
+                listing = await self.get_listing_page(session, self._page_url(collection_url, page))
+            except (FetchError, LookupError) as e:
+                self.log.warning('listing_error', f"Error fetching page {page}: {str(e)}",
+                                 url=self._page_url(collection_url, page), error=str(e))
+                listing = {'cards': [], 'last_page': None}
+
+            fetched[page] = len(listing['cards'])
+            # Blocks while the queue is full, so discovery never runs far ahead of the workers
+            for card in listing['cards']:
+                if await crawl.enqueue(card, collection):
+                    total_links += 1
+            return listing
+
+        first = await fetch_page(1)
+        if not first['cards']:
+            self.log.info('listing_empty', "No books found on page 1, stopping", collection=collection)
+            return total_links
+
+        last_page = first['last_page'] or await self._probe_last_page(fetch_page, fetched, max_pages)
+        scheduled = set(fetched)
+        pending = set()
+        try:
             while True:
-                if max_pages and page > max_pages:
+                # Schedule every page up to the highest one seen so far
+                for page in range(2, (min(last_page, max_pages) if max_pages else last_page) + 1):
+                    if page not in scheduled:
+                        scheduled.add(page)
+                        pending.add(asyncio.create_task(fetch_page(page)))
+                if not pending:
                     break
 
-                # Construct page URL
-                if page == 1:
-                    page_url = collection_url
-                else:
-                    page_url = f"{collection_url}?page={page}"
-
-                # Get book links from this page
-                book_links = await self.get_book_links_from_page(session, page_url)
-
-                if not book_links:
-                    print(f"No books found on page {page}, stopping")
-                    break
-
-                all_book_links.extend(book_links)
-                page += 1
-
-            print(f"\nTotal books to scrape: {len(all_book_links)}")
-            print(f"Processing in batches of {self.batch_size}...\n")
-
-            # Scrape books in batches
-            all_books = []
-            for i in range(0, len(all_book_links), self.batch_size):
-                batch = all_book_links[i:i + self.batch_size]
-                batch_num = i // self.batch_size + 1
-                total_batches = (len(all_book_links) + self.batch_size - 1) // self.batch_size
-
-                print(f"Processing batch {batch_num}/{total_batches} ({len(batch)} books)...")
-
-                tasks = [self.extract_book_data(session, link) for link in batch]
-                batch_results = await asyncio.gather(*tasks, return_exceptions=True)
-
-                # Filter out None values and exceptions
-                for result in batch_results:
-                    if result is not None and not isinstance(result, Exception):
-                        all_books.append(result)
-                    elif isinstance(result, Exception):
-                        print(f"Error in batch: {str(result)}")
-
-                print(f"Batch {batch_num} complete. Total scraped: {len(all_books)}")
-
-                # Small delay between batches to be respectful
-                if i + self.batch_size < len(all_book_links):
-                    await asyncio.sleep(1)
-
-            return all_books
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    last_page = max(last_page, task.result()['last_page'] or 0)
+        finally:
+            for task in pending:
+                task.cancel()
+
+        self.log.info('pages_discovered', f"Discovered {len(scheduled)} pages in collection {collection}",
+                      collection=collection, pages=len(scheduled))
+        return total_links
+
+    async def _probe_last_page(self, fetch_page, fetched, max_pages=None):
+        """Find the last non-empty page without a pagination widget: double until empty, then bisect"""
+        async def has_cards(page):
+            if max_pages and page > max_pages:
+                return False
+            if page not in fetched:
+                await fetch_page(page)
+            return fetched[page] > 0
+
+        low, high = 1, 2  # low is known to have cards
+        while await has_cards(high):
+            low, high = high, high * 2
+
+        while high - low > 1:
+            middle = (low + high) // 2
+            if await has_cards(middle):
+                low = middle
+            else:
+                high = middle
+        return low
+
+    async def _walk_sitemap(self, session, sitemap, crawl):
+        """Push every product listed in the sitemap into the queue, its <lastmod> as the card fingerprint"""
+        total_links = 0
+        async for url, lastmod in sitemap.iter_products(session):
+            if await crawl.enqueue({'url': url, 'fingerprint': lastmod}):
+                total_links += 1
+        self.log.info('sitemap_discovered', f"Discovered {sitemap.products} products in {sitemap.sitemaps} sitemaps",
+                      products=sitemap.products, sitemaps=sitemap.sitemaps)
+        return total_links
+
+    async def _detail_worker(self, session, crawl):
+        """Drain the card queue, scraping one book at a time until a stop sentinel arrives"""
+        while True:
+            card = await crawl.queue.get()
+            self.metrics.set('queue_depth', crawl.queue.qsize())
+            try:
+                if card is None:
+                    return
+
+                result = await self.extract_book_data(session, card['url'])
+                await crawl.emit(card, result)
+            finally:
+                crawl.queue.task_done()
+
+    async def _structured_worker(self, session, crawl):
+        """Drain the card queue a batch at a time, extracting each batch from one bulk JSON request"""
+        while True:
+            cards = [await crawl.queue.get()]
+            # Listing pages enqueue their cards in one go, so the batch fills without waiting
+            while cards[-1] is not None and len(cards) < self.batch_size and not crawl.queue.empty():
+                cards.append(crawl.queue.get_nowait())
+            self.metrics.set('queue_depth', crawl.queue.qsize())
+            try:
+                batch = [card for card in cards if card is not None]
+                if batch:
+                    for card, result in zip(batch, await self.extract_books_data(session, batch)):
+                        await crawl.emit(card, result)
+            finally:
+                for _ in cards:
+                    crawl.queue.task_done()
+            if cards[-1] is None:
+                return
+
+    async def _feed(self, session, crawl, workers, collection_urls, max_pages, sitemap):
+        """Queue the checkpoint's pending links and every discovered product, then one stop sentinel per worker"""
+        checkpoint = crawl.checkpoint
+        total_links = 0
+        if checkpoint and checkpoint.resuming:
+            pending = checkpoint.pending()
+            self.log.info('resume', f"Resuming: {len(checkpoint.done)} books already done, "
+                                    f"{len(pending)} pending",
+                          done=len(checkpoint.done), pending=len(pending))
+            for link in pending:
+                if await crawl.enqueue({'url': link}):
+                    total_links += 1
+
+        total_links += await self.discover_products(session, crawl, collection_urls, max_pages, sitemap)
+        self.log.info('frontier_complete', f"\nTotal books to scrape: {total_links}", links=total_links)
+        # The sentinels are queued behind the remaining cards
+        for _ in range(workers):
+            await crawl.queue.put(None)
+
+    async def discover_collections(self, session):
+        """Find collection URLs linked from the site navigation on the home page"""
+        content, encoding, _ = await self._fetch(session, self.base_url + '/')
+        return self.parser.parse_collection_links(self.parser.load(content, encoding), self.base_url)
+
+    async def scrape_collection(self, collection_url, max_pages=None, writer=None, checkpoint=None, delta=None,
+                                images=None):
+        """Scrape all books from a collection"""
+        return await self.scrape_collections([collection_url], max_pages, writer, checkpoint, delta, images)
+
+    async def discover_products(self, session, frontier, collection_urls=None, max_pages=None, sitemap=None):
+        """Push every product card from the collections' listing pages, or from the sitemap, into a frontier
+
+        The frontier is anything with an async enqueue(card, collection) that
+        returns whether the card was new: the in-process crawl, or a shared
+        work queue (see workqueue.py). Returns the number of new cards.
+        """
+        if sitemap:
+            return await self._walk_sitemap(session, sitemap, frontier)
+        if not collection_urls:
+            collection_urls = await self.discover_collections(session)
+            self.log.info('collections_discovered', f"Discovered {len(collection_urls)} collections",
+                          collections=collection_urls)
+        walked = await asyncio.gather(*[
+            self._walk_listing_pages(session, url, frontier, max_pages) for url in collection_urls
+        ])
+        return sum(walked)
+
+    async def scrape_sitemap(self, sitemap_url=None, writer=None, checkpoint=None, delta=None, images=None):
+        """Scrape every product listed in the sitemap (default: <base_url>/sitemap.xml)"""
+        return await self.scrape_collections(writer=writer, checkpoint=checkpoint, delta=delta, images=images,
+                                             sitemap=SitemapDiscovery(self, sitemap_url))
+
+    async def scrape_collections(self, collection_urls=None, max_pages=None, writer=None, checkpoint=None,
+                                 delta=None, images=None, sitemap=None):
+        """Scrape all books from several collections through one deduplicated frontier
+
+        All collections share one session, one limiter and one queue. A product
+        listed in several collections is fetched once and its record lists every
+        collection it was found in. Without collection_urls the collections are
+        discovered from the site navigation.
+
+        With a writer, records are streamed to it as they arrive and the returned
+        list is empty. With a checkpoint, links finished by an earlier run are
+        skipped and links it discovered but never finished are scraped first.
+        With a delta state, products whose listing card is unchanged since the
+        last run keep their previous record instead of being fetched again.
+        With an ImageFetcher, every record's image is downloaded alongside the
+        crawl, on the same session and limiters.
+
+        With a SitemapDiscovery, products come from the sitemap instead of the
+        collections' listing pages. Their records have no collections, and in
+        delta mode a product is fetched again only when its <lastmod> changed.
+
+        With extract='structured', the detail workers read batches of products
+        from the platform's bulk JSON instead of their pages (see structured.py).
+        Sitemap cards have no product id, so they still go through the pages.
+        """
+        self._start_parse_pool()
+        try:
+            async with self.session() as session:
+                # Listing pages feed a bounded queue that a pool of detail workers drains,
+                # so product pages are fetched while discovery is still running
+                crawl = _Crawl(self.queue_size, self.progress_every, writer, checkpoint, delta,
+                               self.metrics, self.log, images)
+                if images:
+                    images.start(session)
+
+                self.log.info('workers_started', f"Starting {self.num_workers} detail workers...\n",
+                              workers=self.num_workers)
+                worker = self._structured_worker if self.extract == 'structured' else self._detail_worker
+                workers = [asyncio.create_task(worker(session, crawl)) for _ in range(self.num_workers)]
+                feed = asyncio.create_task(self._feed(session, crawl, len(workers), collection_urls, max_pages,
+                                                      sitemap))
+                # A worker that fails (e.g. the writer raised) stops the crawl instead of leaving discovery
+                # blocked on a full queue that nothing drains any more
+                try:
+                    await run_until_failure([feed, *workers])
+                except BaseException:
+                    if images:
+                        await images.cancel()
+                    raise
+                if images:
+                    await images.join()
+
+                # Products found in another collection after their row was written
+                late = crawl.late_collections()
+                if late:
+                    self.log.info('late_collections',
+                                  f"Updating collections of {len(late)} books found in more collections later",
+                                  books=len(late))
+                    if writer:
+                        writer.rewrite_column('url', 'collections', late)
+                    else:
+                        for book in crawl.books:
+                            book['collections'] = late.get(book['url'], book['collections'])
+
+                self.log.info('crawl_complete', f"Scraping complete. Total scraped: {crawl.scraped} "
+                                                f"(final concurrency: {self.limiter.limit})",
+                              scraped=crawl.scraped, concurrency=self.limiter.limit)
+                if delta:
+                    self.log.info('delta_summary', f"Delta: {delta.carried} unchanged books carried forward",
+                                  carried=delta.carried)
+                if images:
+                    self.log.info('image_summary', images.summary(), downloaded=images.downloaded,
+                                  duplicates=images.duplicates, skipped=images.skipped, failed=images.failed,
+                                  bytes=images.bytes)
+                if self.cache:
+                    self.log.info('cache_summary', f"Cache: {self.cache.hits} pages unchanged, "
+                                                   f"{self.cache.misses} downloaded",
+                                  hits=self.cache.hits, misses=self.cache.misses)
+                return crawl.books
+        finally:
+            self._stop_parse_pool()
 
     def save_to_csv(self, books, filename='books_data.csv'):
         """Save scraped data to CSV"""
@@ -291,17 +696,146 @@ class AlininoScraper:
 
         print(f"Saved {len(books)} books to {filename}")
 
-async def main():
-    scraper = AlininoScraper()
+    def save_to_history(self, books, filename='price_history.sqlite'):
+        """Append scraped data as a snapshot to the price history, keeping only changed products"""
+        with PriceHistory(filename) as history:
+            crawl_id, changed = history.add_snapshot(books)
+        print(f"Recorded crawl {crawl_id} in {filename}: {changed} of {len(books)} books changed")
 
-    # Scrape bestsellers collection - all pages
-    collection_url = "https://alinino.az/collection/bestsellery"
-
-    # Scrape all pages
-    books = await scraper.scrape_collection(collection_url)
-
-    # Save to CSV
-    scraper.save_to_csv(books, 'alinino_books.csv')
+async def main():
+    parser = argparse.ArgumentParser(description='Scrape books from alinino.az')
+    parser.add_argument('--collection', action='append', dest='collections',
+                        help='Collection URL to scrape; repeat for several (default: bestsellers)')
+    parser.add_argument('--discover-collections', action='store_true',
+                        help='Scrape every collection linked from the site navigation')
+    parser.add_argument('--discover', choices=['listing', 'sitemap'], default='listing',
+                        help="Find products on the collections' listing pages, or in the sitemap")
+    parser.add_argument('--sitemap', help='Sitemap URL for --discover sitemap (default: /sitemap.xml)')
+    parser.add_argument('--extract', choices=['html', 'structured'], default='html',
+                        help="Read books from their product pages, or in batches from the shop's product JSON")
+    parser.add_argument('--html-fields', nargs='+', choices=FIELDNAMES, default=[], metavar='FIELD',
+                        help=f"With --extract structured, still take these fields from the product page "
+                             f"(the JSON has no {', '.join(HTML_ONLY_FIELDS)})")
+    parser.add_argument('--output', default='alinino_books.csv', help='Output file (.csv, .jsonl or .parquet)')
+    parser.add_argument('--format', choices=['csv', 'jsonl', 'parquet'], help='Output format (default: from extension)')
+    parser.add_argument('--row-group-size', type=int, default=10000, help='Records per Parquet row group')
+    parser.add_argument('--checkpoint', help='Frontier checkpoint file (default: <output>.checkpoint)')
+    parser.add_argument('--fsync-every', type=int, default=50, help='Records between fsyncs')
+    parser.add_argument('--max-pages', type=int, help='Stop after this many collection pages')
+    parser.add_argument('--parser', choices=['lxml', 'soup'], help='HTML parser backend (default: lxml)')
+    parser.add_argument('--parse-workers', type=int, default=0,
+                        help='Parse pages in a pool of this many workers (default: on the event loop)')
+    parser.add_argument('--parse-executor', choices=['process', 'thread'], default='process',
+                        help='Pool type for --parse-workers')
+    parser.add_argument('--cache', help='Persistent HTTP cache file for conditional requests')
+    parser.add_argument('--cache-max-mb', type=int, default=512, help='Cache size cap (LRU eviction)')
+    parser.add_argument('--cache-ttl', type=float, help='Use cached pages younger than this many seconds as-is')
+    parser.add_argument('--offline', action='store_true', help='Replay from --cache without network access')
+    parser.add_argument('--concurrency', type=int, default=5, help='Initial concurrent requests')
+    parser.add_argument('--max-concurrency', type=int, default=32, help='Ceiling for adaptive concurrency')
+    parser.add_argument('--rate-limit', type=float, default=10.0, help='Max requests per second per host (0 for no cap)')
+    parser.add_argument('--max-retries', type=int, default=4, help='Retries for throttled or failed requests')
+    parser.add_argument('--http-backend', choices=BACKENDS, default='aiohttp',
+                        help='HTTP client; httpx speaks HTTP/2 to servers that offer it (needs httpx[http2])')
+    parser.add_argument('--keepalive', type=float, default=KEEPALIVE,
+                        help='Seconds to keep idle connections open (0 closes each after its response)')
+    parser.add_argument('--dns-ttl', type=int, default=DNS_TTL, help='Seconds to cache resolved host addresses')
+    parser.add_argument('--no-compression', action='store_true', help='Ask for uncompressed responses')
+    parser.add_argument('--delta', help='Delta state file: only fetch products whose listing card changed')
+    parser.add_argument('--history', help='Also append this crawl to a price history SQLite file')
+    parser.add_argument('--search-index', help='Also add new and changed books to this full-text search index')
+    parser.add_argument('--images', help='Download product images into this content-addressed directory')
+    parser.add_argument('--image-bandwidth', type=parse_size,
+                        help='Cap image downloads at this many bytes per second (e.g. 512K, 2M)')
+    parser.add_argument('--image-workers', type=int, default=8, help='Concurrent image downloads')
+    parser.add_argument('--metrics-port', type=int, help='Serve Prometheus metrics on this port during the crawl')
+    parser.add_argument('--metrics-json', help='Append JSON metrics snapshots to this file')
+    parser.add_argument('--metrics-interval', type=float, default=10.0, help='Seconds between JSON snapshots')
+    parser.add_argument('--log-format', choices=['text', 'json'], default='text',
+                        help='Progress output as plain text or JSON lines')
+    args = parser.parse_args()
+
+    if args.offline and not args.cache:
+        parser.error('--offline requires --cache')
+    if args.offline and args.discover == 'sitemap':
+        parser.error('--discover sitemap streams the sitemap and cannot run --offline')
+    if args.offline and args.extract == 'structured':
+        parser.error('--extract structured reads uncached product JSON and cannot run --offline')
+    if args.http_backend == 'httpx' and not (importlib.util.find_spec('httpx') and importlib.util.find_spec('h2')):
+        parser.error('--http-backend httpx needs httpx with HTTP/2 support: pip install httpx[http2]')
+    cache = None
+    if args.cache:
+        cache = ResponseCache(args.cache, max_bytes=args.cache_max_mb * 1024 * 1024,
+                              ttl=args.cache_ttl, offline=args.offline)
+
+    scraper = AlininoScraper(max_concurrent=args.concurrency, max_concurrent_limit=args.max_concurrency,
+                             rate_limit=args.rate_limit, max_retries=args.max_retries,
+                             parser=args.parser, parse_workers=args.parse_workers,
+                             parse_executor=args.parse_executor, cache=cache,
+                             log=CrawlLog(args.log_format), extract=args.extract, html_fields=args.html_fields,
+                             http_backend=args.http_backend, keepalive=args.keepalive, dns_ttl=args.dns_ttl,
+                             compress=not args.no_compression,
+                             image_workers=args.image_workers if args.images else 0)
+    exporter = MetricsExporter(scraper.metrics, port=args.metrics_port, json_path=args.metrics_json,
+                               interval=args.metrics_interval)
+
+    delta = DeltaState(args.delta) if args.delta else None
+    if record_format(args.output, args.format) == 'parquet':
+        # A Parquet file is unreadable until its footer is written, so there is nothing to resume from
+        checkpoint = None
+        writer = ParquetRecordWriter(args.output, FIELDNAMES, FIELD_TYPES, row_group_size=args.row_group_size)
+    else:
+        # A leftover checkpoint means the previous run did not finish, so pick up where it stopped
+        checkpoint = CrawlCheckpoint(args.checkpoint or f"{args.output}.checkpoint")
+        writer = RecordWriter(args.output, FIELDNAMES, fmt=args.format, fsync_every=args.fsync_every,
+                              resume_offset=checkpoint.offset, on_sync=checkpoint.sync)
+    extra_writers = []
+    history = PriceHistory(args.history) if args.history else None
+    if history:
+        crawl_id = history.begin_crawl()
+        extra_writers.append(history)
+    search_index = None
+    if args.search_index:
+        from search_index import SearchIndex
+
+        search_index = SearchIndex(args.search_index)
+        extra_writers.append(search_index)
+    if extra_writers:
+        writer = TeeWriter(writer, *extra_writers)
+
+    image_store = ImageStore(args.images) if args.images else None
+    images = None
+    if image_store:
+        images = ImageFetcher(scraper, image_store, bandwidth=args.image_bandwidth, workers=args.image_workers)
+
+    await exporter.start()
+    try:
+        collections = None if args.discover_collections else (args.collections or [DEFAULT_COLLECTION])
+        sitemap = SitemapDiscovery(scraper, args.sitemap) if args.discover == 'sitemap' else None
+        async with scraper:
+            await scraper.scrape_collections(collections, max_pages=args.max_pages, writer=writer,
+                                             checkpoint=checkpoint, delta=delta, images=images, sitemap=sitemap)
+    finally:
+        await exporter.stop()
+        writer.close()
+        if image_store:
+            image_store.close()
+        if checkpoint:
+            checkpoint.close()
+        if cache:
+            cache.close()
+
+    scraper.log.info('saved', f"Saved {writer.count} books to {args.output}", books=writer.count, output=args.output)
+    if history:
+        scraper.log.info('history', f"Recorded crawl {crawl_id} in {args.history}: {history.changed} books changed",
+                         crawl=crawl_id, changed=history.changed)
+    if search_index:
+        scraper.log.info('search_index', f"Indexed {search_index.indexed} new or changed books in {args.search_index}",
+                         indexed=search_index.indexed)
+    if checkpoint:
+        checkpoint.remove()
+    if delta:
+        delta.save()
 
 if __name__ == "__main__":
     asyncio.run(main())
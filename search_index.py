@@ -0,0 +1,347 @@
+"""Full-text search over scraped books with an inverted index in SQLite
+
+Titles, authors, publishers, categories and descriptions are tokenized with
+Azerbaijani-aware folding (ə -> e, ı/İ -> i, ş -> s, ...) and case folding,
+so "Əli və Nino" matches "eli ve nino". Queries are ranked with BM25F: term
+frequencies are weighted per field (a title hit counts more than a
+description hit) before BM25 saturation. A query only reads the postings of
+its own terms, never the dataset.
+
+    python search_index.py books.idx add alinino_books.csv   # or .jsonl / .parquet
+    python search_index.py books.idx search "xalq nağılları" --limit 5
+"""
+import argparse
+import functools
+import hashlib
+import json
+import math
+import re
+import sqlite3
+import unicodedata
+from array import array
+
+from history import product_key
+from records import as_text
+from storage import read_records
+
+# Indexed fields and their weight in the BM25F term frequency
+FIELD_BOOSTS = {
+    'title': 3.0,
+    'author': 2.0,
+    'publisher': 1.5,
+    'categories': 1.0,
+    'description': 1.0,
+}
+FIELDS = list(FIELD_BOOSTS)
+K1 = 1.2
+B = 0.75
+
+_TOKEN = re.compile(r'\w+')
+
+
+@functools.lru_cache(maxsize=None)
+def _marks():
+    """Every combining mark in the BMP as one character class, built on first use rather than at import"""
+    return re.compile('[%s]' % ''.join(
+        re.escape(chr(cp)) for cp in range(0x10000) if unicodedata.combining(chr(cp))
+    ))
+
+
+def normalize(text):
+    """Fold Azerbaijani letters to ASCII-like forms and casefold"""
+    # ə and ı have no decomposition and are replaced by hand; ç, ğ, ö, ş, ü (and İ, which casefolds
+    # to i plus a combining dot) lose their combining marks after NFKD
+    text = text.casefold().replace('ə', 'e').replace('ı', 'i')
+    return _marks().sub('', unicodedata.normalize('NFKD', text))
+
+
+def tokenize(text):
+    return _TOKEN.findall(normalize(text)) if text else []
+
+
+class SearchIndex:
+    """Inverted index of book records, usable as a record writer next to the CSV/JSONL output
+
+    write() buffers records and indexes them every batch_size records. A
+    record whose indexed text is unchanged since it was last indexed is
+    skipped; a changed one replaces its old postings, so re-crawls update
+    the index in place.
+    """
+
+    def __init__(self, filename, batch_size=500):
+        self.filename = filename
+        self.batch_size = batch_size
+        self.count = 0  # Records seen
+        self.indexed = 0  # Records (re)indexed because they were new or changed
+        self._pending = []
+        self._term_ids = None
+        self._stats = None
+
+        self._db = sqlite3.connect(filename)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(f'''
+            CREATE TABLE IF NOT EXISTS docs (
+                id INTEGER PRIMARY KEY,
+                key TEXT NOT NULL UNIQUE,
+                hash TEXT NOT NULL,
+                title TEXT, author TEXT, url TEXT,
+                {', '.join(f'len_{field} INTEGER NOT NULL' for field in FIELDS)},
+                terms BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS terms (
+                id INTEGER PRIMARY KEY,
+                term TEXT NOT NULL UNIQUE
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term_id INTEGER NOT NULL,
+                doc_id INTEGER NOT NULL,
+                {', '.join(f'{field} INTEGER NOT NULL' for field in FIELDS)},
+                PRIMARY KEY (term_id, doc_id)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        ''')
+        self._db.commit()
+
+    # Indexing
+
+    def write(self, record):
+        self._pending.append(record)
+        self.count += 1
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+
+    def add(self, records):
+        """Index records (an iterable of dicts); returns how many were new or changed"""
+        before = self.indexed
+        for record in records:
+            self.write(record)
+        self.sync()
+        return self.indexed - before
+
+    def _load(self):
+        if self._term_ids is None:
+            self._term_ids = dict(self._db.execute('SELECT term, id FROM terms'))
+            self._stats = self.stats()
+
+    def _term_id(self, term, new_terms):
+        term_id = self._term_ids.get(term)
+        if term_id is None:
+            term_id = self._term_ids[term] = len(self._term_ids) + 1
+            new_terms.append((term_id, term))
+        return term_id
+
+    def _flush(self):
+        self._load()
+        batch = {product_key(record): record for record in self._pending}
+        self._pending = []
+        known = {}
+        for i in range(0, len(batch), 500):
+            keys = list(batch)[i:i + 500]
+            known.update((key, (doc_id, digest, terms)) for key, doc_id, digest, terms in self._db.execute(
+                f"SELECT key, id, hash, terms FROM docs WHERE key IN ({', '.join('?' * len(keys))})", keys
+            ))
+
+        new_terms = []
+        removed = []
+        docs = []
+        postings = []
+        stats = self._stats
+        for key, record in batch.items():
+            # Categories read back from a JSONL export are a list
+            texts = [as_text(record.get(field)) or '' for field in FIELDS]
+            digest = hashlib.sha1('\x1f'.join(texts).encode('utf-8')).hexdigest()
+            old = known.get(key)
+            if old and old[1] == digest:
+                continue
+            if old:
+                doc_id = old[0]
+                removed.extend((term_id, doc_id) for term_id in array('I', old[2]))
+                self._forget_lengths(doc_id)
+            else:
+                doc_id = stats['next_id']
+                stats['next_id'] += 1
+
+            frequencies = {}
+            lengths = []
+            for i, text in enumerate(texts):
+                tokens = tokenize(text)
+                lengths.append(len(tokens))
+                for token in tokens:
+                    counts = frequencies.get(token)
+                    if counts is None:
+                        counts = frequencies[token] = [0] * len(FIELDS)
+                    counts[i] += 1
+            term_ids = array('I')
+            for term, counts in frequencies.items():
+                term_id = self._term_id(term, new_terms)
+                term_ids.append(term_id)
+                postings.append((term_id, doc_id, *counts))
+            docs.append((doc_id, key, digest, record.get('title'), record.get('author'), record.get('url'),
+                         *lengths, term_ids.tobytes()))
+            for field, length in zip(FIELDS, lengths):
+                stats['lengths'][field] += length
+            stats['docs'] += 0 if old else 1
+
+        if not docs:
+            return
+        with self._db:
+            self._db.executemany('INSERT INTO terms (id, term) VALUES (?, ?)', new_terms)
+            self._db.executemany('DELETE FROM postings WHERE term_id = ? AND doc_id = ?', removed)
+            self._db.executemany(
+                f"INSERT OR REPLACE INTO docs VALUES ({', '.join('?' * (len(FIELDS) + 7))})", docs
+            )
+            self._db.executemany(
+                f"INSERT INTO postings VALUES ({', '.join('?' * (len(FIELDS) + 2))})", postings
+            )
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('stats', ?)", (json.dumps(stats),))
+        self.indexed += len(docs)
+
+    def _forget_lengths(self, doc_id):
+        """Take a stored document's field lengths out of the collection totals"""
+        row = self._db.execute(
+            f"SELECT {', '.join(f'len_{field}' for field in FIELDS)} FROM docs WHERE id = ?", (doc_id,)
+        ).fetchone()
+        for field, length in zip(FIELDS, row):
+            self._stats['lengths'][field] -= length
+
+    def remove(self, key):
+        """Drop a product (by product id or URL) from the index"""
+        self.sync()
+        self._load()
+        row = self._db.execute('SELECT id, terms FROM docs WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return False
+        doc_id, terms = row
+        self._forget_lengths(doc_id)
+        self._stats['docs'] -= 1
+        with self._db:
+            self._db.executemany('DELETE FROM postings WHERE term_id = ? AND doc_id = ?',
+                                 [(term_id, doc_id) for term_id in array('I', terms)])
+            self._db.execute('DELETE FROM docs WHERE id = ?', (doc_id,))
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('stats', ?)", (json.dumps(self._stats),))
+        return True
+
+    def sync(self):
+        if self._pending:
+            self._flush()
+
+    def rewrite_column(self, key, column, values):
+        """Collection membership is not indexed"""
+
+    def close(self):
+        self.sync()
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # Searching
+
+    def stats(self):
+        """Document count, next free doc id and total token count per field"""
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'stats'").fetchone()
+        if row:
+            return json.loads(row[0])
+        return {'docs': 0, 'next_id': 1, 'lengths': dict.fromkeys(FIELDS, 0)}
+
+    def vocabulary_size(self):
+        return self._db.execute('SELECT COUNT(*) FROM terms').fetchone()[0]
+
+    def search(self, query, limit=10):
+        """Best matching books for a query, as dicts with score, key, title, author and url
+
+        Any query term may match; documents matching more (and rarer) terms,
+        and matching them in boosted fields, rank first.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        stats = self.stats()
+        n = stats['docs']
+        if not n:
+            return []
+        averages = {field: (stats['lengths'][field] / n) or 1.0 for field in FIELDS}
+
+        # Postings of every query term, then the field lengths of the documents they hit
+        matches = {}
+        for term in terms:
+            rows = self._db.execute(f'''
+                SELECT p.doc_id, {', '.join(f'p.{field}' for field in FIELDS)}
+                FROM terms AS t JOIN postings AS p ON p.term_id = t.id
+                WHERE t.term = ?
+            ''', (term,)).fetchall()
+            if rows:
+                matches[term] = rows
+        doc_ids = {row[0] for rows in matches.values() for row in rows}
+        lengths = {}
+        ids = list(doc_ids)
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            for row in self._db.execute(
+                f"SELECT id, {', '.join(f'len_{field}' for field in FIELDS)} FROM docs "
+                f"WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+            ):
+                lengths[row[0]] = row[1:]
+
+        norms = {}
+        for doc_id, doc_lengths in lengths.items():
+            norms[doc_id] = [
+                FIELD_BOOSTS[field] / (1 - B + B * length / averages[field])
+                for field, length in zip(FIELDS, doc_lengths)
+            ]
+
+        scores = {}
+        for term, rows in matches.items():
+            idf = math.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+            for doc_id, *counts in rows:
+                tf = sum(count * weight for count, weight in zip(counts, norms[doc_id]) if count)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf / (K1 + tf)
+
+        best = sorted(scores.items(), key=lambda item: -item[1])[:limit]
+        results = []
+        for doc_id, score in best:
+            key, title, author, url = self._db.execute(
+                'SELECT key, title, author, url FROM docs WHERE id = ?', (doc_id,)
+            ).fetchone()
+            results.append({'score': round(score, 4), 'key': key, 'title': title, 'author': author, 'url': url})
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query the full-text search index')
+    parser.add_argument('index', help='Index SQLite file')
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add', help='Index (or update from) a CSV, JSONL or Parquet export')
+    add.add_argument('data_file')
+    search = commands.add_parser('search', help='Ranked search over title, author, publisher, categories, description')
+    search.add_argument('query')
+    search.add_argument('--limit', type=int, default=10)
+    search.add_argument('--json', action='store_true', help='Print results as JSON')
+    commands.add_parser('stats', help='Show index size')
+    args = parser.parse_args()
+
+    with SearchIndex(args.index) as index:
+        if args.command == 'add':
+            changed = index.add(read_records(args.data_file))
+            print(f"Indexed {changed} new or changed of {index.count} books")
+        elif args.command == 'search':
+            results = index.search(args.query, limit=args.limit)
+            if args.json:
+                print(json.dumps(results, ensure_ascii=False, indent=2))
+            else:
+                for result in results:
+                    author = f" — {result['author']}" if result['author'] else ''
+                    print(f"{result['score']:7.3f}  {result['title']}{author}\n         {result['url']}")
+        else:
+            print(f"{index.stats()['docs']} books, {index.vocabulary_size()} terms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""Product discovery from the shop's sitemap.xml instead of its listing pages
+
+The sitemap index and every sitemap it links are streamed and parsed
+incrementally, so memory stays flat however many products they list, and
+the whole catalog is discovered in a handful of requests instead of one
+rendered listing page per 20-odd products. Each product's <lastmod> becomes
+its card fingerprint, so with a delta state (scraper.py --discover sitemap
+--delta FILE) only products modified since the last run are fetched again.
+
+    python sitemap.py                       # count the products in the live sitemap
+    python sitemap.py --list | head
+"""
+import argparse
+import asyncio
+import time
+import zlib
+from xml.etree.ElementTree import ParseError, XMLPullParser
+
+import aiohttp
+
+from parsers import canonical_url
+from throttle import RETRY_STATUSES, parse_retry_after
+
+PRODUCT_PATH = '/product/'
+CHUNK_SIZE = 64 * 1024
+
+
+class SitemapError(Exception):
+    """A sitemap could not be downloaded (error status, or retries exhausted)"""
+
+
+class SitemapParser:
+    """Incremental parser for a sitemap or sitemap index, fed the body chunk by chunk
+
+    feed() returns the entries completed so far as (kind, loc, lastmod), kind
+    being 'url' or 'sitemap' (a nested sitemap of an index). Finished entries
+    are dropped from the tree at once, so memory is bounded by one entry.
+    Gzipped sitemaps (sitemap.xml.gz) are recognised by their magic bytes.
+    """
+
+    def __init__(self):
+        self._parser = XMLPullParser(events=('start', 'end'))
+        self._decompress = None
+        self._started = False
+        self._root = None
+        self._depth = 0
+        self._entry = {}
+
+    def feed(self, chunk):
+        if not self._started:
+            self._started = True
+            if chunk[:2] == b'\x1f\x8b':
+                self._decompress = zlib.decompressobj(wbits=31)
+        if self._decompress:
+            chunk = self._decompress.decompress(chunk)
+        self._parser.feed(chunk)
+        return self._entries()
+
+    def close(self):
+        self._parser.close()
+        return self._entries()
+
+    def _entries(self):
+        entries = []
+        for event, element in self._parser.read_events():
+            if event == 'start':
+                self._depth += 1
+                if self._root is None:
+                    self._root = element
+                continue
+            self._depth -= 1
+            tag = element.tag.rpartition('}')[2]
+            # Only direct children of <url>/<sitemap>: image and news extensions nest their own <loc>
+            if self._depth == 2 and tag in ('loc', 'lastmod'):
+                self._entry[tag] = (element.text or '').strip()
+            elif self._depth == 1 and tag in ('url', 'sitemap'):
+                if self._entry.get('loc'):
+                    entries.append((tag, self._entry['loc'], self._entry.get('lastmod', '')))
+                self._entry = {}
+                self._root.clear()
+        return entries
+
+
+class SitemapDiscovery:
+    """Walk a sitemap index and its sitemaps through a scraper's rate limiter and retry policy
+
+    iter_products() yields (canonical url, lastmod) for every product page listed,
+    lastmod being '' when the sitemap has none.
+    """
+
+    def __init__(self, scraper, sitemap_url=None, product_path=PRODUCT_PATH, chunk_size=CHUNK_SIZE):
+        self.scraper = scraper
+        self.sitemap_url = sitemap_url or f"{scraper.base_url}/sitemap.xml"
+        self.product_path = product_path
+        self.chunk_size = chunk_size
+        self.sitemaps = 0  # Sitemaps read, the index included
+        self.urls = 0  # <url> entries seen, products or not
+        self.products = 0
+
+    async def iter_products(self, session):
+        pending = [self.sitemap_url]
+        seen = set(pending)
+        while pending:
+            url = pending.pop()
+            found = 0
+            try:
+                async for kind, loc, lastmod in self._entries(session, url):
+                    if kind == 'sitemap':
+                        if loc not in seen:
+                            seen.add(loc)
+                            pending.append(loc)
+                        continue
+                    self.urls += 1
+                    if self.product_path in loc:
+                        found += 1
+                        self.products += 1
+                        yield canonical_url(loc), lastmod
+            except (SitemapError, ParseError, zlib.error) as e:
+                self.scraper.metrics.inc('scrape_errors_total', error=type(e).__name__)
+                self.scraper.log.warning('sitemap_error', f"Error reading sitemap {url}: {e}", url=url, error=str(e))
+                continue
+            self.sitemaps += 1
+            self.scraper.log.info('sitemap_parsed', f"Found {found} products in {url}", url=url, products=found)
+
+    async def _entries(self, session, url):
+        """Stream one sitemap, yielding its entries as the body arrives, with retries
+
+        Unlike page requests this takes no concurrency slot: entries are
+        yielded while the frontier queue may be full, and a slot held then
+        would be missing to the detail workers that drain it. A retry after a
+        failure mid-body yields the first entries again; the frontier queues
+        every product once, so that is harmless.
+        """
+        scraper = self.scraper
+        retry = scraper.retry
+        # No total timeout: a sitemap of 50,000 URLs is a sizeable download
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=30)
+        for attempt in range(retry.max_retries + 1):
+            retry_after = None
+            await scraper.rate_limiter.acquire(url)
+            started = time.perf_counter()
+            try:
+                async with session.get(url, headers=scraper.headers, timeout=timeout) as response:
+                    status = response.status
+                    scraper.metrics.inc('responses_total', status=status)
+                    if status == 200:
+                        parser = SitemapParser()
+                        size = 0
+                        async for chunk in response.content.iter_chunked(self.chunk_size):
+                            size += len(chunk)
+                            for entry in parser.feed(chunk):
+                                yield entry
+                        for entry in parser.close():
+                            yield entry
+                        scraper.metrics.observe('request_seconds', time.perf_counter() - started)
+                        scraper.metrics.inc('response_bytes_total', size)
+                        return
+                    retry_after = response.headers.get('Retry-After')
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                scraper.metrics.inc('request_errors_total', error=type(e).__name__)
+                reason = str(e) or type(e).__name__
+            else:
+                if status not in RETRY_STATUSES:
+                    raise SitemapError(f"HTTP {status}")
+                reason = f"HTTP {status}"
+                retry_after = parse_retry_after(retry_after)
+                if retry_after:
+                    scraper.rate_limiter.pause(url, retry_after)
+            if attempt == retry.max_retries:
+                raise SitemapError(f"{reason}, giving up after {attempt + 1} attempts")
+            await asyncio.sleep(retry.delay(attempt, retry_after))
+
+
+def main():
+    from scraper import AlininoScraper
+
+    parser = argparse.ArgumentParser(description="List the product pages in the shop's sitemap")
+    parser.add_argument('--sitemap', help='Sitemap or sitemap index URL (default: <base-url>/sitemap.xml)')
+    parser.add_argument('--base-url', default='https://alinino.az')
+    parser.add_argument('--list', action='store_true', help='Print every product URL with its lastmod')
+    args = parser.parse_args()
+
+    scraper = AlininoScraper(base_url=args.base_url)
+    discovery = SitemapDiscovery(scraper, args.sitemap)
+
+    async def run():
+        async with scraper.session() as session:
+            async for url, lastmod in discovery.iter_products(session):
+                if args.list:
+                    print(f"{url}\t{lastmod}")
+
+    started = time.perf_counter()
+    asyncio.run(run())
+    print(f"{discovery.products} products of {discovery.urls} URLs in {discovery.sitemaps} sitemaps "
+          f"({time.perf_counter() - started:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,524 @@
+"""Single-pass, mergeable statistics over book records
+
+BookStats consumes the data in chunks (DataFrames from a chunked reader,
+or batches of records straight from the scraper) and keeps only bounded
+accumulators, so any dataset size can be summarized in one pass. Two
+aggregators built over different parts of the data can be merged.
+"""
+import math
+from fractions import Fraction
+
+import numpy as np
+import pandas as pd
+
+NUMERIC_COLUMNS = ['current_price_numeric', 'old_price_numeric', 'discount_numeric',
+                   'pages_numeric', 'rating_numeric', 'reviews_count']
+TEXT_COLUMNS = ['language', 'publisher', 'author', 'cover_type', 'availability']
+# Several values per book: lists in JSONL and Parquet, ', '-joined text in CSV
+LIST_COLUMNS = ['labels', 'categories']
+COLUMNS = NUMERIC_COLUMNS + TEXT_COLUMNS + LIST_COLUMNS
+# Added by dedup.py; read when present so authors are counted per work rather than per edition
+WORK_COLUMN = 'work_id'
+
+
+def read_frames(path, columns, chunksize=100000):
+    """A CSV, JSONL or Parquet file as DataFrames of chunksize rows, reading only the given columns
+
+    Columns the file does not have come back all null.
+    """
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        source = pq.ParquetFile(path)
+        present = [column for column in columns if column in source.schema_arrow.names]
+        for batch in source.iter_batches(batch_size=chunksize, columns=present):
+            yield batch.to_pandas().reindex(columns=columns)
+    elif path.endswith('.jsonl'):
+        for chunk in pd.read_json(path, lines=True, chunksize=chunksize, dtype=False):
+            yield chunk.reindex(columns=columns)
+    else:
+        wanted = set(columns)
+        for chunk in pd.read_csv(path, usecols=lambda column: column in wanted, chunksize=chunksize):
+            yield chunk.reindex(columns=columns)
+
+
+def explode(column):
+    """The distinct values of each row of a labels or categories column
+
+    Returns (rows, codes, uniques): for every value, the position of its row
+    and its index in uniques (in order of first appearance), sorted by row.
+    Rows may hold lists or ', '-joined text; a value listed twice in a row is
+    kept once, so it counts once per book.
+    """
+    column = pd.Series(column, dtype=object).reset_index(drop=True)
+    # Text is split, lists (NaN after the split) are taken as they are
+    split = column.str.split(',')
+    values = split.where(split.notna(), column).explode().dropna()
+    values = values.astype(str).str.strip()
+    values = values[values != '']
+    codes, uniques = pd.factorize(values.to_numpy())
+    keys = np.unique(values.index.to_numpy(np.int64) * max(len(uniques), 1) + codes)
+    rows, codes = np.divmod(keys, max(len(uniques), 1))
+    return rows, codes, list(uniques)
+
+
+def _add_exact(partials, values):
+    """Add values to a running sum kept as exact non-overlapping partials (Shewchuk, as in math.fsum)"""
+    for x in values:
+        i = 0
+        for y in partials:
+            if abs(x) < abs(y):
+                x, y = y, x
+            hi = x + y
+            lo = y - (hi - x)
+            if lo:
+                partials[i] = lo
+                i += 1
+            x = hi
+        partials[i:] = [x]
+    return partials
+
+
+def _square_terms(values):
+    """Squares of values as three arrays of terms whose sum is exact (Veltkamp split)"""
+    scaled = values * 134217729.0  # 2**27 + 1
+    high = scaled - (scaled - values)
+    low = values - high
+    return np.concatenate([high * high, 2 * high * low, low * low])
+
+
+def _chunk_sum(values):
+    """A chunk's sum as (rounded sum, rounding error), both from math.fsum, so ~106 bits of precision"""
+    total = math.fsum(values)
+    return total, math.fsum(np.append(values, -total))
+
+
+class QuantileSketch:
+    """Quantiles from exact value counts, degrading to a log-bucket sketch when values get too many
+
+    While there are at most max_exact distinct values the counts are exact and
+    quantiles match numpy's linear interpolation. Beyond that values are
+    folded into logarithmic buckets (as in DDSketch) with the given relative
+    accuracy, so memory stays bounded whatever the input size.
+    """
+
+    def __init__(self, max_exact=100000, relative_accuracy=0.01):
+        self.max_exact = max_exact
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.counts = {}  # Exact value -> count, or bucket key -> count once sketched
+        self.exact = True
+        self.count = 0
+
+    def _key(self, value):
+        # Buckets of positive and negative values are keyed apart; zero has its own key
+        if value == 0:
+            return 0
+        key = math.ceil(math.log(abs(value), self.gamma)) + 1
+        return key if value > 0 else -key
+
+    def _value(self, key):
+        if key == 0:
+            return 0.0
+        magnitude = 2 * self.gamma ** (abs(key) - 1) / (self.gamma + 1)
+        return magnitude if key > 0 else -magnitude
+
+    def _fold(self):
+        buckets = {}
+        for value, count in self.counts.items():
+            key = self._key(value)
+            buckets[key] = buckets.get(key, 0) + count
+        self.counts = buckets
+        self.exact = False
+
+    def add_counts(self, values, counts):
+        """Add distinct values with their multiplicities"""
+        target = self.counts
+        if self.exact:
+            for value, count in zip(values.tolist(), counts.tolist()):
+                target[value] = target.get(value, 0) + count
+            if len(target) > self.max_exact:
+                self._fold()
+        else:
+            for value, count in zip(values.tolist(), counts.tolist()):
+                key = self._key(value)
+                target[key] = target.get(key, 0) + count
+        self.count += int(counts.sum())
+
+    def add(self, values):
+        if len(values):
+            self.add_counts(*np.unique(values, return_counts=True))
+
+    def merge(self, other):
+        if not other.exact and self.exact:
+            self._fold()
+        if other.exact:
+            self.add_counts(np.array(list(other.counts), dtype=float),
+                            np.array(list(other.counts.values()), dtype=np.int64))
+        else:
+            for key, count in other.counts.items():
+                self.counts[key] = self.counts.get(key, 0) + count
+            self.count += other.count
+
+    def distribution(self):
+        """Sorted distinct values (or bucket midpoints) and their counts"""
+        if self.exact:
+            values = np.array(sorted(self.counts), dtype=float)
+            counts = np.array([self.counts[v] for v in values.tolist()], dtype=np.int64)
+        else:
+            keys = sorted(self.counts, key=self._value)
+            values = np.array([self._value(k) for k in keys], dtype=float)
+            counts = np.array([self.counts[k] for k in keys], dtype=np.int64)
+        return values, counts
+
+    def _at_rank(self, values, cumulative, rank):
+        return values[int(np.searchsorted(cumulative, rank, side='right'))]
+
+    def quantile(self, q):
+        if not self.count:
+            return math.nan
+        values, counts = self.distribution()
+        cumulative = np.cumsum(counts)
+        position = q * (self.count - 1)
+        low = self._at_rank(values, cumulative, math.floor(position))
+        if not self.exact:
+            return float(low)
+        high = self._at_rank(values, cumulative, math.ceil(position))
+        return float(low + (high - low) * (position - math.floor(position)))
+
+
+class NumericSummary:
+    """Count, sum, variance, min/max and quantiles of one numeric column
+
+    Sums of values and of squares are kept as exact partials of each chunk's
+    fsum and its rounding error (squares split exactly into three terms), so
+    mean and standard deviation come out the same however the data is chunked
+    or merged, and match a two-pass computation over the whole column.
+    """
+
+    def __init__(self, max_exact=100000):
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sum_partials = []
+        self.square_partials = []
+        self.sketch = QuantileSketch(max_exact)
+
+    def add(self, values):
+        """Add a chunk of values (NaN already removed)"""
+        if not len(values):
+            return
+        self.count += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        _add_exact(self.sum_partials, _chunk_sum(values))
+        _add_exact(self.square_partials, _chunk_sum(_square_terms(values)))
+        self.sketch.add(values)
+
+    def merge(self, other):
+        if other.count:
+            self.count += other.count
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+            _add_exact(self.sum_partials, other.sum_partials)
+            _add_exact(self.square_partials, other.square_partials)
+            self.sketch.merge(other.sketch)
+
+    @property
+    def sum(self):
+        return math.fsum(self.sum_partials)
+
+    @property
+    def average(self):
+        return self.sum / self.count if self.count else math.nan
+
+    @property
+    def std(self):
+        """Sample standard deviation (ddof=1, like pandas)"""
+        if self.count < 2:
+            return math.nan
+        total = sum(map(Fraction, self.sum_partials))
+        squares = sum(map(Fraction, self.square_partials))
+        return math.sqrt((squares - total * total / self.count) / (self.count - 1))
+
+    def quantile(self, q):
+        return self.sketch.quantile(q)
+
+    @property
+    def median(self):
+        return self.quantile(0.5)
+
+
+class TopCounts:
+    """Value counts of a text column, with ties kept in order of first appearance
+
+    With max_keys set, the rarest values are dropped whenever the table grows
+    past it (keeping the top half), so counts of values that survive are
+    lower bounds and `exact` turns False.
+    """
+
+    def __init__(self, max_keys=1000000):
+        self.max_keys = max_keys
+        self.counts = {}
+        self.exact = True
+
+    def add_counts(self, values, counts):
+        target = self.counts
+        for value, count in zip(values, counts):
+            target[value] = target.get(value, 0) + count
+        if self.max_keys and len(target) > self.max_keys:
+            keep = sorted(target.items(), key=lambda item: item[1], reverse=True)[:self.max_keys // 2]
+            kept = {value for value, _ in keep}
+            self.counts = {value: count for value, count in target.items() if value in kept}
+            self.exact = False
+
+    def add(self, series):
+        """Count the non-null values of a Series"""
+        codes, uniques = pd.factorize(series)
+        if len(uniques):
+            counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+            self.add_counts(uniques.tolist(), counts.tolist())
+
+    def merge(self, other):
+        self.add_counts(list(other.counts), list(other.counts.values()))
+        self.exact = self.exact and other.exact
+
+    def most_common(self, n=None):
+        # sorted() is stable, so equal counts stay in first-appearance order
+        ranked = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+        return dict(ranked[:n] if n else ranked)
+
+    def any(self):
+        return bool(self.counts)
+
+
+class DistinctCount:
+    """Number of distinct values: exact up to `size` of them, then a k-minimum-values estimate
+
+    Values are hashed to 64 bits and only the `size` smallest hashes are
+    kept. While fewer values than that were seen the hashes are all of them;
+    past it the k-th smallest hash tells how densely the hash space is filled
+    (relative error about 1/sqrt(size)). Two counts merge by keeping the
+    smallest hashes of both.
+    """
+
+    def __init__(self, size=100000):
+        self.size = size
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.exact = True
+
+    def add(self, values):
+        if len(values):
+            # pandas' hash is keyed with a fixed key, so counts built in other processes merge
+            hashes = pd.util.hash_array(np.asarray(values, dtype=object))
+            self._keep(np.concatenate([self.hashes, hashes]))
+
+    def merge(self, other):
+        self.exact = self.exact and other.exact
+        self._keep(np.concatenate([self.hashes, other.hashes]))
+
+    def _keep(self, hashes):
+        hashes = np.unique(hashes)
+        if len(hashes) > self.size:
+            hashes = hashes[:self.size]
+            self.exact = False
+        self.hashes = hashes
+
+    def count(self):
+        if self.exact:
+            return len(self.hashes)
+        return round((self.size - 1) * 2.0 ** 64 / (float(self.hashes[-1]) + 1))
+
+    def any(self):
+        return bool(len(self.hashes))
+
+
+class Reservoir:
+    """Uniform sample of at most `size` rows, kept as the rows with the smallest random keys
+
+    Two reservoirs merge by keeping the smallest keys of both.
+    """
+
+    def __init__(self, size=20000, width=2, seed=0):
+        self.size = size
+        self.keys = np.empty(0)
+        self.rows = np.empty((0, width))
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, rows):
+        if len(rows):
+            self._keep(np.concatenate([self.keys, self._rng.random(len(rows))]),
+                       np.concatenate([self.rows, rows]))
+
+    def merge(self, other):
+        self._keep(np.concatenate([self.keys, other.keys]), np.concatenate([self.rows, other.rows]))
+
+    def _keep(self, keys, rows):
+        if len(keys) > self.size:
+            chosen = np.sort(np.argpartition(keys, self.size)[:self.size])
+            keys, rows = keys[chosen], rows[chosen]
+        self.keys, self.rows = keys, rows
+
+
+class BookStats:
+    """All statistics behind analyze.py, built in one pass over chunks of book records"""
+
+    def __init__(self, max_exact=100000, max_keys=1000000, sample_size=20000, seed=0):
+        self.total_books = 0
+        self.price = NumericSummary(max_exact)
+        self.discount = NumericSummary(max_exact)
+        self.pages = NumericSummary(max_exact)
+        self.rating = NumericSummary(max_exact)  # Only books with a rating above 0
+        self.books_with_discount = 0
+        self.language = TopCounts(max_keys)
+        self.publisher = TopCounts(max_keys)
+        self.author = TopCounts(max_keys)
+        self.cover_type = TopCounts(max_keys)
+        self.availability = TopCounts(max_keys)
+        self.labels = TopCounts(max_keys)
+        self.categories = TopCounts(max_keys)
+        self.price_vs_pages = Reservoir(sample_size, seed=seed)  # (pages, price) pairs for the scatter chart
+        self.work_ids = DistinctCount(max_exact)  # When the data has work ids
+        # work_id -> author of its first edition seen, for authors counted per work; dropped (None) past max_keys
+        self.works = {}
+        self.max_keys = max_keys
+
+    def add_frame(self, df):
+        """Add a chunk as a DataFrame with (a superset of) the analysis columns"""
+        self.total_books += len(df)
+        numeric = {
+            column: pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+            for column in ('current_price_numeric', 'discount_numeric', 'pages_numeric', 'rating_numeric')
+        }
+        price, discount = numeric['current_price_numeric'], numeric['discount_numeric']
+        pages, rating = numeric['pages_numeric'], numeric['rating_numeric']
+
+        self.price.add(price[~np.isnan(price)])
+        self.discount.add(discount[~np.isnan(discount)])
+        self.books_with_discount += int((discount > 0).sum())
+        self.pages.add(pages[~np.isnan(pages)])
+        self.rating.add(rating[rating > 0])
+
+        for name in ('language', 'publisher', 'author', 'cover_type', 'availability'):
+            # Empty strings count as missing, as they do when pandas reads a CSV
+            column = df[name].astype(object)
+            getattr(self, name).add(column.where(column != ''))
+        for name in LIST_COLUMNS:
+            _, codes, uniques = explode(df[name])
+            if uniques:
+                getattr(self, name).add_counts(uniques, np.bincount(codes, minlength=len(uniques)).tolist())
+        if WORK_COLUMN in df:
+            self._add_works(df[WORK_COLUMN], df['author'])
+
+        both = ~np.isnan(price) & ~np.isnan(pages)
+        self.price_vs_pages.add(np.column_stack([pages[both], price[both]]))
+
+    def _add_works(self, work_ids, authors):
+        known = work_ids.notna() & (work_ids.astype(object) != '')
+        firsts = pd.DataFrame({'work': work_ids[known], 'author': authors[known]}).drop_duplicates('work')
+        self.work_ids.add(firsts['work'].to_numpy())
+        works = self.works
+        if works is None:
+            return
+        for work, author in zip(firsts['work'].tolist(), firsts['author'].tolist()):
+            if work not in works:
+                works[work] = author if isinstance(author, str) and author else None
+        self._bound_works()
+
+    def _bound_works(self):
+        # Too many works to keep one entry each: authors go back to being counted per edition
+        if self.works is not None and self.max_keys and len(self.works) > self.max_keys:
+            self.works = None
+
+    def add_records(self, records, batch_size=10000):
+        """Add an iterable of records (BookRecords straight from the scraper, or dicts), a batch at a time"""
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                self.add_frame(self._frame(batch))
+                batch = []
+        if batch:
+            self.add_frame(self._frame(batch))
+        return self
+
+    @staticmethod
+    def _frame(records):
+        # Column by column through the mapping interface, which dicts and BookRecords share
+        return pd.DataFrame({column: [record.get(column) for record in records]
+                             for column in COLUMNS + [WORK_COLUMN]})
+
+    def merge(self, other):
+        """Fold in an aggregator built over another part of the data"""
+        self.total_books += other.total_books
+        self.books_with_discount += other.books_with_discount
+        for name in ('price', 'discount', 'pages', 'rating', 'language', 'publisher', 'author',
+                     'cover_type', 'availability', 'labels', 'categories', 'price_vs_pages'):
+            getattr(self, name).merge(getattr(other, name))
+        self.work_ids.merge(other.work_ids)
+        if self.works is not None and other.works is not None:
+            for work, author in other.works.items():
+                self.works.setdefault(work, author)
+            self._bound_works()
+        else:
+            self.works = None
+        return self
+
+    @classmethod
+    def from_file(cls, path, chunksize=100000, **options):
+        """Aggregate a CSV, JSONL or Parquet file chunk by chunk, reading only the needed columns"""
+        stats = cls(**options)
+        for chunk in read_frames(path, COLUMNS + [WORK_COLUMN], chunksize):
+            stats.add_frame(chunk)
+        return stats
+
+    def result(self):
+        """The statistics dictionary written to charts/statistics.json
+
+        With work ids in the data, total_works is added (an estimate past
+        max_exact works) and author_top_10 counts works, each edition group
+        once, unless there were more than max_keys works to remember.
+        """
+        total = self.total_books
+        authors = self.author
+        if self.works:
+            authors = TopCounts(max_keys=None)
+            named = [author for author in self.works.values() if author]
+            authors.add_counts(named, [1] * len(named))
+        stats = {
+            'total_books': total,
+            'price_statistics': {
+                'average': self.price.average,
+                'median': self.price.median,
+                'min': self.price.min,
+                'max': self.price.max,
+                'std': self.price.std,
+            },
+            'discount_statistics': {
+                'books_with_discount': self.books_with_discount,
+                'percentage_with_discount': self.books_with_discount / total * 100 if total else 0.0,
+                'average_discount': self.discount.average,
+                'max_discount': self.discount.max,
+            },
+            'pages_statistics': {
+                'average': self.pages.average,
+                'median': self.pages.median,
+                'min': self.pages.min,
+                'max': self.pages.max,
+            },
+            'rating_statistics': {
+                'books_with_rating': self.rating.count,
+                'average_rating': self.rating.average if self.rating.count else 0,
+                'median_rating': self.rating.median if self.rating.count else 0,
+            },
+            'language_distribution': self.language.most_common(10),
+            'publisher_top_10': self.publisher.most_common(10),
+            'author_top_10': authors.most_common(10),
+            'labels_distribution': self.labels.most_common(10),
+            'categories_top_10': self.categories.most_common(10),
+            'cover_type_distribution': self.cover_type.most_common(),
+            'availability_statistics': self.availability.most_common(),
+        }
+        if self.work_ids.any():
+            stats['total_works'] = self.work_ids.count()
+        return stats
@@ -0,0 +1,448 @@
+import csv
+import json
+import os
+
+from records import LIST_FIELDS, BookRecord, as_list, as_text, json_record
+
+
+def record_format(filename, fmt=None):
+    """Output format from an explicit choice or the file extension"""
+    if fmt:
+        return fmt
+    if filename.endswith('.jsonl'):
+        return 'jsonl'
+    if filename.endswith('.parquet'):
+        return 'parquet'
+    return 'csv'
+
+
+def read_records(filename, columns=None):
+    """Iterate the records of a CSV, JSONL or Parquet export as dicts, optionally only some columns
+
+    Labels and categories are lists in JSONL and Parquet, and ', '-joined text in CSV.
+    """
+    fmt = record_format(filename)
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+
+        source = pq.ParquetFile(filename)
+        present = [c for c in columns if c in source.schema_arrow.names] if columns else None
+        for batch in source.iter_batches(columns=present):
+            yield from batch.to_pylist()
+        return
+    with open(filename, newline='', encoding='utf-8') as f:
+        if fmt == 'jsonl':
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield {c: record.get(c) for c in columns} if columns else record
+        else:
+            yield from csv.DictReader(f)
+
+
+def _csv_row(record):
+    if isinstance(record, BookRecord):
+        return record
+    return {name: as_text(value) if name in LIST_FIELDS else value for name, value in record.items()}
+
+
+class RecordWriter:
+    """Write scraped records to a CSV or JSONL file as they arrive, with periodic fsync
+
+    Labels and categories are written as JSON lists, or as ', '-joined text in CSV.
+    """
+
+    def __init__(self, filename, fieldnames, fmt=None, fsync_every=50, resume_offset=None, on_sync=None):
+        self.filename = filename
+        self.fieldnames = list(fieldnames)
+        self.format = record_format(filename, fmt)
+        self.fsync_every = fsync_every
+        self.on_sync = on_sync  # Called with the durable file offset after every fsync
+        self.count = 0
+        self._unsynced = 0
+
+        if resume_offset is not None and os.path.exists(filename):
+            # Drop anything written after the last checkpointed fsync, it will be scraped again
+            os.truncate(filename, resume_offset)
+            self._file = open(filename, 'a', newline='', encoding='utf-8')
+            write_header = resume_offset == 0
+        else:
+            self._file = open(filename, 'w', newline='', encoding='utf-8')
+            write_header = True
+
+        if self.format == 'csv':
+            self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames, extrasaction='ignore')
+            if write_header:
+                self._writer.writeheader()
+        elif self.format != 'jsonl':
+            raise ValueError(f"Unsupported output format: {self.format}")
+
+    def write(self, record):
+        """Append one record, syncing to disk every fsync_every records"""
+        if self.format == 'csv':
+            self._writer.writerow(_csv_row(record))
+        else:
+            self._file.write(json.dumps(json_record(record), ensure_ascii=False) + '\n')
+
+        self.count += 1
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every:
+            self.sync()
+
+    def sync(self):
+        """Flush and fsync the output, then report the durable offset"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        offset = self._file.tell()
+        if self.on_sync:
+            self.on_sync(offset)
+        return offset
+
+    def rewrite_column(self, key, column, values):
+        """Set `column` for the rows whose `key` field is in values, in one streaming pass over the file"""
+        self._file.flush()
+        self._file.close()
+
+        tmp = f"{self.filename}.tmp"
+        with open(self.filename, newline='', encoding='utf-8') as src, \
+                open(tmp, 'w', newline='', encoding='utf-8') as dst:
+            if self.format == 'csv':
+                reader = csv.DictReader(src)
+                writer = csv.DictWriter(dst, fieldnames=reader.fieldnames)
+                writer.writeheader()
+                for row in reader:
+                    if row[key] in values:
+                        row[column] = values[row[key]]
+                    writer.writerow(row)
+            else:
+                for line in src:
+                    record = json.loads(line)
+                    if record.get(key) in values:
+                        record[column] = values[record[key]]
+                    dst.write(json.dumps(record, ensure_ascii=False) + '\n')
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(tmp, self.filename)
+
+        self._file = open(self.filename, 'a', newline='', encoding='utf-8')
+        if self.format == 'csv':
+            self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames, extrasaction='ignore')
+        self.sync()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.sync()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ParquetRecordWriter:
+    """Stream records into a typed Parquet file, one row group per row_group_size records
+
+    Values arrive as strings and are converted with field_types ('float',
+    'int', 'category', 'list'; anything else stays a string). Empty values
+    become nulls, categories are dictionary-encoded and list fields become
+    lists of strings, from a list or from ', '-joined text. The file is only readable
+    once closed, since Parquet keeps its metadata in a footer.
+    """
+
+    format = 'parquet'
+
+    def __init__(self, filename, fieldnames, field_types=None, row_group_size=10000, compression='zstd'):
+        # Imported here so pyarrow is only needed for Parquet output
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self._pq = pq
+        self.filename = filename
+        self.fieldnames = list(fieldnames)
+        self.field_types = field_types or {}
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.count = 0
+        self.schema = pa.schema([pa.field(name, self._arrow_type(name)) for name in self.fieldnames])
+        self._columns = {name: [] for name in self.fieldnames}
+        self._writer = pq.ParquetWriter(filename, self.schema, compression=compression)
+
+    def _arrow_type(self, name):
+        pa = self._pa
+        kind = self.field_types.get(name)
+        if kind == 'float':
+            return pa.float64()
+        if kind == 'int':
+            return pa.int32()
+        if kind == 'category':
+            return pa.dictionary(pa.int32(), pa.string())
+        if kind == 'list':
+            return pa.list_(pa.string())
+        return pa.string()
+
+    def _convert(self, name, value):
+        kind = self.field_types.get(name)
+        if kind == 'list':
+            return as_list(value) or None
+        if value is None or value == '':
+            return None
+        try:
+            if kind == 'float':
+                return float(value)
+            if kind == 'int':
+                return int(value)
+        except ValueError:
+            return None
+        return str(value)
+
+    def write(self, record):
+        """Buffer one record, writing a row group once row_group_size records are buffered"""
+        for name, values in self._columns.items():
+            values.append(self._convert(name, record.get(name)))
+        self.count += 1
+        if len(self._columns[self.fieldnames[0]]) >= self.row_group_size:
+            self._flush()
+
+    def _table(self, columns):
+        pa = self._pa
+        arrays = []
+        for field in self.schema:
+            if pa.types.is_dictionary(field.type):
+                arrays.append(pa.array(columns[field.name], pa.string()).dictionary_encode())
+            else:
+                arrays.append(pa.array(columns[field.name], field.type))
+        return pa.Table.from_arrays(arrays, schema=self.schema)
+
+    def _flush(self):
+        if self._columns[self.fieldnames[0]]:
+            self._writer.write_table(self._table(self._columns))
+            self._columns = {name: [] for name in self.fieldnames}
+
+    def sync(self):
+        """Write out buffered records as a (possibly short) row group"""
+        self._flush()
+
+    def rewrite_column(self, key, column, values):
+        """Set `column` for the rows whose `key` field is in values, one row group at a time
+
+        The file is finished and rewritten, so no records can be written afterwards.
+        """
+        self.close()
+        tmp = f"{self.filename}.tmp"
+        source = self._pq.ParquetFile(self.filename)
+        with self._pq.ParquetWriter(tmp, self.schema, compression=self.compression) as writer:
+            for i in range(source.num_row_groups):
+                columns = source.read_row_group(i).to_pydict()
+                columns[column] = [
+                    values.get(k, current) for k, current in zip(columns[key], columns[column])
+                ]
+                writer.write_table(self._table(columns))
+        source.close()
+        os.replace(tmp, self.filename)
+
+    def close(self):
+        if self._writer is None:
+            return
+        self._flush()
+        self._writer.close()
+        self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class TeeWriter:
+    """Send every record to several writers; the first is the primary output whose count is reported"""
+
+    def __init__(self, primary, *others):
+        self.writers = [primary, *others]
+
+    @property
+    def count(self):
+        return self.writers[0].count
+
+    def write(self, record):
+        for writer in self.writers:
+            writer.write(record)
+
+    def sync(self):
+        for writer in self.writers[1:]:
+            writer.sync()
+        return self.writers[0].sync()
+
+    def rewrite_column(self, key, column, values):
+        for writer in self.writers:
+            writer.rewrite_column(key, column, values)
+
+    def close(self):
+        for writer in self.writers:
+            writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class CrawlCheckpoint:
+    """Append-only log of the crawl frontier: which URLs are discovered, done or failed
+
+    Entries are buffered and only written out when the output file has been
+    fsynced, so a URL is never recorded as done before its row is on disk.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.discovered = set()
+        self.done = set()
+        self.failed = set()
+        self.offset = None  # Output file size at the last sync, None for a fresh crawl
+        self._pending = []
+
+        if os.path.exists(filename):
+            self._load()
+        self._file = open(filename, 'a', encoding='utf-8')
+
+    def _load(self):
+        valid_size = 0
+        with open(self.filename, 'rb') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash; everything before it is intact
+                    break
+                if not line.endswith(b'\n'):
+                    break
+                valid_size += len(line)
+
+                if 'offset' in entry:
+                    self.offset = entry['offset']
+                    continue
+
+                url, state = entry['url'], entry['state']
+                if state == 'discovered':
+                    self.discovered.add(url)
+                elif state == 'done':
+                    self.done.add(url)
+                    self.failed.discard(url)
+                elif state == 'failed':
+                    self.failed.add(url)
+
+        # Cut off the torn tail so new entries start on a clean line
+        os.truncate(self.filename, valid_size)
+
+    @property
+    def resuming(self):
+        return self.offset is not None
+
+    def pending(self):
+        """URLs discovered by an earlier run that still need scraping (including failures)"""
+        return [url for url in self.discovered if url not in self.done]
+
+    def _mark(self, url, state):
+        self._pending.append(json.dumps({'url': url, 'state': state}, ensure_ascii=False))
+
+    def mark_discovered(self, url):
+        if url not in self.discovered:
+            self.discovered.add(url)
+            self._mark(url, 'discovered')
+
+    def mark_done(self, url):
+        self.done.add(url)
+        self.failed.discard(url)
+        self._mark(url, 'done')
+
+    def mark_failed(self, url):
+        self.failed.add(url)
+        self._mark(url, 'failed')
+
+    def sync(self, offset=None):
+        """Write buffered entries (and the output offset they correspond to) to disk"""
+        if offset is not None:
+            self.offset = offset
+            self._pending.append(json.dumps({'offset': offset}))
+        if self._pending:
+            self._file.write('\n'.join(self._pending) + '\n')
+            self._pending = []
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.sync()
+        self._file.close()
+
+    def remove(self):
+        """Delete the checkpoint once a crawl has finished cleanly"""
+        self.close()
+        os.remove(self.filename)
+
+
+class DeltaState:
+    """Listing-card fingerprints and records from the previous run, for delta crawls
+
+    A product whose card fingerprint is unchanged since the last run keeps its
+    last record, so only new or changed products need their detail page fetched.
+    Products are keyed by product id, or by URL for cards without one (sitemap
+    entries, whose fingerprint is their <lastmod>).
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.previous = {}
+        self.current = {}
+        self.carried = 0
+
+        if os.path.exists(filename):
+            with open(filename, encoding='utf-8') as f:
+                # Each record becomes a BookRecord as soon as it is parsed, so the dicts never pile up
+                self.previous = json.load(f, object_hook=self._entry)
+
+    @staticmethod
+    def _entry(obj):
+        if 'record' in obj and 'fingerprint' in obj:
+            return {'fingerprint': obj['fingerprint'], 'record': BookRecord.from_mapping(obj['record'])}
+        return obj
+
+    @staticmethod
+    def _key(card):
+        return card.get('product_id') or card['url']
+
+    def carried_record(self, card):
+        """The previous record for this card if its fingerprint is unchanged, else None"""
+        entry = self.previous.get(self._key(card))
+        if entry is None or entry['fingerprint'] != card['fingerprint']:
+            return None
+        self.current[self._key(card)] = entry
+        self.carried += 1
+        return entry['record']
+
+    def update(self, card, record):
+        """Remember the freshly scraped record under the card's current fingerprint"""
+        self.current[self._key(card)] = {'fingerprint': card['fingerprint'], 'record': record}
+
+    def keep_previous(self, card):
+        """Scraping failed; keep the old entry (its stale fingerprint forces a retry next run)"""
+        entry = self.previous.get(self._key(card))
+        if entry is not None:
+            self.current[self._key(card)] = entry
+
+    def save(self):
+        """Atomically replace the state with what this run saw; delisted products drop out"""
+        tmp = f"{self.filename}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.current, f, ensure_ascii=False, default=dict)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.filename)
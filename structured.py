@@ -0,0 +1,145 @@
+"""Book records from the shop platform's product JSON instead of its HTML pages
+
+The shop runs on InSales, whose storefront serves product data as JSON, many
+products per request: /products_by_id/<id>,<id>,....json. The listing cards
+already carry every product id, so a crawl in structured mode (scraper.py
+--extract structured) fetches a whole batch of books with one small JSON
+response instead of one rendered page per book, and skips the HTML parse.
+
+The JSON is mapped into the same record schema as the HTML parser: prices
+and availability are formatted the way the page shows them, characteristics
+are matched to fields by their property names like the page's properties,
+and the discount is derived from the old price. Rating, reviews, labels and
+categories are not in the product JSON; they are taken from the product page
+only when asked for (html_fields), and stay empty otherwise. Products missing
+from the response, or without a title or price, also fall back to their page.
+Whenever a page is fetched it fills every field the JSON left empty.
+
+The discount is the one field that can differ from the page's: the page
+shows the shop's sale badge, the JSON only the two prices. A badge on a
+product whose old price equals its price (8 books of alinino_books.csv)
+leaves the discount empty here.
+"""
+import html
+import json
+import re
+
+from parsers import set_property
+from records import FIELDNAMES, BookRecord
+
+BULK_PATH = '/products_by_id/{ids}.json'
+BATCH_SIZE = 50  # Product ids per bulk request
+
+AVAILABLE = 'Mövcuddur'
+UNAVAILABLE = 'Mövcud deyil'
+
+# Without these a product goes through the HTML path, as if it were not in the response
+REQUIRED_FIELDS = ('title', 'current_price')
+# Shown on the product page only
+HTML_ONLY_FIELDS = ('rating', 'reviews_count', 'labels', 'categories')
+
+_BLOCK_END = re.compile(r'</(?:p|div|li|h\d)>|<br\s*/?>', re.IGNORECASE)
+_TAG = re.compile(r'<[^>]+>')
+
+
+def bulk_url(base_url, product_ids):
+    return base_url + BULK_PATH.format(ids=','.join(product_ids))
+
+
+def parse_products(content):
+    """The products of a bulk response, by product id (as a string)"""
+    data = json.loads(content)
+    products = data.get('products', []) if isinstance(data, dict) else data
+    return {str(product['id']): product for product in products if product.get('id') is not None}
+
+
+def format_price(value):
+    """A price as the page shows it: '11.04\xa0AZN', and '3\xa0AZN' for whole amounts"""
+    return f"{float(value):.2f}".removesuffix('.00') + '\xa0AZN'
+
+
+def _numeric(value):
+    return f"{float(value):.2f}".removesuffix('.00')
+
+
+def html_text(fragment):
+    """Plain text of an HTML description: its paragraphs stripped and joined by spaces"""
+    blocks = (html.unescape(_TAG.sub('', block)).strip() for block in _BLOCK_END.split(fragment or ''))
+    return ' '.join(block for block in blocks if block)
+
+
+def record_from_product(product, url):
+    """A BookRecord from one product of the JSON; fields the JSON does not carry stay empty"""
+    data = BookRecord()
+    data['url'] = url
+    data['product_id'] = str(product['id'])
+    data['title'] = (product.get('title') or '').strip()
+
+    variants = product.get('variants') or [{}]
+    variant = variants[0]
+    price = variant.get('price', product.get('price'))
+    old_price = variant.get('old_price', product.get('old_price'))
+    if price is not None:
+        data['current_price'] = format_price(price)
+        data['current_price_numeric'] = _numeric(price)
+    if old_price is not None:
+        data['old_price'] = format_price(old_price)
+        data['old_price_numeric'] = _numeric(old_price)
+        # The page shows the discount as a badge; the JSON only has both prices
+        if price is not None and float(old_price) > float(price):
+            percent = round((1 - float(price) / float(old_price)) * 100)
+            data['discount_percent'] = f"−{percent}%"
+            data['discount_numeric'] = str(percent)
+
+    # Characteristics hold values and a property id; the property carries the name shown on the page
+    names = {prop.get('id'): prop.get('title') or '' for prop in product.get('properties') or []}
+    for characteristic in product.get('characteristics') or []:
+        name = names.get(characteristic.get('property_id'))
+        if name:
+            set_property(data, name, characteristic.get('title') or '')
+    if not data['isbn'] and variant.get('sku'):
+        data['isbn'] = str(variant['sku']).strip()
+
+    data['description'] = html_text(product.get('description'))
+
+    available = product.get('available', variant.get('available'))
+    if available is not None:
+        data['availability'] = AVAILABLE if available else UNAVAILABLE
+
+    for image in product.get('images') or []:
+        image_url = image.get('original_url') or image.get('url')
+        if image_url:
+            data['image_url'] = image_url
+            break
+    return data
+
+
+def wanted_fields(html_fields):
+    """The record fields covered by a list of html_fields names, their numeric columns included"""
+    fields = []
+    for name in html_fields:
+        fields.append(name)
+        if f"{name}_numeric" in FIELDNAMES:
+            fields.append(f"{name}_numeric")
+    return fields
+
+
+def needs_html(record, html_fields=()):
+    """Whether the product page must be fetched to complete a record from the JSON"""
+    return record is None or any(not record[name] for name in REQUIRED_FIELDS) or bool(html_fields)
+
+
+def merge_html(record, page, html_fields=()):
+    """Complete a record from the JSON with the one parsed from the product page
+
+    The page supplies the html_fields and every field the JSON left empty;
+    either record may be None when its source failed.
+    """
+    if record is None or page is None:
+        return record or page
+    for name in wanted_fields(html_fields):
+        record[name] = page[name]
+    for name, value in page.items():
+        if value and not record[name]:
+            record[name] = value
+    return record
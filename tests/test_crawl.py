@@ -0,0 +1,202 @@
+import asyncio
+import csv
+import json
+
+import pytest
+
+from bench.stub_server import start_stub_server
+from parsers import FIELDNAMES
+from scraper import AlininoScraper
+from storage import CrawlCheckpoint, RecordWriter
+from throttle import AdaptiveLimiter, RetryPolicy
+
+
+class FailingWriter(RecordWriter):
+    """Fails on its fifth record (or fail_at), like a full disk"""
+
+    fail_at = 4
+
+    def write(self, record):
+        if self.count == self.fail_at:
+            raise OSError(28, 'No space left on device')
+        super().write(record)
+
+
+def test_writer_error_fails_the_crawl_instead_of_hanging(tmp_path):
+    async def crawl():
+        # More products than the frontier queue holds, so discovery would block on a queue nobody drains
+        runner, base_url, _ = await start_stub_server(products=400)
+        try:
+            scraper = AlininoScraper(base_url=base_url, rate_limit=0, queue_size=10, num_workers=4)
+            with FailingWriter(str(tmp_path / 'books.csv'), FIELDNAMES) as writer:
+                await asyncio.wait_for(scraper.scrape_collection(f"{base_url}/collection/bestsellery",
+                                                                 writer=writer), timeout=30)
+        finally:
+            await runner.cleanup()
+
+    with pytest.raises(OSError, match='No space left'):
+        asyncio.run(crawl())
+
+
+def test_limiter_cuts_once_per_cooldown_whatever_the_latency_target(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('throttle.time.monotonic', lambda: now[0])
+    limiter = AdaptiveLimiter(initial=16, latency_target=0.1, decrease_cooldown=5.0)
+    limiter.on_response(503, 0.01)
+    limiter.on_error()
+    assert limiter.limit == 8
+    now[0] += 1.0
+    limiter.on_response(429, 0.01)
+    assert limiter.limit == 8
+    now[0] += 4.0
+    limiter.on_response(429, 0.01)
+    assert limiter.limit == 4
+
+
+def test_throttled_crawl_backs_off_recovers_and_loses_nothing(tmp_path):
+    products = 300
+
+    async def crawl():
+        # Answers 429 above 4 concurrent requests and fails 5% of requests with 503
+        runner, base_url, shop = await start_stub_server(products=products, latency=0.01, throttle_limit=4,
+                                                         retry_after=0, error_rate=0.05, seed=7)
+        try:
+            scraper = AlininoScraper(base_url=base_url, rate_limit=0, max_retries=8)
+            # A short cooldown between decreases keeps the test quick
+            scraper.limiter = AdaptiveLimiter(initial=12, max_limit=16, decrease_cooldown=0.2)
+            scraper.retry = RetryPolicy(max_retries=8, base_delay=0.05)
+            limits = []
+            on_response = scraper.limiter.on_response
+
+            def record(status, latency):
+                on_response(status, latency)
+                limits.append(scraper.limiter.limit)
+
+            scraper.limiter.on_response = record
+            with RecordWriter(str(tmp_path / 'books.csv'), FIELDNAMES) as writer:
+                await scraper.scrape_collection(f"{base_url}/collection/bestsellery", writer=writer)
+            return writer, shop.stats, limits
+        finally:
+            await runner.cleanup()
+
+    writer, served, limits = asyncio.run(crawl())
+    assert served['throttled'] and served['errors']
+    with open(tmp_path / 'books.csv', newline='', encoding='utf-8') as f:
+        urls = [row['url'] for row in csv.DictReader(f)]
+    assert writer.count == products
+    assert len(set(urls)) == products
+
+    # The limit was cut below where it started, then grew again after its low point
+    low = min(limits)
+    assert low < 12
+    assert max(limits[limits.index(low):]) > low
+
+
+def _checkpoint_entries(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_row_is_checkpointed_as_done_only_after_the_output_is_fsynced(tmp_path):
+    output, log = str(tmp_path / 'books.jsonl'), str(tmp_path / 'books.jsonl.checkpoint')
+    checkpoint = CrawlCheckpoint(log)
+    writer = RecordWriter(output, FIELDNAMES, fsync_every=3, on_sync=checkpoint.sync)
+    for i in range(5):
+        # The order the crawl uses: marked first, then written
+        checkpoint.mark_done(f'/product/{i}')
+        writer.write({'url': f'/product/{i}', 'title': f'Book {i}'})
+        done = [entry['url'] for entry in _checkpoint_entries(log) if entry.get('state') == 'done']
+        assert len(done) == (i + 1) // 3 * 3
+    # The offset recorded with them covers exactly the three synced rows
+    offsets = [entry['offset'] for entry in _checkpoint_entries(log) if 'offset' in entry]
+    with open(output, 'rb') as f:
+        assert f.read(offsets[-1]).count(b'\n') == 3
+    checkpoint._file.close()
+    writer._file.close()
+
+
+def test_crawl_killed_mid_write_resumes_without_losing_or_repeating_a_book(tmp_path):
+    products = 120
+    output, log = str(tmp_path / 'books.csv'), str(tmp_path / 'books.csv.checkpoint')
+
+    def crawl(base_url, writer, checkpoint):
+        scraper = AlininoScraper(base_url=base_url, rate_limit=0)
+        return scraper.scrape_collection(f"{base_url}/collection/bestsellery", writer=writer, checkpoint=checkpoint)
+
+    async def run():
+        runner, base_url, _ = await start_stub_server(products=products)
+        try:
+            checkpoint = CrawlCheckpoint(log)
+            writer = FailingWriter(output, FIELDNAMES, fsync_every=10, resume_offset=checkpoint.offset,
+                                   on_sync=checkpoint.sync)
+            writer.fail_at = 47
+            with pytest.raises(OSError):
+                await crawl(base_url, writer, checkpoint)
+            # The process dies here: rows past the last fsync reached the file, the checkpoint's buffer
+            # did not, and both files end in a line cut off mid-write
+            writer._file.write(f'{base_url}/product/torn,Torn')
+            writer._file.close()
+            checkpoint._file.write('{"url": "/product/torn", "st')
+            checkpoint._file.close()
+
+            checkpoint = CrawlCheckpoint(log)
+            resumed = (checkpoint.resuming, len(checkpoint.done))
+            writer = RecordWriter(output, FIELDNAMES, fsync_every=10, resume_offset=checkpoint.offset,
+                                  on_sync=checkpoint.sync)
+            await crawl(base_url, writer, checkpoint)
+            writer.close()
+            checkpoint.close()
+            return resumed, writer
+        finally:
+            await runner.cleanup()
+
+    (resuming, done), writer = asyncio.run(run())
+    assert resuming and done == 40
+    assert writer.count == products - 40
+    with open(log, encoding='utf-8') as f:
+        assert all(json.loads(line) for line in f)  # The torn entry was cut off before appending
+    with open(output, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == len({row['url'] for row in rows}) == products
+    assert all(row['title'] for row in rows)
+
+
+def _probe(last_page, max_pages=None):
+    fetched, requested = {1: 40}, []
+
+    async def fetch_page(page):
+        requested.append(page)
+        fetched[page] = 40 if page <= last_page else 0
+
+    found = asyncio.run(AlininoScraper()._probe_last_page(fetch_page, fetched, max_pages))
+    return found, requested
+
+
+def test_last_page_probe_doubles_then_bisects():
+    for last_page in range(1, 70):
+        found, requested = _probe(last_page)
+        assert found == last_page
+        assert len(requested) == len(set(requested)) <= 2 * last_page.bit_length() + 1
+    assert _probe(37)[1] == [2, 4, 8, 16, 32, 64, 48, 40, 36, 38, 37]
+
+
+def test_last_page_probe_never_fetches_past_max_pages():
+    assert _probe(100, max_pages=10) == (10, [2, 4, 8, 10])
+    assert _probe(5, max_pages=10) == (5, [2, 4, 8, 6, 5])
+
+
+def test_collection_without_pagination_widget_is_crawled_to_its_last_page():
+    async def crawl(max_pages=None):
+        # 300 products are 8 listing pages, the last one part full
+        runner, base_url, shop = await start_stub_server(products=300, pagination=False)
+        try:
+            scraper = AlininoScraper(base_url=base_url, rate_limit=0)
+            books = await scraper.scrape_collection(f"{base_url}/collection/bestsellery", max_pages=max_pages)
+            return len(books), shop.stats['requests'] - len(books)
+        finally:
+            await runner.cleanup()
+
+    books, listing_requests = asyncio.run(crawl())
+    assert books == 300
+    assert listing_requests == 12  # Pages 1-8, and the empty 9, 10, 12 and 16 the probe looked at
+    assert asyncio.run(crawl(max_pages=3)) == (120, 3)
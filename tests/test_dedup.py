@@ -0,0 +1,59 @@
+import numpy as np
+
+from dedup import UnionFind, assign_works, _link
+
+
+def test_bucket_members_that_only_match_each_other_are_joined():
+    # One band of four rows that all three share, so they land in one bucket; in the other band
+    # only rows 1 and 2 agree, so neither is similar enough to row 0 but they match each other
+    signatures = np.array([[1, 1, 1, 1, 7, 7, 7, 7],
+                           [1, 1, 1, 1, 2, 2, 2, 2],
+                           [1, 1, 1, 1, 2, 2, 2, 2]], dtype=np.uint32)
+    union_find = UnionFind(3)
+    _link(signatures, np.ones(3, dtype=bool), 0.75, lambda i, j: True, union_find, bands=2)
+    assert union_find.find(1) == union_find.find(2)
+    assert union_find.find(0) != union_find.find(1)
+
+
+def test_translations_share_a_work_and_volumes_stay_apart():
+    records = [
+        {'url': 'https://alinino.az/product/ali-ve-nino', 'title': 'Əli və Nino', 'author': 'Qurban Səid'},
+        {'url': 'https://alinino.az/product/ali-and-nino', 'title': 'Ali and Nino', 'author': 'Kurban Said'},
+        {'url': 'https://alinino.az/product/ali-i-nino', 'title': 'Али и Нино', 'author': 'Курбан Саид'},
+        {'url': 'https://alinino.az/product/dune-1', 'title': 'Dune 1', 'author': 'Frank Herbert'},
+        {'url': 'https://alinino.az/product/dune-2', 'title': 'Dune 2', 'author': 'Frank Herbert'},
+    ]
+    work_ids = assign_works(records)
+    assert work_ids[0] == work_ids[1] == work_ids[2]
+    assert len(set(work_ids[2:])) == 3
+
+
+def test_oversized_buckets_compare_each_member_with_a_bounded_neighbourhood():
+    # 1000 rows in one bucket: every pair would be 499,500 checks
+    signatures = np.ones((1000, 8), dtype=np.uint32)
+    signatures[:, 4:] = np.arange(1000)[:, None] // 10
+    checks = []
+
+    def compatible(i, j):
+        checks.append((i, j))
+        return False
+
+    _link(signatures, np.ones(1000, dtype=bool), 0.75, compatible, UnionFind(1000), bands=2, max_bucket=50)
+    assert len(checks) <= 1000 * 49
+    # Rows with the same second band are still sorted next to each other and all checked
+    assert {(i, j) for i, j in checks if i // 10 == j // 10} == {(i, j) for i in range(1000) for j in range(i + 1, 1000)
+                                                                 if i // 10 == j // 10}
+
+
+def test_rows_of_one_component_are_not_checked_again():
+    signatures = np.ones((300, 8), dtype=np.uint32)
+    checks = []
+
+    def compatible(i, j):
+        checks.append((i, j))
+        return True
+
+    union_find = UnionFind(300)
+    _link(signatures, np.ones(300, dtype=bool), 0.75, compatible, union_find, bands=2)
+    assert len({union_find.find(i) for i in range(300)}) == 1
+    assert len(checks) == 299
@@ -0,0 +1,48 @@
+import asyncio
+
+from bench.stub_server import start_stub_server
+from scraper import AlininoScraper
+from storage import DeltaState
+
+
+def test_delta_crawl_fetches_only_changed_cards_and_keeps_records_it_cannot_refetch(tmp_path):
+    path = str(tmp_path / 'delta.json')
+
+    async def crawl(base_url, shop):
+        delta = DeltaState(path)
+        requests = shop.stats['requests']
+        scraper = AlininoScraper(base_url=base_url, rate_limit=0)
+        books = await scraper.scrape_collection(f"{base_url}/collection/bestsellery", delta=delta)
+        delta.save()
+        return {book['product_id']: book for book in books}, delta.carried, shop.stats['requests'] - requests
+
+    async def run():
+        runner, base_url, shop = await start_stub_server(products=60)
+        try:
+            first = await crawl(base_url, shop)
+            changed, gone = shop.products[3], shop.products[5]
+            changed['current_price'] = gone['current_price'] = '1.00 ₼'
+            del shop.by_slug[gone['slug']]  # Its page is now a 404
+            shop._pages.clear()  # Listings are rendered once and kept
+            second = await crawl(base_url, shop)
+            kept = DeltaState(path).previous[str(gone['product_id'])]
+            shop.by_slug[gone['slug']] = gone
+            third = await crawl(base_url, shop)
+            return first, second, kept, third, str(changed['product_id']), str(gone['product_id'])
+        finally:
+            await runner.cleanup()
+
+    (first, _, fetched), (second, carried, refetched), kept, (third, _, retried), changed, gone = asyncio.run(run())
+    listing_pages = fetched - 60
+    assert len(first) == len(third) == 60 and gone not in second
+
+    # Only the pages of the two changed cards were fetched
+    assert carried == 58 and refetched == listing_pages + 2
+    assert second[changed]['current_price'] == '1.00 ₼'
+    unchanged = [key for key in first if key not in (changed, gone)]
+    assert all(list(second[key].items()) == list(first[key].items()) for key in unchanged)
+
+    # The failed fetch kept the previous record in the state, and its old fingerprint makes the next run
+    # fetch it again
+    assert list(kept['record'].items()) == list(first[gone].items())
+    assert retried == listing_pages + 1 and third[gone]['current_price'] == '1.00 ₼'
@@ -0,0 +1,43 @@
+import sys
+
+import pytest
+
+from facets import FacetIndex, main
+from stats import explode
+
+BOOKS = [
+    {'language': 'Azərbaycan dili', 'labels': ['Bestseller', 'Yeni'], 'categories': ['Roman'],
+     'current_price_numeric': 10},
+    {'language': 'İngilis dili', 'labels': ['Bestseller'], 'categories': ['Roman', 'Klassika'],
+     'current_price_numeric': 20},
+    {'language': 'İngilis dili', 'labels': [], 'categories': 'Uşaq ədəbiyyatı', 'current_price_numeric': 5},
+]
+
+
+def test_where_combines_attributes_and_facet_fields():
+    index = FacetIndex().add_records(BOOKS)
+    assert index.where(language='İngilis dili').tolist() == [False, True, True]
+    assert index.where(language='İngilis dili', labels='Bestseller').tolist() == [False, True, False]
+    assert index.where(categories=['Klassika', 'Uşaq ədəbiyyatı']).tolist() == [False, True, True]
+
+
+def test_where_rejects_unknown_fields():
+    index = FacetIndex().add_records(BOOKS)
+    with pytest.raises(ValueError, match='Unknown field: foo .*language'):
+        index.where(foo='bar')
+
+
+def test_cli_reports_unknown_where_fields(monkeypatch, capsys):
+    monkeypatch.setattr(sys, 'argv', ['facets.py', 'books.csv', '--where', 'foo=bar'])
+    with pytest.raises(SystemExit) as exit_info:
+        main()
+    assert exit_info.value.code == 2
+    assert "unknown field 'foo' (choose from language" in capsys.readouterr().err
+
+
+def test_chunks_without_any_labels_are_indexed():
+    rows, codes, uniques = explode([[], '', None])
+    assert len(rows) == len(codes) == 0 and uniques == []
+    index = FacetIndex().add_records([{**book, 'labels': []} for book in BOOKS])
+    assert index.size == 3
+    assert not index.where(labels='Bestseller').any()
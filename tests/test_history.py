@@ -0,0 +1,111 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest
+
+from bench.stub_server import start_stub_server
+from history import PriceHistory
+from parsers import FIELD_TYPES, FIELDNAMES
+from records import as_text
+from scraper import AlininoScraper
+from storage import ParquetRecordWriter, RecordWriter
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PRODUCTS = 50
+
+
+def _crawl(extract='html'):
+    async def crawl():
+        runner, base_url, _ = await start_stub_server(products=PRODUCTS)
+        try:
+            scraper = AlininoScraper(base_url=base_url, rate_limit=0, extract=extract)
+            return await scraper.scrape_collection(f"{base_url}/collection/bestsellery")
+        finally:
+            await runner.cleanup()
+
+    records = [dict(record) for record in asyncio.run(crawl())]
+    assert len(records) == PRODUCTS and all(record['product_id'] for record in records)
+    return records
+
+
+@pytest.fixture(scope='module')
+def crawled():
+    """Records of one stub crawl, with product ids"""
+    return _crawl()
+
+
+def _export(path, records):
+    """An export like alinino_books.csv: no product_id column, and each book 1 AZN dearer than now"""
+    fieldnames = [name for name in FIELDNAMES if name != 'product_id']
+    if str(path).endswith('.parquet'):
+        writer = ParquetRecordWriter(str(path), fieldnames, FIELD_TYPES)
+    else:
+        writer = RecordWriter(str(path), fieldnames)
+    with writer:
+        for record in records:
+            price = float(record['current_price_numeric']) + 1
+            writer.write({**{name: record[name] for name in fieldnames}, 'current_price_numeric': f"{price:.2f}"})
+    return str(path)
+
+
+def _import(database, data_file):
+    subprocess.run([sys.executable, os.path.join(REPO_DIR, 'history.py'), database, 'import', data_file],
+                   check=True, capture_output=True)
+
+
+def test_a_crawl_with_ids_continues_the_histories_of_an_imported_export(tmp_path, crawled):
+    database = str(tmp_path / 'history.sqlite')
+    _import(database, _export(tmp_path / 'books.csv', crawled))
+    with PriceHistory(database) as history:
+        _, changed = history.add_snapshot(crawled)
+        assert changed == PRODUCTS  # Every price went down by 1 AZN
+        assert history._db.execute('SELECT COUNT(*) FROM products').fetchone()[0] == PRODUCTS
+
+        book = crawled[0]
+        by_url = history.price_history(book['url'])
+        assert [row['current_price'] for row in by_url] == [float(book['current_price_numeric']) + 1,
+                                                           float(book['current_price_numeric'])]
+        assert history.price_history(book['product_id']) == by_url
+        if book['isbn']:
+            assert history.price_history(book['isbn']) == by_url
+
+    # The ids stick: importing the export again matches the products by URL instead of adding new ones
+    _import(database, _export(tmp_path / 'again.csv', crawled))
+    with PriceHistory(database) as history:
+        assert history._db.execute('SELECT COUNT(*) FROM products').fetchone()[0] == PRODUCTS
+        assert len(history.price_history(crawled[0]['product_id'])) == 3
+
+
+@pytest.mark.parametrize('extension', ['jsonl', 'parquet'])
+def test_import_reads_every_export_format(tmp_path, crawled, extension):
+    csv_db, other_db = str(tmp_path / 'csv.sqlite'), str(tmp_path / 'other.sqlite')
+    _import(csv_db, _export(tmp_path / 'books.csv', crawled))
+    _import(other_db, _export(tmp_path / f'books.{extension}', crawled))
+    with PriceHistory(csv_db) as from_csv, PriceHistory(other_db) as from_other:
+        url = crawled[0]['url']
+        assert from_other.price_history(url)[0]['current_price'] == from_csv.price_history(url)[0]['current_price']
+        assert from_other.crawls()[0][3:] == from_csv.crawls()[0][3:] == (PRODUCTS, PRODUCTS)
+
+
+def test_an_unchanged_crawl_writes_no_rows(tmp_path, crawled):
+    with PriceHistory(str(tmp_path / 'history.sqlite')) as history:
+        assert history.add_snapshot(crawled)[1] == PRODUCTS
+        assert history.add_snapshot(crawled)[1] == 0
+
+
+def test_switching_to_structured_extraction_records_no_changes(tmp_path, crawled):
+    structured = _crawl('structured')
+    assert not any(record['reviews_count'] or record['labels'] for record in structured)
+    with PriceHistory(str(tmp_path / 'history.sqlite')) as history:
+        history.add_snapshot(crawled)
+        # The JSON has no rating, reviews or labels: the page's last values hold, and nothing else differs
+        assert history.add_snapshot(structured)[1] == 0
+        assert history.add_snapshot(crawled)[1] == 0
+        cheaper = [{**record, 'current_price_numeric': '1'} if i < 3 else record for i, record in enumerate(structured)]
+        assert history.add_snapshot(cheaper)[1] == 3
+        row = history.price_history(crawled[0]['product_id'])[-1]
+        assert row['current_price'] == 1.0
+        assert row['reviews_count'] == float(crawled[0]['reviews_count'])
+        assert row['labels'] == (as_text(crawled[0]['labels']) or None)
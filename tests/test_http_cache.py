@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from bench.stub_server import start_stub_server
+from http_cache import ResponseCache
+from parsers import FIELDNAMES
+from scraper import AlininoScraper
+
+
+def _by_url(books):
+    return {book['url']: [book[name] for name in FIELDNAMES] for book in books}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('http_cache.time.time', lambda: now[0])
+    return now
+
+
+def test_least_recently_used_entries_are_evicted_past_max_bytes(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / 'cache.db'), max_bytes=250)
+    for name in 'abc':
+        clock[0] += 1
+        cache.put(f'/{name}', name.encode() * 100, 'utf-8')
+    assert cache.get('/a') is None and cache.total_bytes == 200
+    clock[0] += 1
+    cache.get('/b')  # Now used after /c
+    clock[0] += 1
+    cache.put('/d', b'd' * 100, 'utf-8')
+    assert [cache.get(url) is not None for url in ('/b', '/c', '/d')] == [True, False, True]
+    # A replaced entry counts once
+    cache.put('/d', b'd' * 50, 'utf-8')
+    assert cache.total_bytes == 150
+    cache.close()
+    assert ResponseCache(str(tmp_path / 'cache.db'), max_bytes=250).total_bytes == 150
+
+
+def test_entries_are_fresh_for_ttl_seconds_then_revalidated(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / 'cache.db'), ttl=60)
+    cache.put('/page', b'<html></html>', 'utf-8', etag='"v1"', last_modified='Sat, 17 Oct 2026 10:00:00 GMT')
+    entry = cache.get('/page')
+    assert cache.is_fresh(entry)
+    assert entry.conditional_headers() == {'If-None-Match': '"v1"',
+                                           'If-Modified-Since': 'Sat, 17 Oct 2026 10:00:00 GMT'}
+    clock[0] += 61
+    assert not cache.is_fresh(cache.get('/page'))
+    cache.revalidated('/page')  # A 304 starts the ttl again
+    assert cache.is_fresh(cache.get('/page'))
+    assert not ResponseCache(str(tmp_path / 'other.db')).is_fresh(entry)
+    cache.close()
+
+
+def test_recrawl_revalidates_with_304_and_offline_replays_the_cache(tmp_path):
+    path = str(tmp_path / 'cache.db')
+
+    async def crawl(base_url, **options):
+        cache = ResponseCache(path, **options)
+        try:
+            scraper = AlininoScraper(base_url=base_url, rate_limit=0, cache=cache)
+            parse, parsed = scraper._parse, []
+
+            async def counted(*args):
+                parsed.append(args)
+                return await parse(*args)
+
+            scraper._parse = counted
+            books = await scraper.scrape_collection(f"{base_url}/collection/bestsellery")
+            return books, (cache.hits, cache.misses, len(parsed))  # Pages parsed, not replayed
+        finally:
+            cache.close()
+
+    async def run():
+        runner, base_url, shop = await start_stub_server(products=60)
+        try:
+            first, first_counts = await crawl(base_url)
+            requests = shop.stats['requests']
+            second, second_counts = await crawl(base_url)
+            revalidated = shop.stats['requests'] - requests, shop.stats['not_modified']
+            requests = shop.stats['requests']
+            fresh, fresh_counts = await crawl(base_url, ttl=3600)
+            fresh_requests = shop.stats['requests'] - requests
+        finally:
+            await runner.cleanup()
+        # The server is gone: only the cache can answer
+        offline, _ = await crawl(base_url, offline=True)
+        cache = ResponseCache(path, offline=True)
+        with pytest.raises(LookupError, match='offline'):
+            await AlininoScraper(base_url=base_url, cache=cache)._fetch(None, f"{base_url}/product/not-cached")
+        cache.close()
+        return first, first_counts, second, second_counts, revalidated, fresh, fresh_counts, fresh_requests, offline
+
+    (first, first_counts, second, second_counts, (requests, not_modified),
+     fresh, fresh_counts, fresh_requests, offline) = asyncio.run(run())
+
+    pages = first_counts[1]
+    assert first_counts == (0, pages, pages) and pages > 60
+    # Every page came back 304 and its cached parse was reused
+    assert second_counts == (pages, 0, 0) and requests == not_modified == pages
+    assert fresh_counts == (pages, 0, 0) and fresh_requests == 0
+    for books in (second, fresh, offline):
+        assert len(books) == len(first) == 60
+        assert _by_url(books) == _by_url(first)
@@ -0,0 +1,81 @@
+import asyncio
+import os
+import time
+
+from bench.stub_server import start_stub_server
+from images import ImageFetcher, ImageStore, fetch_images
+from scraper import AlininoScraper
+
+
+def _image_urls(base_url, rows):
+    return [f"{base_url}/images/products/{row['slug']}.jpg" for row in rows]
+
+
+def test_shared_covers_are_stored_once_and_a_rerun_downloads_nothing(tmp_path):
+    store = ImageStore(str(tmp_path / 'images'))
+
+    async def run():
+        # Products past the 1389 recorded rows reuse a recorded row's cover under their own URL
+        runner, base_url, shop = await start_stub_server(products=1395, image_size=4096)
+        try:
+            urls = _image_urls(base_url, shop.products[:6] + shop.products[1389:])
+            scraper = AlininoScraper(base_url=base_url, rate_limit=0)
+            first = await fetch_images(scraper, store, urls + urls[:3], workers=4)
+            requests = shop.stats['requests']
+            rerun = await fetch_images(scraper, store, urls, workers=4)
+            return first, rerun, shop.stats['requests'] - requests
+        finally:
+            await runner.cleanup()
+
+    try:
+        first, rerun, rerun_requests = asyncio.run(run())
+    finally:
+        store.close()
+    assert (first.downloaded, first.duplicates, first.failed) == (6, 6, 0)
+    assert rerun.skipped == 12 and rerun.downloaded == rerun.duplicates == 0
+    assert rerun_requests == 0
+    files = [name for _, _, names in os.walk(tmp_path / 'images') for name in names if name.endswith('.jpg')]
+    assert len(files) == 6
+
+
+def test_capped_downloads_keep_to_the_bandwidth_and_leave_page_slots_free(tmp_path):
+    store = ImageStore(str(tmp_path / 'images'))
+    bandwidth = 2 * 1024 * 1024
+
+    async def run():
+        runner, base_url, shop = await start_stub_server(products=20, image_size=1024 * 1024)
+        try:
+            # One page slot and one connection for pages: a download holding either would stall the page fetch
+            scraper = AlininoScraper(base_url=base_url, rate_limit=0, max_concurrent=1, max_concurrent_limit=1,
+                                     image_workers=4)
+            fetcher = ImageFetcher(scraper, store, bandwidth=bandwidth, workers=4, chunk_size=64 * 1024)
+            async with scraper.session() as session:
+                started = time.perf_counter()
+                fetcher.start(session)
+                for url in _image_urls(base_url, shop.products[:6]):
+                    await fetcher.submit(url)
+                # Past the bandwidth bucket's initial burst, downloads stream at the capped rate
+                while fetcher.bytes < bandwidth:
+                    await asyncio.sleep(0.01)
+                page_started = time.perf_counter()
+                record = await scraper.extract_book_data(session, f"{base_url}/product/{shop.products[0]['slug']}")
+                page_seconds = time.perf_counter() - page_started
+                downloads_in_flight = fetcher.limiter.in_flight
+                await fetcher.join()
+                elapsed = time.perf_counter() - started
+            return fetcher, record, downloads_in_flight, page_seconds, elapsed
+        finally:
+            await runner.cleanup()
+
+    try:
+        fetcher, record, downloads_in_flight, page_seconds, elapsed = asyncio.run(run())
+    finally:
+        store.close()
+    assert fetcher.downloaded == 6 and fetcher.failed == 0
+    assert record and record['title']
+    assert downloads_in_flight > 0, 'the page fetch waited for the image downloads'
+    # The capped downloads take seconds; the page waited on neither a limiter slot nor a connection they held
+    assert page_seconds < 0.5
+    # The bucket starts full, so one second's worth of bytes may go out at once
+    assert elapsed >= (fetcher.bytes - bandwidth) / bandwidth * 0.9
+    assert fetcher.bytes / elapsed < bandwidth * 2
@@ -0,0 +1,57 @@
+import glob
+import os
+
+import pytest
+
+from bench import fixtures
+from parsers import PARSERS, compare_backends, parse_book_bytes, parse_listing_bytes
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+BASE_URL = 'https://alinino.az'
+
+
+def _pages(pattern):
+    return sorted(glob.glob(os.path.join(FIXTURES, pattern)))
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('path', _pages('product-*.html'), ids=os.path.basename)
+def test_backends_agree_on_product_pages(path):
+    content = _read(path)
+    lxml_record, soup_record = [parse_book_bytes(content, path, 'utf-8', cls()) for cls in PARSERS.values()]
+    assert dict(lxml_record) == dict(soup_record)
+
+    # The page was rendered from a recorded row, so the parsed record gives back its values
+    row = next(row for row in fixtures.make_products(1389) if row['product_id'] == lxml_record['product_id'])
+    for field in ('current_price', 'old_price', 'isbn', 'author', 'availability', 'image_url'):
+        assert lxml_record[field] == row[field], field
+
+
+@pytest.mark.parametrize('path', _pages('collection-*.html'), ids=os.path.basename)
+def test_backends_agree_on_listing_pages(path):
+    content = _read(path)
+    lxml_listing, soup_listing = [parse_listing_bytes(content, BASE_URL, 'utf-8', cls()) for cls in PARSERS.values()]
+    assert lxml_listing == soup_listing
+    assert lxml_listing['cards']
+    assert all(card['url'].startswith(f"{BASE_URL}/collection/") for card in lxml_listing['cards'])
+    if 'no-pagination' in path:
+        assert lxml_listing['last_page'] is None
+    else:
+        assert lxml_listing['last_page'] == 35
+
+
+def test_backends_agree_on_collection_links():
+    content = _read(os.path.join(FIXTURES, 'home.html'))
+    links = [parser.parse_collection_links(parser.load(content, 'utf-8'), BASE_URL)
+             for parser in (cls() for cls in PARSERS.values())]
+    assert links[0] == links[1] == [f"{BASE_URL}/collection/{name}"
+                                    for name in ('bestsellery', 'yeni-kitablar', 'usaq-edebiyyati')]
+
+
+def test_compare_backends_reports_no_mismatches(capsys):
+    assert compare_backends(_pages('product-*.html')) == 0
+    assert '5 pages, 0 mismatched fields' in capsys.readouterr().out
@@ -0,0 +1,33 @@
+import os
+import subprocess
+import sys
+
+import pandas as pd
+
+from search_index import SearchIndex
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_CSV = os.path.join(REPO_DIR, 'alinino_books.csv')
+
+
+def _add(index, data_file):
+    subprocess.run([sys.executable, os.path.join(REPO_DIR, 'search_index.py'), index, 'add', data_file],
+                   check=True, capture_output=True)
+
+
+def test_add_indexes_parquet_like_csv(tmp_path):
+    books = pd.read_csv(SOURCE_CSV, nrows=200, dtype=str, keep_default_na=False)
+    books.to_parquet(tmp_path / 'books.parquet')
+    books.to_csv(tmp_path / 'books.csv', index=False)
+    _add(str(tmp_path / 'csv.idx'), str(tmp_path / 'books.csv'))
+    _add(str(tmp_path / 'parquet.idx'), str(tmp_path / 'books.parquet'))
+
+    with SearchIndex(str(tmp_path / 'csv.idx')) as from_csv, SearchIndex(str(tmp_path / 'parquet.idx')) as from_parquet:
+        assert from_parquet.stats()['docs'] == from_csv.stats()['docs'] == 200
+        assert from_parquet.search('roman', limit=5) == from_csv.search('roman', limit=5)
+
+
+def test_importing_the_scraper_does_not_build_the_mark_table():
+    code = 'import scraper, search_index; print(search_index._marks.cache_info().currsize)'
+    result = subprocess.run([sys.executable, '-c', code], cwd=REPO_DIR, check=True, capture_output=True, text=True)
+    assert result.stdout.strip() == '0'
@@ -0,0 +1,94 @@
+import asyncio
+import gzip
+
+from aiohttp import web
+
+from scraper import AlininoScraper
+from sitemap import SitemapDiscovery, SitemapParser
+from throttle import RetryPolicy
+
+NS = 'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9" xmlns:image="http://www.google.com/schemas/sitemap-image/1.1"'
+
+
+def _urlset(*entries):
+    return f'<?xml version="1.0" encoding="UTF-8"?><urlset {NS}>{"".join(entries)}</urlset>'.encode('utf-8')
+
+
+def _index(*locs):
+    entries = ''.join(f'<sitemap><loc>{loc}</loc></sitemap>' for loc in locs)
+    return f'<?xml version="1.0" encoding="UTF-8"?><sitemapindex {NS}>{entries}</sitemapindex>'.encode('utf-8')
+
+
+def _product(slug, lastmod=None):
+    lastmod = f'<lastmod>{lastmod}</lastmod>' if lastmod else ''
+    # The image extension nests a <loc> of its own, which is not the page's
+    return (f'<url><loc>https://alinino.az/product/{slug}</loc>{lastmod}'
+            f'<image:image><image:loc>https://cdn.alinino.az/{slug}.jpg</image:loc></image:image></url>')
+
+
+def test_gzipped_sitemap_is_parsed_across_arbitrary_chunk_boundaries():
+    body = gzip.compress(_urlset(_product('ali-ve-nino', '2024-03-01'), '<url><lastmod>2024-03-02</lastmod></url>',
+                                 _product('dune'), '<url><loc>https://alinino.az/collection/yeni</loc></url>'))
+    parser = SitemapParser()
+    entries = []
+    for start in range(0, len(body), 7):
+        entries += parser.feed(body[start:start + 7])
+    entries += parser.close()
+    assert entries == [('url', 'https://alinino.az/product/ali-ve-nino', '2024-03-01'),
+                       ('url', 'https://alinino.az/product/dune', ''),
+                       ('url', 'https://alinino.az/collection/yeni', '')]
+
+
+def test_discovery_follows_nested_indexes_and_retries_failed_sitemaps():
+    served = {'retried': 0}
+
+    async def index(request):
+        base = f"http://{request.host}"
+        return web.Response(body=_index(f'{base}/sitemaps/books.xml.gz', f'{base}/nested.xml',
+                                        f'{base}/sitemaps/missing.xml'), content_type='application/xml')
+
+    async def nested(request):
+        base = f"http://{request.host}"
+        # Lists the top index again, which must not be walked twice
+        return web.Response(body=_index(f'{base}/sitemaps/flaky.xml', f'{base}/sitemap.xml'),
+                            content_type='application/xml')
+
+    async def books(request):
+        body = gzip.compress(_urlset(*[_product(f'book-{i}', '2024-03-01') for i in range(50)]))
+        return web.Response(body=body, content_type='application/gzip')
+
+    async def flaky(request):
+        if served['retried'] < 2:
+            served['retried'] += 1
+            return web.Response(status=503, headers={'Retry-After': '0'})
+        return web.Response(body=_urlset(_product('book-3'), _product('ali-ve-nino')), content_type='application/xml')
+
+    async def run():
+        app = web.Application()
+        app.router.add_get('/sitemap.xml', index)
+        app.router.add_get('/nested.xml', nested)
+        app.router.add_get('/sitemaps/books.xml.gz', books)
+        app.router.add_get('/sitemaps/flaky.xml', flaky)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        try:
+            scraper = AlininoScraper(base_url=f'http://127.0.0.1:{port}', rate_limit=0)
+            scraper.retry = RetryPolicy(max_retries=3, base_delay=0.01)
+            discovery = SitemapDiscovery(scraper)
+            async with scraper.session() as session:
+                products = [entry async for entry in discovery.iter_products(session)]
+            return discovery, products
+        finally:
+            await runner.cleanup()
+
+    discovery, products = asyncio.run(run())
+    assert served['retried'] == 2
+    # The 404 sitemap is logged and skipped; the rest are read once each
+    assert discovery.sitemaps == 4 and discovery.products == 52
+    assert sorted(url for url, _ in products) == sorted(
+        [f'https://alinino.az/product/book-{i}' for i in range(50)] +
+        ['https://alinino.az/product/book-3', 'https://alinino.az/product/ali-ve-nino'])
+    assert dict(products)['https://alinino.az/product/book-0'] == '2024-03-01'
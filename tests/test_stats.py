@@ -0,0 +1,55 @@
+import json
+import os
+
+import numpy as np
+
+from stats import BookStats, DistinctCount
+
+
+def _ids(start, stop):
+    return np.array([f"w{i}" for i in range(start, stop)], dtype=object)
+
+
+def test_distinct_count_is_exact_up_to_its_size_then_estimated():
+    small = DistinctCount(size=1000)
+    small.add(_ids(0, 800))
+    small.add(_ids(400, 900))
+    assert small.exact and small.count() == 900
+
+    large = DistinctCount(size=1000)
+    for start in range(0, 50000, 5000):
+        large.add(_ids(start, start + 6000))
+    assert not large.exact and len(large.hashes) == 1000
+    assert abs(large.count() - 51000) < 51000 * 0.1
+
+
+def test_distinct_counts_merge_like_one_count_over_both_parts():
+    first, second, whole = DistinctCount(size=1000), DistinctCount(size=1000), DistinctCount(size=1000)
+    first.add(_ids(0, 30000))
+    second.add(_ids(20000, 60000))
+    whole.add(_ids(0, 60000))
+    first.merge(second)
+    assert first.count() == whole.count()
+
+
+def test_authors_fall_back_to_editions_past_max_keys():
+    editions = [('w1', 'A'), ('w1', 'A'), ('w2', 'A'), ('w3', 'B')]
+    records = [{'work_id': work, 'author': author, 'labels': 'Yeni', 'categories': 'Roman'}
+               for work, author in editions]
+    per_work = BookStats().add_records(records).result()
+    assert per_work['total_works'] == 3
+    assert per_work['author_top_10'] == {'A': 2, 'B': 1}
+
+    bounded = BookStats(max_keys=2).add_records(records)
+    assert bounded.works is None
+    assert bounded.result()['total_works'] == 3
+    assert bounded.result()['author_top_10'] == {'A': 3, 'B': 1}
+
+
+def test_statistics_of_the_recorded_crawl_match_the_committed_report():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = BookStats.from_file(os.path.join(root, 'alinino_books.csv')).result()
+    with open(os.path.join(root, 'charts', 'statistics.json'), encoding='utf-8') as f:
+        committed = json.load(f)
+    # Compared as JSON so the key order of every table counts, ties included
+    assert json.dumps(result, ensure_ascii=False) == json.dumps(committed, ensure_ascii=False)
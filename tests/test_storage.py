@@ -0,0 +1,62 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from bench import fixtures
+from parsers import FIELD_TYPES, FIELDNAMES
+from records import as_list
+from storage import ParquetRecordWriter, read_records
+
+
+def _write(path, rows, row_group_size=10):
+    with ParquetRecordWriter(str(path), FIELDNAMES, FIELD_TYPES, row_group_size=row_group_size) as writer:
+        for row in rows:
+            writer.write(row)
+    return writer
+
+
+def test_parquet_columns_are_typed_and_lists_come_back_as_lists(tmp_path):
+    products = fixtures.make_products(25)
+    products[0]['pages_numeric'] = ''
+    products[1]['rating_numeric'] = 'not a number'
+    products[2]['labels'] = ''
+    products[3]['labels'] = ['Yeni', 'Ekspress']  # As a list, the way JSONL records carry it
+    writer = _write(tmp_path / 'books.parquet', products)
+
+    source = pq.ParquetFile(tmp_path / 'books.parquet')
+    schema = source.schema_arrow
+    assert writer.count == 25 and source.num_row_groups == 3
+    assert schema.field('current_price_numeric').type == pa.float64()
+    assert schema.field('pages_numeric').type == schema.field('reviews_count').type == pa.int32()
+    assert schema.field('language').type == pa.dictionary(pa.int32(), pa.string())
+    assert schema.field('labels').type == schema.field('categories').type == pa.list_(pa.string())
+    assert schema.field('title').type == pa.string()
+
+    rows = list(read_records(str(tmp_path / 'books.parquet')))
+    assert [row['product_id'] for row in rows] == [row['product_id'] for row in products]
+    assert rows[0]['pages_numeric'] is None and rows[1]['rating_numeric'] is None
+    assert rows[2]['labels'] is None and rows[3]['labels'] == ['Yeni', 'Ekspress']
+    for row, product in zip(rows[4:], products[4:]):
+        assert row['current_price_numeric'] == float(product['current_price_numeric'])
+        assert row['pages_numeric'] == (int(product['pages_numeric']) if product['pages_numeric'] else None)
+        assert row['language'] == (product['language'] or None)
+        assert row['labels'] == (as_list(product['labels']) or None)
+        assert row['categories'] == (as_list(product['categories']) or None)
+
+
+def test_parquet_rewrite_column_changes_only_the_matching_rows(tmp_path):
+    products = fixtures.make_products(25)
+    for product in products:
+        product['collections'] = 'bestsellery'
+    path = tmp_path / 'books.parquet'
+    writer = _write(path, products[:20])
+    updated = {products[2]['product_id']: 'bestsellery, yeni', products[17]['product_id']: 'yeni'}
+    writer.rewrite_column('product_id', 'collections', updated)
+
+    source = pq.ParquetFile(path)
+    assert source.schema_arrow == writer.schema and source.num_row_groups == 2
+    rows = list(read_records(str(path)))
+    assert [row['collections'] for row in rows] == [updated.get(product['product_id'], 'bestsellery')
+                                                    for product in products[:20]]
+    # Only the rewritten column changed
+    before = list(read_records(str(_write(tmp_path / 'before.parquet', products[:20]).filename)))
+    assert [{**row, 'collections': None} for row in rows] == [{**row, 'collections': None} for row in before]
@@ -0,0 +1,33 @@
+from bench import fixtures
+from parsers import LxmlBookParser, parse_book_bytes
+from structured import HTML_ONLY_FIELDS, merge_html, record_from_product
+
+
+def _records(row):
+    url = f"https://alinino.az/product/{row['slug']}"
+    page = parse_book_bytes(fixtures.render_product(row).encode('utf-8'), url, parser=LxmlBookParser())
+    return record_from_product(fixtures.product_json(row), url), page
+
+
+def test_json_records_match_the_page_except_page_only_fields():
+    badge_only = []
+    for row in fixtures.make_products(1389):
+        record, page = _records(row)
+        assert record['reviews_count'] == record['rating'] == record['labels'] == ''
+        if row['discount_percent'] and row['current_price'] == row['old_price']:
+            # A sale badge without a lower price: the JSON has nothing to derive the discount from
+            badge_only.append(row['slug'])
+            assert record['discount_percent'] == record['discount_numeric'] == ''
+            record['discount_percent'], record['discount_numeric'] = page['discount_percent'], page['discount_numeric']
+        for name, value in page.items():
+            if name.removesuffix('_numeric') not in HTML_ONLY_FIELDS:
+                assert record[name] == value, (row['slug'], name)
+    assert len(badge_only) == 8
+
+
+def test_the_page_fills_in_reviews_the_json_does_not_have():
+    row = next(row for row in fixtures.make_products(100) if row['reviews_count'] not in ('', '0'))
+    record, page = _records(row)
+    merged = merge_html(record, page)
+    assert merged['reviews_count'] == row['reviews_count']
+    assert merged['labels'] == page['labels']
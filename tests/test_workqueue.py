@@ -0,0 +1,123 @@
+import asyncio
+import json
+import os
+import time
+
+import pytest
+
+from bench.stub_server import start_stub_server
+from scraper import AlininoScraper
+from workqueue import QueueWorker, SharedRateLimiter, WorkQueue, coordinate, merge_shards
+
+
+def _cards(count):
+    return [{'url': f"https://alinino.az/product/book-{i}", 'product_id': str(i)} for i in range(count)]
+
+
+def test_expired_lease_is_redelivered_to_another_worker(tmp_path):
+    queue = WorkQueue(str(tmp_path / 'crawl.queue'), visibility_timeout=0.2)
+    for card in _cards(4):
+        assert queue.put(card, 'bestsellery')
+    assert not queue.put(_cards(1)[0], 'bestsellery')
+    queue.seal()
+
+    first = [card['url'] for card in queue.lease('a', 2)]
+    second = [card['url'] for card in queue.lease('b', 2)]
+    assert len(first) == len(second) == 2 and not set(first) & set(second)
+    queue.ack(second)
+    # a's leases are still valid, so b gets nothing and the queue is not drained
+    assert queue.lease('b', 10) == []
+    assert not queue.drained()
+
+    time.sleep(0.3)
+    redelivered = [card['url'] for card in queue.lease('b', 10)]
+    assert sorted(redelivered) == sorted(first)
+    # a's late nack no longer holds: the URLs are b's now
+    queue.nack(first[0], 'a')
+    assert queue.counts()['leased'] == 2
+    queue.ack(redelivered)
+    assert queue.drained()
+    assert queue.counts()['done'] == 4
+    queue.close()
+
+
+def test_lease_fails_after_max_attempts(tmp_path):
+    queue = WorkQueue(str(tmp_path / 'crawl.queue'), visibility_timeout=0.05, max_attempts=2)
+    queue.put(_cards(1)[0])
+    queue.seal()
+    for worker in ('a', 'b'):
+        assert len(queue.lease(worker, 1)) == 1
+        time.sleep(0.1)
+    assert queue.lease('c', 1) == []
+    assert queue.counts()['failed'] == 1
+    assert queue.drained()
+    queue.close()
+
+
+def test_two_workers_pick_up_a_crashed_workers_leases(tmp_path):
+    products = 40
+    shards = tmp_path / 'shards'
+    shards.mkdir()
+    # A shard left by an earlier run of a worker: one acked record and a torn line
+    earlier = shards / 'earlier.jsonl'
+    earlier.write_text(json.dumps({'url': 'https://example.com/kept', 'collections': ''}) + '\n{"url": "htt',
+                       encoding='utf-8')
+
+    async def crawl():
+        runner, base_url, _ = await start_stub_server(products=products)
+        try:
+            queue = WorkQueue(str(tmp_path / 'crawl.queue'), visibility_timeout=1.0)
+
+            def scraper():
+                scraper = AlininoScraper(base_url=base_url, rate_limit=0, max_concurrent_limit=4)
+                scraper.rate_limiter = SharedRateLimiter(queue)
+                return scraper
+
+            await coordinate(scraper(), queue, [f"{base_url}/collection/bestsellery"])
+            # A worker that leases a batch and dies without acking any of it
+            crashed = [card['url'] for card in queue.lease('crashed', 5)]
+            workers = [QueueWorker(scraper(), queue, str(shards / f"{name}.jsonl"), name, poll_interval=0.1)
+                       for name in ('earlier', 'other')]
+            await asyncio.gather(*[worker.run() for worker in workers])
+            return queue, crashed, workers
+        finally:
+            await runner.cleanup()
+
+    queue, crashed, workers = asyncio.run(crawl())
+    assert queue.drained()
+    assert queue.counts()['done'] == products
+    assert sum(worker.scraped for worker in workers) == products
+
+    output = tmp_path / 'books.jsonl'
+    assert merge_shards(queue, sorted(str(path) for path in shards.iterdir()), str(output)) == products + 1
+    urls = [json.loads(line)['url'] for line in output.read_text(encoding='utf-8').splitlines()]
+    assert len(urls) == len(set(urls))
+    assert 'https://example.com/kept' in urls
+    assert set(crashed) <= set(urls)
+    queue.close()
+    assert os.path.getsize(earlier) > 0
+
+
+def test_shard_write_error_stops_the_worker(tmp_path):
+    class FullDisk(QueueWorker):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.writer.write = self._fail
+
+        def _fail(self, record):
+            raise OSError(28, 'No space left on device')
+
+    async def crawl():
+        runner, base_url, _ = await start_stub_server(products=40)
+        try:
+            queue = WorkQueue(str(tmp_path / 'crawl.queue'))
+            scraper = AlininoScraper(base_url=base_url, rate_limit=0, max_concurrent_limit=4)
+            scraper.rate_limiter = SharedRateLimiter(queue)
+            await coordinate(scraper, queue, [f"{base_url}/collection/bestsellery"])
+            worker = FullDisk(scraper, queue, str(tmp_path / 'shard.jsonl'), 'full', batch=2)
+            await asyncio.wait_for(worker.run(), timeout=30)
+        finally:
+            await runner.cleanup()
+
+    with pytest.raises(OSError, match='No space left'):
+        asyncio.run(crawl())
@@ -0,0 +1,176 @@
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+# Responses that mean "slow down" rather than "this page is broken"
+THROTTLE_STATUSES = {429, 503}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit: grows while responses are fast and healthy, halves on throttling
+
+    Used as `async with limiter:` around each request. The limit increases by
+    one after a full window of healthy responses (one per slot) and is cut
+    multiplicatively on 429/503, server errors and timeouts, at most once per
+    decrease_cooldown seconds so one burst of errors from a single window
+    only counts once.
+    """
+
+    def __init__(self, initial=5, min_limit=1, max_limit=32, latency_target=2.0, decrease_factor=0.5,
+                 decrease_cooldown=2.0):
+        self.limit = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target  # Seconds; slower responses stop the limit from growing
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = decrease_cooldown  # Seconds after a cut during which errors cut no further
+        self.in_flight = 0
+        self._healthy = 0
+        self._last_decrease = 0.0
+        self._cond = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_response(self, status, latency):
+        """Feed back the outcome of a request"""
+        if status in THROTTLE_STATUSES or status >= 500:
+            self._decrease()
+        elif latency < self.latency_target:
+            self._healthy += 1
+            if self._healthy >= self.limit:
+                self._healthy = 0
+                self.limit = min(self.max_limit, self.limit + 1)
+        else:
+            self._healthy = 0
+
+    def on_error(self):
+        """A request timed out or the connection failed"""
+        self._decrease()
+
+    def _decrease(self):
+        self._healthy = 0
+        now = time.monotonic()
+        if now - self._last_decrease < self.decrease_cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, int(self.limit * self.decrease_factor))
+
+
+class TokenBucket:
+    """Request rate cap: `rate` requests per second with bursts of up to `burst`"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate or 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._resume_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        """Hold all requests for a while, e.g. as told by a Retry-After header"""
+        self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._resume_at:
+                    await asyncio.sleep(self._resume_at - now)
+                    continue
+
+                if self.rate is None:
+                    return
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class ByteRateLimiter:
+    """Bandwidth cap: `rate` bytes per second across all callers, with bursts of up to `burst` bytes
+
+    consume() is called after each chunk is read; a chunk larger than the
+    available budget runs the bucket into debt and the caller sleeps it off,
+    so the long-run rate holds whatever the chunk size.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or rate
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def consume(self, amount):
+        async with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            if self._tokens < 0:
+                await asyncio.sleep(-self._tokens / self.rate)
+                # The debt is paid off; nothing accrues for the time spent sleeping it off
+                self._tokens = 0.0
+                self._updated = time.monotonic()
+
+
+class HostRateLimiter:
+    """One token bucket per host; a rate of None only enforces Retry-After pauses"""
+
+    def __init__(self, rate=None, burst=None):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+
+    def bucket(self, url):
+        host = urlsplit(url).netloc
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(self.rate, self.burst)
+        return self._buckets[host]
+
+    async def acquire(self, url):
+        await self.bucket(url).acquire()
+
+    def pause(self, url, seconds):
+        self.bucket(url).pause(seconds)
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, never shorter than the server's Retry-After"""
+
+    def __init__(self, max_retries=4, base_delay=0.5, max_delay=30.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, retry_after=None):
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(backoff, retry_after) if retry_after else backoff
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date), or None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,138 @@
+"""The crawl's HTTP client: one tuned connection pool shared by every request
+
+A scraper opens one client session (see AlininoScraper.session) over a
+connector built here: connections are kept alive between requests, the
+per-host connection cap matches the scraper's concurrency ceiling so the
+pool never opens sockets the limiter would leave idle, and DNS answers are
+cached for minutes instead of aiohttp's 10 seconds. Responses are requested
+compressed; brotli only when a decoder (brotli or brotlicffi) is installed.
+
+backend='httpx' swaps aiohttp for an httpx client, which speaks HTTP/2 to
+servers that offer it over TLS and multiplexes every request to a host on one
+connection. It needs httpx[http2]; HttpxSession adapts it to the small part
+of the aiohttp session interface the crawler uses.
+"""
+import asyncio
+import contextlib
+import importlib.util
+import time
+
+import aiohttp
+
+BACKENDS = ('aiohttp', 'httpx')
+DNS_TTL = 300  # Seconds a resolved host address is reused
+KEEPALIVE = 30.0  # Seconds an idle connection stays open; 0 closes every connection after its response
+
+
+def accept_encoding(compress=True):
+    """The Accept-Encoding header: gzip and deflate, br when a decoder is installed, or identity"""
+    if not compress:
+        return 'identity'
+    encodings = ['gzip', 'deflate']
+    if importlib.util.find_spec('brotli') or importlib.util.find_spec('brotlicffi'):
+        encodings.append('br')
+    return ', '.join(encodings)
+
+
+def tcp_connector(limit_per_host, dns_ttl=DNS_TTL, keepalive=KEEPALIVE):
+    """An aiohttp connector with keep-alive, a per-host connection cap and a DNS cache"""
+    # No pool-wide cap: the concurrency limiter already bounds requests across hosts
+    if not keepalive:
+        return aiohttp.TCPConnector(limit=0, limit_per_host=limit_per_host, ttl_dns_cache=dns_ttl, force_close=True)
+    return aiohttp.TCPConnector(limit=0, limit_per_host=limit_per_host, ttl_dns_cache=dns_ttl,
+                                keepalive_timeout=keepalive)
+
+
+@contextlib.contextmanager
+def _aiohttp_errors(httpx):
+    """Raise httpx errors as their aiohttp counterparts, which the retry loops catch"""
+    try:
+        yield
+    except httpx.TimeoutException as e:
+        raise asyncio.TimeoutError(str(e)) from e
+    except httpx.HTTPError as e:
+        raise aiohttp.ClientConnectionError(str(e) or type(e).__name__) from e
+
+
+class _Content:
+    def __init__(self, response, httpx):
+        self._response = response
+        self._httpx = httpx
+
+    async def iter_chunked(self, size):
+        with _aiohttp_errors(self._httpx):
+            async for chunk in self._response.aiter_bytes(size):
+                yield chunk
+
+
+class _HttpxResponse:
+    """An httpx response seen through the aiohttp response attributes the crawler reads"""
+
+    def __init__(self, response, httpx):
+        self._response = response
+        self._httpx = httpx
+        self.status = response.status_code
+        self.headers = response.headers
+        self.charset = response.charset_encoding
+        self.content = _Content(response, httpx)
+
+    async def read(self):
+        with _aiohttp_errors(self._httpx):
+            return await self._response.aread()
+
+
+class HttpxSession:
+    """An httpx.AsyncClient (HTTP/2 when the server offers it) behind aiohttp's session.get()
+
+    httpx errors are raised as their aiohttp counterparts (timeouts as
+    asyncio.TimeoutError, the rest as aiohttp.ClientError), so retries and
+    the limiter treat both backends alike. Connections opened and the time to
+    response headers are reported to the metrics like aiohttp's tracing does.
+    """
+
+    def __init__(self, timeout, limit_per_host, keepalive=KEEPALIVE, metrics=None, http2=True):
+        import httpx
+
+        self._httpx = httpx
+        self.metrics = metrics
+        # The scraper talks to one host, so the pool cap is the per-host cap aiohttp's connector has.
+        # HTTP/2 multiplexes a host's requests on one connection; the cap only matters over HTTP/1.1
+        limits = httpx.Limits(max_connections=limit_per_host,
+                              max_keepalive_connections=limit_per_host if keepalive else 0,
+                              keepalive_expiry=keepalive or None)
+        self._client = httpx.AsyncClient(http2=http2, limits=limits, timeout=self._timeout(timeout))
+
+    def _timeout(self, timeout):
+        # httpx has no overall deadline; the total applies to each phase instead
+        return self._httpx.Timeout(timeout.total, connect=timeout.sock_connect or timeout.total,
+                                   read=timeout.sock_read or timeout.total)
+
+    def _trace(self, timing):
+        async def trace(event, info):
+            if event == 'connection.connect_tcp.complete' and self.metrics:
+                self.metrics.inc('connections_opened_total')
+            elif event.endswith('.receive_response_headers.complete'):
+                timing['headers'] = time.perf_counter()
+                if self.metrics and 'start' in timing:
+                    self.metrics.observe('request_phase_seconds', timing['headers'] - timing['start'], phase='ttfb')
+        return trace
+
+    @contextlib.asynccontextmanager
+    async def get(self, url, headers=None, timeout=None, trace_request_ctx=None):
+        httpx = self._httpx
+        timing = trace_request_ctx if trace_request_ctx is not None else {}
+        timing['start'] = time.perf_counter()
+        with _aiohttp_errors(httpx):
+            async with self._client.stream('GET', url, headers=headers,
+                                           timeout=self._timeout(timeout) if timeout else httpx.USE_CLIENT_DEFAULT,
+                                           extensions={'trace': self._trace(timing)}) as response:
+                yield _HttpxResponse(response, httpx)
+
+    async def close(self):
+        await self._client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
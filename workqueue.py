@@ -0,0 +1,674 @@
+"""Distributed crawl: a coordinator fills a shared work queue, worker processes drain it
+
+The frontier lives in a queue with lease/ack semantics instead of in one
+process's memory. A worker leases a batch of product URLs, scrapes them and
+acks each one once its record is fsynced to the worker's own shard. A lease
+that is not acked within the visibility timeout (the worker crashed or hung)
+returns the URL to the queue for another worker, up to max_attempts times.
+All processes take their requests from one rate budget kept in the queue,
+so --rate-limit caps the whole crawl, not each worker. At the end the
+shards are merged into one output, each product once.
+
+Backends: a SQLite file for processes on one host, or Redis (redis://...,
+needs the redis package) for workers on several hosts. Both block (on the
+SQLite write lock, on the network), so async code calls them through
+queue.call(), which runs them on the queue's own thread.
+
+    python workqueue.py coordinator crawl.queue --discover sitemap
+    python workqueue.py worker crawl.queue --shards shards       # as many as wanted, anywhere
+    python workqueue.py merge crawl.queue --shards shards --output alinino_books.csv
+    python workqueue.py run crawl.queue --workers 4 --output alinino_books.csv   # all of the above, locally
+"""
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import glob
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+import uuid
+
+from parsers import FIELD_TYPES, FIELDNAMES, canonical_url
+from storage import ParquetRecordWriter, RecordWriter, record_format
+
+VISIBILITY_TIMEOUT = 300.0  # Seconds a leased URL stays invisible to other workers
+MAX_ATTEMPTS = 3
+
+
+def default_worker_id():
+    """A worker id (and shard name) unique across restarts: a restarted container keeps its hostname and PID"""
+    return f"{socket.gethostname()}-{uuid.uuid4().hex[:12]}"
+
+
+class _QueueThread:
+    """Runs a queue's blocking calls on one thread of its own, off the event loop
+
+    One thread, so calls run in the order they were made and a SQLite
+    connection is never used by two threads at once.
+    """
+
+    _executor = None
+
+    def submit(self, method, *args):
+        """Start a call on the queue's thread without waiting for it; returns its future"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='workqueue')
+        return self._executor.submit(method, *args)
+
+    async def call(self, method, *args):
+        """Await a call on the queue's thread, e.g. `await queue.call(queue.lease, worker, 10)`"""
+        return await asyncio.wrap_future(self.submit(method, *args))
+
+    def _shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+def _add_collection(collections, collection):
+    """A collections column with one more collection, if it is not listed yet"""
+    if not collection or collection in collections.split(', '):
+        return collections
+    return f"{collections}, {collection}" if collections else collection
+
+
+class WorkQueue(_QueueThread):
+    """Crawl frontier in a SQLite file, shared by processes on one host
+
+    Every product URL is one task: pending, leased (by a worker, until its
+    lease expires), done or failed. Also holds the shared per-host rate
+    budget and whether discovery has finished (the queue is sealed).
+    """
+
+    def __init__(self, filename, visibility_timeout=VISIBILITY_TIMEOUT, max_attempts=MAX_ATTEMPTS):
+        self.filename = filename
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        # Autocommit; write transactions are opened with BEGIN IMMEDIATE so concurrent workers queue up
+        # for the write lock instead of failing to upgrade a read lock. Used from the queue's thread too.
+        self._db = sqlite3.connect(filename, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS tasks (
+                url TEXT PRIMARY KEY,
+                card TEXT NOT NULL,
+                collections TEXT NOT NULL DEFAULT '',
+                state TEXT NOT NULL DEFAULT 'pending',
+                worker TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, lease_until);
+            CREATE TABLE IF NOT EXISTS budget (
+                host TEXT PRIMARY KEY,
+                tokens REAL,
+                updated REAL,
+                resume_at REAL NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        ''')
+
+    def _write(self):
+        """A write transaction: `with self._write() as db:`"""
+        return _Transaction(self._db)
+
+    def put(self, card, collection=None):
+        """Add a product card unless its URL is queued already; returns whether it was new"""
+        with self._write() as db:
+            row = db.execute('SELECT collections FROM tasks WHERE url = ?', (card['url'],)).fetchone()
+            if row is None:
+                db.execute('INSERT INTO tasks (url, card, collections) VALUES (?, ?, ?)',
+                           (card['url'], json.dumps(card, ensure_ascii=False), collection or ''))
+                return True
+            collections = _add_collection(row[0], collection)
+            if collections != row[0]:
+                db.execute('UPDATE tasks SET collections = ? WHERE url = ?', (collections, card['url']))
+            return False
+
+    def lease(self, worker, count):
+        """Lease up to count pending cards to a worker, first returning expired leases to the queue"""
+        now = time.time()
+        with self._write() as db:
+            db.execute("UPDATE tasks SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                       "worker = NULL WHERE state = 'leased' AND lease_until < ?", (self.max_attempts, now))
+            rows = db.execute("SELECT url, card, collections FROM tasks WHERE state = 'pending' "
+                              "ORDER BY rowid LIMIT ?", (count,)).fetchall()
+            db.executemany("UPDATE tasks SET state = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1 "
+                           "WHERE url = ?", [(worker, now + self.visibility_timeout, url) for url, _, _ in rows])
+        return [{**json.loads(card), 'collections': collections} for _, card, collections in rows]
+
+    def ack(self, urls):
+        """Mark URLs done: their records are durably written"""
+        with self._write() as db:
+            db.executemany("UPDATE tasks SET state = 'done', worker = NULL WHERE url = ?", [(url,) for url in urls])
+
+    def nack(self, url, worker):
+        """Give a URL back after a failed scrape, or mark it failed after max_attempts"""
+        with self._write() as db:
+            db.execute("UPDATE tasks SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                       "worker = NULL WHERE url = ? AND worker = ? AND state = 'leased'",
+                       (self.max_attempts, url, worker))
+
+    def seal(self, sealed=True):
+        """Mark discovery as finished (or, for a new discovery run, as ongoing)"""
+        with self._write() as db:
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('sealed', ?)", ('1' if sealed else '0',))
+
+    def counts(self):
+        counts = dict.fromkeys(['pending', 'leased', 'done', 'failed'], 0)
+        counts.update(self._db.execute('SELECT state, COUNT(*) FROM tasks GROUP BY state'))
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'sealed'").fetchone()
+        counts['sealed'] = bool(row and row[0] == '1')
+        return counts
+
+    def drained(self):
+        """Discovery has finished and every URL is done or failed"""
+        counts = self.counts()
+        return counts['sealed'] and not counts['pending'] and not counts['leased']
+
+    def collections(self):
+        """url -> collections column, for every queued product"""
+        return dict(self._db.execute("SELECT url, collections FROM tasks"))
+
+    def take_token(self, host, rate, burst):
+        """Take a request token for a host from the shared bucket; returns 0, or the seconds to wait first"""
+        now = time.time()
+        if rate is None:
+            row = self._db.execute('SELECT resume_at FROM budget WHERE host = ?', (host,)).fetchone()
+            return max(0.0, row[0] - now) if row else 0.0
+        with self._write() as db:
+            row = db.execute('SELECT tokens, updated, resume_at FROM budget WHERE host = ?', (host,)).fetchone()
+            tokens, updated, resume_at = row or (None, None, 0.0)
+            if now < resume_at:
+                return resume_at - now
+            if tokens is None:
+                tokens, updated = burst, now
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            db.execute('INSERT OR REPLACE INTO budget VALUES (?, ?, ?, ?)',
+                       (host, tokens - 1 if not wait else tokens, now, resume_at))
+        return wait
+
+    def pause_host(self, host, seconds):
+        """Hold every worker's requests to a host, e.g. as told by a Retry-After header"""
+        with self._write() as db:
+            db.execute('INSERT OR IGNORE INTO budget (host, tokens, updated) VALUES (?, NULL, NULL)', (host,))
+            db.execute('UPDATE budget SET resume_at = MAX(resume_at, ?) WHERE host = ?', (time.time() + seconds, host))
+
+    def close(self):
+        self._shutdown()
+        self._db.close()
+
+
+class _Transaction:
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute('BEGIN IMMEDIATE')
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute('ROLLBACK' if exc_type else 'COMMIT')
+
+
+# Each script runs atomically on the Redis server. Time comes from the server, so worker clocks may disagree.
+_NOW = '''
+if redis.replicate_commands then redis.replicate_commands() end
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+'''
+_PUT = '''
+local new = redis.call('HSETNX', KEYS[1], ARGV[1], ARGV[2])
+if new == 1 then redis.call('RPUSH', KEYS[2], ARGV[1]) end
+if ARGV[3] ~= '' then
+    local collections = redis.call('HGET', KEYS[3], ARGV[1])
+    if not collections or collections == '' then
+        redis.call('HSET', KEYS[3], ARGV[1], ARGV[3])
+    elseif not string.find(', ' .. collections .. ', ', ', ' .. ARGV[3] .. ', ', 1, true) then
+        redis.call('HSET', KEYS[3], ARGV[1], collections .. ', ' .. ARGV[3])
+    end
+end
+return new
+'''
+# KEYS: pending, leases, owners, attempts, cards, collections, done, failed
+_LEASE = _NOW + '''
+for _, url in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now)) do
+    redis.call('ZREM', KEYS[2], url)
+    redis.call('HDEL', KEYS[3], url)
+    if tonumber(redis.call('HGET', KEYS[4], url) or '0') >= tonumber(ARGV[4]) then
+        redis.call('SADD', KEYS[8], url)
+    else
+        redis.call('LPUSH', KEYS[1], url)
+    end
+end
+local leased = {}
+while #leased < tonumber(ARGV[2]) * 2 do
+    local url = redis.call('LPOP', KEYS[1])
+    if not url then break end
+    -- Acked by a worker whose lease had already expired and been handed out again
+    if redis.call('SISMEMBER', KEYS[7], url) == 0 then
+        redis.call('ZADD', KEYS[2], now + tonumber(ARGV[3]), url)
+        redis.call('HSET', KEYS[3], url, ARGV[1])
+        redis.call('HINCRBY', KEYS[4], url, 1)
+        table.insert(leased, redis.call('HGET', KEYS[5], url))
+        table.insert(leased, redis.call('HGET', KEYS[6], url) or '')
+    end
+end
+return leased
+'''
+# KEYS: pending, leases, owners, attempts, failed
+_NACK = '''
+if redis.call('HGET', KEYS[3], ARGV[1]) ~= ARGV[2] then return 0 end
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('HDEL', KEYS[3], ARGV[1])
+if tonumber(redis.call('HGET', KEYS[4], ARGV[1]) or '0') >= tonumber(ARGV[3]) then
+    redis.call('SADD', KEYS[5], ARGV[1])
+else
+    redis.call('RPUSH', KEYS[1], ARGV[1])
+end
+return 1
+'''
+# Numbers are returned as strings: Redis would truncate a Lua number to an integer
+_TAKE_TOKEN = _NOW + '''
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated', 'resume_at')
+local resume_at = tonumber(state[3]) or 0
+if now < resume_at then return tostring(resume_at - now) end
+if ARGV[1] == '' then return '0' end
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local tokens = math.min(burst, (tonumber(state[1]) or burst) + (now - (tonumber(state[2]) or now)) * rate)
+if tokens >= 1 then
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - 1), 'updated', tostring(now))
+    return '0'
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+return tostring((1 - tokens) / rate)
+'''
+_PAUSE = _NOW + '''
+local resume_at = math.max(tonumber(redis.call('HGET', KEYS[1], 'resume_at') or '0'), now + tonumber(ARGV[1]))
+redis.call('HSET', KEYS[1], 'resume_at', tostring(resume_at))
+'''
+
+
+class RedisWorkQueue(_QueueThread):
+    """The WorkQueue interface on a Redis server, for workers on several hosts
+
+    Keys are prefixed with `prefix`. Lease, nack and the rate budget run as
+    Lua scripts, so each is atomic across all workers.
+    """
+
+    def __init__(self, url, prefix='alinino', visibility_timeout=VISIBILITY_TIMEOUT, max_attempts=MAX_ATTEMPTS):
+        import redis
+
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        names = ['cards', 'collections', 'pending', 'leases', 'owners', 'attempts', 'done', 'failed', 'sealed']
+        self._keys = {name: f"{prefix}:{name}" for name in names}
+        self._budget = f"{prefix}:budget:"
+        self._put = self._redis.register_script(_PUT)
+        self._lease = self._redis.register_script(_LEASE)
+        self._nack = self._redis.register_script(_NACK)
+        self._take_token = self._redis.register_script(_TAKE_TOKEN)
+        self._pause = self._redis.register_script(_PAUSE)
+
+    def _key_list(self, *names):
+        return [self._keys[name] for name in names]
+
+    def put(self, card, collection=None):
+        keys = self._key_list('cards', 'pending', 'collections')
+        return bool(self._put(keys, [card['url'], json.dumps(card, ensure_ascii=False), collection or '']))
+
+    def lease(self, worker, count):
+        keys = self._key_list('pending', 'leases', 'owners', 'attempts', 'cards', 'collections', 'done', 'failed')
+        leased = self._lease(keys, [worker, count, self.visibility_timeout, self.max_attempts])
+        return [{**json.loads(card), 'collections': collections} for card, collections in zip(leased[::2], leased[1::2])]
+
+    def ack(self, urls):
+        pipe = self._redis.pipeline()
+        for url in urls:
+            pipe.zrem(self._keys['leases'], url)
+            pipe.hdel(self._keys['owners'], url)
+            pipe.sadd(self._keys['done'], url)
+        pipe.execute()
+
+    def nack(self, url, worker):
+        self._nack(self._key_list('pending', 'leases', 'owners', 'attempts', 'failed'), [url, worker, self.max_attempts])
+
+    def seal(self, sealed=True):
+        self._redis.set(self._keys['sealed'], '1' if sealed else '0')
+
+    def counts(self):
+        pipe = self._redis.pipeline()
+        pipe.llen(self._keys['pending'])
+        pipe.zcard(self._keys['leases'])
+        pipe.scard(self._keys['done'])
+        pipe.scard(self._keys['failed'])
+        pipe.get(self._keys['sealed'])
+        pending, leased, done, failed, sealed = pipe.execute()
+        return {'pending': pending, 'leased': leased, 'done': done, 'failed': failed, 'sealed': sealed == '1'}
+
+    def drained(self):
+        counts = self.counts()
+        return counts['sealed'] and not counts['pending'] and not counts['leased']
+
+    def collections(self):
+        collections = dict.fromkeys(self._redis.hkeys(self._keys['cards']), '')
+        collections.update(self._redis.hscan_iter(self._keys['collections']))
+        return collections
+
+    def take_token(self, host, rate, burst):
+        return float(self._take_token([self._budget + host], ['' if rate is None else rate, burst]))
+
+    def pause_host(self, host, seconds):
+        self._pause([self._budget + host], [seconds])
+
+    def close(self):
+        self._shutdown()
+        self._redis.close()
+
+
+def open_queue(location, **options):
+    """A RedisWorkQueue for redis:// URLs, otherwise a WorkQueue in that SQLite file"""
+    if location.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisWorkQueue(location, **options)
+    return WorkQueue(location, **options)
+
+
+class SharedRateLimiter:
+    """The HostRateLimiter interface over a work queue's rate budget, shared by every worker"""
+
+    def __init__(self, queue, rate=None, burst=None):
+        self.queue = queue
+        self.rate = rate
+        self.burst = burst or max(1.0, rate or 1.0)
+        self._lock = asyncio.Lock()  # One request at a time from this process asks the queue
+
+    async def acquire(self, url):
+        host = urlsplit(url).netloc
+        async with self._lock:
+            while True:
+                wait = await self.queue.call(self.queue.take_token, host, self.rate, self.burst)
+                if wait <= 0:
+                    return
+                await asyncio.sleep(wait)
+
+    def pause(self, url, seconds):
+        # Not awaited: queued on the queue's thread ahead of every later token request
+        self.queue.submit(self.queue.pause_host, urlsplit(url).netloc, seconds)
+
+
+class QueueFrontier:
+    """The crawl frontier interface (enqueue) over a work queue, for the coordinator's discovery"""
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    async def enqueue(self, card, collection=None):
+        return await self.queue.call(self.queue.put, {**card, 'url': canonical_url(card['url'])}, collection)
+
+
+async def coordinate(scraper, queue, collection_urls=None, max_pages=None, sitemap=None):
+    """Discover every product into the queue, then seal it; returns the number of new products"""
+    await queue.call(queue.seal, False)
+    async with scraper.session() as session:
+        added = await scraper.discover_products(session, QueueFrontier(queue), collection_urls, max_pages, sitemap)
+    await queue.call(queue.seal)
+    scraper.log.info('frontier_complete', f"Queued {added} new products", links=added)
+    return added
+
+
+def _whole_lines_size(path):
+    """Bytes up to the end of the last complete line: a crash may leave a torn record, never acked, behind it"""
+    with open(path, 'rb') as f:
+        size = f.seek(0, os.SEEK_END)
+        while size:
+            f.seek(max(0, size - 65536))
+            block = f.read(size - f.tell())
+            end = block.rfind(b'\n')
+            if end >= 0:
+                return size - len(block) + end + 1
+            size -= len(block)
+    return 0
+
+
+class QueueWorker:
+    """Lease cards from a work queue and scrape them into a JSONL shard until the queue is drained
+
+    A URL is acked only after the shard has been fsynced with its record, so
+    a crashed worker loses nothing: its unacked leases expire and are
+    scraped again elsewhere. An existing shard is appended to, never
+    truncated, since the URLs it holds may already be acked.
+    """
+
+    def __init__(self, scraper, queue, shard, worker_id=None, batch=None, fsync_every=20, poll_interval=1.0):
+        self.scraper = scraper
+        self.queue = queue
+        self.worker_id = worker_id or default_worker_id()
+        self.batch = batch or scraper.num_workers  # Cards leased at a time
+        self.poll_interval = poll_interval  # Seconds between polls while other workers hold the last leases
+        resume_offset = _whole_lines_size(shard) if os.path.exists(shard) else None
+        self.writer = RecordWriter(shard, FIELDNAMES, fmt='jsonl', fsync_every=fsync_every,
+                                   resume_offset=resume_offset, on_sync=self._synced)
+        self.scraped = 0
+        self.failed = 0
+        self._unacked = []  # Written, not fsynced yet
+        self._durable = []  # Fsynced, not acked yet
+
+    def _synced(self, offset):
+        # Called from inside writer.write(); the acks are sent by _ack, off the event loop
+        self._durable += self._unacked
+        self._unacked = []
+
+    async def _ack(self):
+        if self._durable:
+            urls, self._durable = self._durable, []
+            await self.queue.call(self.queue.ack, urls)
+
+    async def run(self):
+        from scraper import run_until_failure
+
+        scraper = self.scraper
+        local = asyncio.Queue(maxsize=self.batch)
+        async with scraper.session() as session:
+            tasks = [asyncio.create_task(self._scrape(session, local)) for _ in range(scraper.num_workers)]
+            feed = asyncio.create_task(self._feed(local, len(tasks)))
+            # A scrape task that fails (e.g. the shard cannot be written) stops the worker instead of leaving
+            # the lease loop blocked on a full local queue; its unacked leases go to other workers
+            try:
+                await run_until_failure([feed, *tasks])
+            finally:
+                self.writer.close()
+                await self._ack()
+        scraper.log.info('worker_complete', f"Worker {self.worker_id} done: {self.scraped} scraped, "
+                                            f"{self.failed} failed", scraped=self.scraped, failed=self.failed)
+
+    async def _feed(self, local, tasks):
+        """Lease cards into the local queue until the work queue is drained, then stop the scrape tasks"""
+        queue = self.queue
+        while True:
+            await self._ack()
+            cards = await queue.call(queue.lease, self.worker_id, self.batch)
+            if not cards:
+                self.writer.sync()  # Acks what is written, so the queue can drain
+                await self._ack()
+                if await queue.call(queue.drained):
+                    break
+                await asyncio.sleep(self.poll_interval)
+                continue
+            for card in cards:
+                await local.put(card)
+        for _ in range(tasks):
+            await local.put(None)
+
+    async def _scrape(self, session, local):
+        scraper = self.scraper
+        while True:
+            card = await local.get()
+            if card is None:
+                return
+            result = await scraper.extract_book_data(session, card['url'])
+            if result is None:
+                self.failed += 1
+                scraper.metrics.inc('books_total', result='failed')
+                await self.queue.call(self.queue.nack, card['url'], self.worker_id)
+                continue
+
+            result['product_id'] = card.get('product_id') or result.get('product_id', '')
+            result['collections'] = card['collections']
+            self.writer.write(result)
+            self._unacked.append(card['url'])
+            self.scraped += 1
+            scraper.metrics.inc('books_total', result='scraped')
+            if self.scraped % scraper.progress_every == 0:
+                scraper.log.info('progress', f"Total scraped: {self.scraped}", scraped=self.scraped)
+
+
+def merge_shards(queue, shards, output, fmt=None):
+    """Write the records of every shard to one output, each product once, with its final collections
+
+    A product found in another collection after a worker scraped it gets the
+    full list from the queue. Products scraped twice (a lease expired while
+    the first worker was still on it) are written once, and a torn last line
+    left by a crashed worker is skipped. Returns the number of records.
+    """
+    collections = queue.collections()
+    if record_format(output, fmt) == 'parquet':
+        writer = ParquetRecordWriter(output, FIELDNAMES, FIELD_TYPES)
+    else:
+        writer = RecordWriter(output, FIELDNAMES, fmt=fmt, fsync_every=1000)
+    seen = set()
+    with writer:
+        for shard in shards:
+            with open(shard, encoding='utf-8') as f:
+                for line in f:
+                    if not line.endswith('\n'):
+                        break
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record['url'] in seen:
+                        continue
+                    seen.add(record['url'])
+                    record['collections'] = collections.get(record['url'], record['collections'])
+                    writer.write(record)
+    return writer.count
+
+
+def _scraper(args, queue):
+    from scraper import AlininoScraper
+
+    scraper = AlininoScraper(max_concurrent=args.concurrency, max_concurrent_limit=args.max_concurrency,
+                             max_retries=args.max_retries, base_url=args.base_url)
+    scraper.rate_limiter = SharedRateLimiter(queue, args.rate_limit or None)
+    return scraper
+
+
+def _shards(directory):
+    return sorted(glob.glob(os.path.join(directory, '*.jsonl')))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Distributed crawl through a shared work queue')
+    commands = parser.add_subparsers(dest='command', required=True)
+    crawling = argparse.ArgumentParser(add_help=False)
+    crawling.add_argument('--base-url', default='https://alinino.az')
+    crawling.add_argument('--rate-limit', type=float, default=10.0,
+                          help='Max requests per second per host, across all workers (0 for no cap)')
+    crawling.add_argument('--concurrency', type=int, default=5, help='Initial concurrent requests per process')
+    crawling.add_argument('--max-concurrency', type=int, default=32, help='Concurrency ceiling per process')
+    crawling.add_argument('--max-retries', type=int, default=4, help='Retries for throttled or failed requests')
+    leasing = argparse.ArgumentParser(add_help=False)
+    leasing.add_argument('--visibility-timeout', type=float, default=VISIBILITY_TIMEOUT,
+                         help='Seconds before an unacked lease is handed to another worker')
+    leasing.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS, help='Leases per URL before it fails')
+    discovery = argparse.ArgumentParser(add_help=False)
+    discovery.add_argument('--collection', action='append', dest='collections', help='Collection URL; repeatable')
+    discovery.add_argument('--discover-collections', action='store_true',
+                           help='Every collection linked from the site navigation')
+    discovery.add_argument('--discover', choices=['listing', 'sitemap'], default='listing')
+    discovery.add_argument('--sitemap', help='Sitemap URL for --discover sitemap (default: /sitemap.xml)')
+    discovery.add_argument('--max-pages', type=int, help='Stop after this many collection pages')
+    sharding = argparse.ArgumentParser(add_help=False)
+    sharding.add_argument('--shards', default='shards', help='Directory of worker output shards')
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument('--output', default='alinino_books.csv', help='Merged output (.csv, .jsonl or .parquet)')
+    output.add_argument('--format', choices=['csv', 'jsonl', 'parquet'], help='Output format (default: from extension)')
+
+    for name, parents, help_text in [
+        ('coordinator', [crawling, leasing, discovery], 'Discover products into the queue'),
+        ('worker', [crawling, leasing, sharding], 'Scrape products from the queue into a shard'),
+        ('merge', [leasing, sharding, output], 'Merge the shards into one output'),
+        ('status', [leasing], 'Show how many URLs are pending, leased, done and failed'),
+        ('run', [crawling, leasing, discovery, sharding, output], 'Coordinator, workers and merge as local processes'),
+    ]:
+        command = commands.add_parser(name, parents=parents, help=help_text)
+        command.add_argument('queue', help='SQLite queue file, or redis://host:port/db')
+        if name == 'run':
+            command.add_argument('--workers', type=int, default=4, help='Worker processes')
+    args = parser.parse_args()
+
+    queue = open_queue(args.queue, visibility_timeout=args.visibility_timeout, max_attempts=args.max_attempts)
+    try:
+        if args.command == 'coordinator':
+            from parsers import collection_name
+            from scraper import DEFAULT_COLLECTION
+            from sitemap import SitemapDiscovery
+
+            scraper = _scraper(args, queue)
+            default = f"{args.base_url}/collection/{collection_name(DEFAULT_COLLECTION)}"
+            collections = None if args.discover_collections else (args.collections or [default])
+            sitemap = SitemapDiscovery(scraper, args.sitemap) if args.discover == 'sitemap' else None
+            asyncio.run(coordinate(scraper, queue, collections, args.max_pages, sitemap))
+        elif args.command == 'worker':
+            os.makedirs(args.shards, exist_ok=True)
+            scraper = _scraper(args, queue)
+            worker_id = default_worker_id()
+            worker = QueueWorker(scraper, queue, os.path.join(args.shards, f"{worker_id}.jsonl"), worker_id)
+            asyncio.run(worker.run())
+        elif args.command == 'merge':
+            count = merge_shards(queue, _shards(args.shards), args.output, args.format)
+            print(f"Merged {count} books from {len(_shards(args.shards))} shards into {args.output}")
+        elif args.command == 'status':
+            print(json.dumps(queue.counts()))
+        else:
+            _run_local(args, queue)
+    finally:
+        queue.close()
+
+
+def _run_local(args, queue):
+    """The coordinator and the workers as child processes on this host, then the merge"""
+    shared = [args.queue, '--base-url', args.base_url, '--rate-limit', str(args.rate_limit),
+              '--concurrency', str(args.concurrency), '--max-concurrency', str(args.max_concurrency),
+              '--max-retries', str(args.max_retries), '--visibility-timeout', str(args.visibility_timeout),
+              '--max-attempts', str(args.max_attempts)]
+    discovery = ['--discover', args.discover]
+    discovery += [option for url in args.collections or () for option in ('--collection', url)]
+    discovery += ['--discover-collections'] if args.discover_collections else []
+    discovery += ['--sitemap', args.sitemap] if args.sitemap else []
+    discovery += ['--max-pages', str(args.max_pages)] if args.max_pages else []
+    script = os.path.abspath(__file__)
+
+    started = time.perf_counter()
+    queue.seal(False)  # So no worker finds the queue drained before the coordinator has started
+    processes = [subprocess.Popen([sys.executable, script, 'coordinator'] + shared + discovery)]
+    processes += [subprocess.Popen([sys.executable, script, 'worker'] + shared + ['--shards', args.shards])
+                  for _ in range(args.workers)]
+    failed = [p.args[2] for p in processes if p.wait() != 0]
+    if failed:
+        raise SystemExit(f"{len(failed)} processes failed ({', '.join(failed)}); the queue keeps their progress")
+    count = merge_shards(queue, _shards(args.shards), args.output, args.format)
+    print(f"Merged {count} books from {args.workers} workers into {args.output} "
+          f"in {time.perf_counter() - started:.1f}s ({json.dumps(queue.counts())})")
+
+
+if __name__ == "__main__":
+    main()